@@ -1,15 +1,17 @@
 import os
 import re
-import io
-from pathlib import Path
+import uuid
+import hashlib
+import functools
 from datetime import datetime
 
-import matplotlib.pyplot as plt
 import pandas as pd
 import streamlit as st
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import Image as RLImage, SimpleDocTemplate, Spacer, Table, TableStyle
+
+# Nur was jede Seite braucht; alles Weitere wird in der jeweiligen Seite importiert
+from utils import telemetrie
+from utils.historie import HistorienIndex
+from utils.stammdaten import lade_kuerzel, lade_mapping, store
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Layout & App-Setup
@@ -17,157 +19,273 @@ from reportlab.platypus import Image as RLImage, SimpleDocTemplate, Spacer, Tabl
 st.set_page_config(page_title="Zeitdatenanalyse Dashboard", page_icon="🧠", layout="wide")
 APP_VERSION = "v0.1.6"
 
-os.makedirs("history/exports", exist_ok=True)
-os.makedirs("history/uploads", exist_ok=True)
-os.makedirs("history/rechnung", exist_ok=True)
-
 # ──────────────────────────────────────────────────────────────────────────────
 # Helper-Funktionen
 # ──────────────────────────────────────────────────────────────────────────────
-@st.cache_data
 def load_excel(file):
-    return pd.read_excel(file)
-
-def extrahiere_zweck(text: str):
-    if isinstance(text, str) and "-" in text:
-        zweck_raw = text.split("-")[-1].strip()
-        return re.sub(r"^\d+_?", "", zweck_raw)
-    return None
-# --- CSV robust lesen: erkennt Spaltennamen & Zahlformate ---
-import io
-import re
-def lade_rechnung():
-    path = os.path.join("history/rechnung", "Rechnung.xlsx")
-    if os.path.exists(path):
-        # Excel ohne Header einlesen
-        df = pd.read_excel(path, engine="openpyxl", header=None)
-
-        # Erste zwei Spalten nehmen (A = Kürzel, B = Umsatz)
-        if df.shape[1] >= 2:
-            out = df.iloc[:, :2].copy()
-            out.columns = ["Kürzel", "Umsatz (€)"]
-
-            # Kürzel normalisieren
-            out["Kürzel"] = out["Kürzel"].astype(str).str.strip()
-
-            # Umsatz numerisch -> dann direkt als String mit Punkt formatieren
-            out["Umsatz (€)"] = (
-                pd.to_numeric(out["Umsatz (€)"], errors="coerce")
-                .fillna(0.0)
-                .map(lambda x: f"{x:,.0f}".replace(",", "."))
-            )
-
-            return out
+    from utils.processing import lade_zeitdaten
 
-    return pd.DataFrame(columns=["Kürzel", "Umsatz (€)"])
+    # Inhalts-Hash → Arrow-Cache unter history/cache; Excel wird pro Datei nur einmal geparst
+    if hasattr(file, "getvalue"):
+        daten = file.getvalue()
+    else:
+        with open(file, "rb") as f:
+            daten = f.read()
+    balken = st.progress(0.0, text="⏳ Zeitdaten werden eingelesen...")
 
+    def fortschritt(gelesen, gesamt):
+        anteil = min(1.0, gelesen / gesamt) if gesamt else 0.0
+        balken.progress(anteil, text=f"⏳ {gelesen:,} Zeilen eingelesen...".replace(",", "."))
 
-def _norm(s: str) -> str:
-    """klein, Leerzeichen raus, nur Buchstaben."""
-    return re.sub(r"[^a-z]", "", str(s).lower())
-def read_abrechnung(upload) -> pd.DataFrame:
+    try:
+        return lade_zeitdaten(daten, fortschritt=fortschritt)
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        return None
+    finally:
+        balken.empty()
+
+def sitzung():
+    """Kennung der Session – für Dateinamen, die zwischen gleichzeitigen Sessions nicht kollidieren dürfen."""
+    return st.session_state.setdefault("sitzung", uuid.uuid4().hex[:8])
+
+# Mapping/Kürzel einmal pro Prozess lesen (nicht pro Session); jede gespeicherte Änderung
+# (egal aus welcher Session) erhöht den Stand der Stammdaten-DB und lädt die Tabellen damit neu
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _mapping_ressource(stand):
+    return lade_mapping()
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _kuerzel_ressource(stand):
+    return lade_kuerzel()
+
+def mapping_state():
+    """Aktuelles Mapping – ein geteiltes, nur lesend genutztes Objekt für alle Sessions."""
+    return _mapping_ressource(store().stand())
+
+def kuerzel_state():
+    return _kuerzel_ressource(store().stand())
+
+def stammdaten_neu_laden(*editoren):
+    """Editor-Zustände verwerfen, damit sie den neuen Stand der Stammdaten zeigen."""
+    for key in editoren:
+        st.session_state.pop(key, None)
+        st.session_state.pop(f"{key}_stand", None)
+
+def editor_stand(key, tabelle, frisch):
     """
-    Liest Abrechnungsdatei (CSV oder XLSX), sucht Kürzel & Einsatztage_SOLL.
-    Kopfzeile ab Zeile 7 wird berücksichtigt.
+    Stand, den der Editor `key` zeigt (Schlüssel als Index). Solange dort Änderungen offen sind,
+    bleibt der Stand vom Beginn der Bearbeitung stehen – die Zeilenpositionen im Editor-Zustand
+    beziehen sich darauf, nicht auf inzwischen von anderen Sessions geänderte Stammdaten.
     """
-    import os
-    ext = os.path.splitext(upload.name)[-1].lower()
-
+    from utils.stammdaten import editor_daten
+
+    zustand = st.session_state.get(key) or {}
+    offen = any(zustand.get(k) for k in ("edited_rows", "added_rows", "deleted_rows"))
+    if not offen or f"{key}_stand" not in st.session_state:
+        st.session_state[f"{key}_stand"] = editor_daten(frisch, tabelle)
+    return st.session_state[f"{key}_stand"]
+
+def mit_mapping(df):
+    """Verrechenbarkeit nach aktuellem Mapping – prozessweit je Datensatz × Stammdaten-Stand geteilt."""
+    from utils.aggregation import datensatz_schluessel, zeitdaten_fuer
+    from utils.processing import wende_mapping_an
+
+    stand = store().stand()
+    return zeitdaten_fuer(f"{datensatz_schluessel(df)}|mapping {stand}",
+                          lambda: wende_mapping_an(df, _mapping_ressource(stand)))
+
+def stammdaten_austausch(tabelle, dateiname):
+    """CSV-Export/-Import und Änderungsverlauf einer Stammdaten-Tabelle."""
+    with st.expander("📑 CSV & Änderungsverlauf"):
+        st.download_button(
+            label=f"⬇️ {dateiname}",
+            data=store().exportiere_csv(tabelle),
+            file_name=dateiname,
+            mime="text/csv",
+            key=f"export_{tabelle}",
+        )
+        datei = st.file_uploader(f"{dateiname} importieren (Zeilen werden ergänzt/überschrieben)",
+                                 type=["csv"], key=f"import_{tabelle}")
+        if datei is not None and st.button("📥 Importieren", key=f"import_{tabelle}_start"):
+            from utils.stammdaten import lade_csv
+            n = store().speichere(tabelle, lade_csv(tabelle, datei), quelle="csv")
+            stammdaten_neu_laden()
+            st.session_state["stammdaten_meldung"] = f"✅ {n} Zeilen aus {datei.name} übernommen."
+            st.rerun()
+        st.dataframe(store().historie(tabelle, limit=100), use_container_width=True, hide_index=True)
+
+def uebernehme_zeitdaten(df):
+    """Zweck/Dauer ableiten, in die Session legen, neue Mitarbeitende übernehmen, Vorschau zeigen."""
+    from utils.aggregation import datensatz_schluessel, zeitdaten_fuer
+    from utils.processing import kompaktiere_zeitdaten, leite_spalten_ab
+    from utils.stammdaten import registriere_mitarbeitende
+    from utils.wuerfel import speichere_upload_wuerfel
+
+    if df is None:
+        return
+    if "Unterprojekt" not in df.columns or "Mitarbeiter" not in df.columns:
+        st.error("❌ Spalten 'Unterprojekt' oder 'Mitarbeiter' fehlen.")
+        return
+
+    def aufbereiten():
+        # Zweck pro eindeutigem Unterprojekt berechnen, Dauer im selben Schritt;
+        # in der Session liegt nur das kompakte Schema (category/float32)
+        aufbereitet = leite_spalten_ab(df)
+        # Zeitwürfel (Tag × Mitarbeiter × Unterprojekt × Zweck) einmal pro Upload neben den Arrow-Cache legen
+        speichere_upload_wuerfel(aufbereitet)
+        return kompaktiere_zeitdaten(aufbereitet)
+
+    # Gleicher Upload in mehreren Sessions → ein gemeinsames DataFrame im Prozess
+    df = zeitdaten_fuer(datensatz_schluessel(df), aufbereiten)
+    st.session_state["df"] = df
+
+    # ➕ Automatischer Import neuer Mitarbeitenden in die Kürzel-Tabelle (nur neue Namen, keine Kürzel überschreiben)
     try:
-        if ext == ".csv":
-            df = pd.read_csv(upload, sep=";", header=7, engine="python", encoding="utf-8")
-        else:
-            df = pd.read_excel(upload, engine="openpyxl", header=7)
+        neu = registriere_mitarbeitende(df["Mitarbeiter"].cat.categories)
+        if neu:
+            st.info(f"👥 {len(neu)} neue Mitarbeitende wurden zur Kürzel-Tabelle hinzugefügt.")
     except Exception as e:
-        raise ValueError(f"Datei konnte nicht eingelesen werden: {e}")
-
-    # Spalten normalisieren
-    df.columns = df.columns.astype(str).str.strip().str.lower()
-
-    # Kürzel-Spalte finden
-    kuerzel_col = next((c for c in df.columns if c in ["pl", "kürzel", "kuerzel", "code"]), None)
+        st.warning(f"Konnte neue Mitarbeitende nicht übernehmen: {e}")
+
+    st.success("✅ Zeitdaten erfolgreich geladen.")
+    st.subheader("📄 Vorschau der Zeitdaten")
+    st.caption(f"{len(df):,} Zeilen – Vorschau der ersten 1.000".replace(",", "."))
+    st.dataframe(df.head(1000), use_container_width=True)
+
+@st.fragment
+def zeige_diagramm(export_summary):
+    """Interaktives Balkendiagramm (plotly, im Browser gezeichnet); Regler laufen nur dieses Fragment neu."""
+    from utils.bericht import MAX_BALKEN, SORTIERUNGEN, diagramm_daten, plotly_diagramm
+
+    n = len(export_summary)
+    sp1, sp2, sp3 = st.columns([2, 2, 1])
+    top_n = sp1.slider("Top N Mitarbeitende", 1, n, min(MAX_BALKEN, n), key="diagramm_top_n") if n > 1 else n
+    sortierung = sp2.selectbox("Sortierung", SORTIERUNGEN, key="diagramm_sortierung")
+    uebrige = sp3.checkbox("Übrige zusammenfassen", value=True, key="diagramm_uebrige")
+    daten = diagramm_daten(export_summary, top_n, sortierung, uebrige)
+    st.plotly_chart(plotly_diagramm(daten), use_container_width=True)
+
+@st.fragment(run_every=1.0)
+def _warte_auf_pdf(future):
+    if future.done():
+        st.rerun()
+    st.info("⏳ PDF-Bericht wird erstellt...")
+
+@st.fragment(run_every=1.0)
+def zeige_klassifikation(job_id):
+    """Fortschritt des Klassifikations-Jobs mit Restzeit; beendet → ganze Seite neu (lädt das Mapping)."""
+    from utils.jobs import AKTIV, job_store
+
+    jobs = job_store()
+    if jobs.job(job_id)["status"] not in AKTIV:
+        st.rerun()
+    f = jobs.fortschritt(job_id)
+    erledigt = f["fertig"] + f["fehler"]
+    text = f"🧠 {erledigt}/{f['gesamt']} neue Zwecke klassifiziert"
+    if f["rest_s"] is not None:
+        text += f" – noch ca. {f['rest_s'] / 60:.0f} min" if f["rest_s"] >= 90 else f" – noch ca. {f['rest_s']:.0f} s"
+    st.progress(erledigt / max(1, f["gesamt"]), text=text)
+    st.caption(
+        f"🔗 Index: {f['quellen'].get('index', 0)} – 🤖 Lokal: {f['quellen'].get('lokal', 0)}, "
+        f"KI: {f['quellen'].get('gpt', 0)} – ⚠️ Fehler: {f['fehler']} · läuft im Hintergrund weiter, "
+        f"Ergebnisse werden laufend gespeichert"
+    )
 
-    # Tage-Spalte finden (jetzt flexibler!)
-    tage_col = next((c for c in df.columns if "einsatztage" in c), None)
+def zeige_pdf_job():
+    """Status des PDF-Hintergrundjobs; fertig → im Export-Verlauf registrieren und Download anbieten."""
+    job = st.session_state.get("pdf_job")
+    if not job:
+        return
+    if not job["future"].done():
+        _warte_auf_pdf(job["future"])
+        return
+    fehler = job["future"].exception()
+    if fehler is not None:
+        st.error(f"❌ PDF konnte nicht erstellt werden: {fehler}")
+        return
+
+    name = os.path.basename(job["pfad"])
+    index = HistorienIndex("history/exports")
+    if not job.get("registriert"):
+        index.registriere(name, zeilen=job["zeilen"])
+        job["registriert"] = True
+    st.download_button(
+        "⬇️ PDF-Bericht herunterladen",
+        data=functools.partial(index.lese, name),
+        file_name=name,
+        mime="application/pdf",
+    )
 
-    if not kuerzel_col or not tage_col:
-        raise ValueError(f"Keine passenden Spalten gefunden. Gefunden: {list(df.columns)}")
+def zeige_diagnose(zusammenfassung):
+    """Aufschlüsselung des gerade beendeten Laufs: Stufen nach Dauer, GPT-Aufrufe/Tokens/Retries."""
+    with st.expander("🩺 Letzter Lauf", expanded=True):
+        st.caption(f"{zusammenfassung['name']} – {zusammenfassung['gesamt_ms']:.0f} ms gesamt")
+        stufen = zusammenfassung["stufen"]
+        if stufen:
+            st.dataframe(
+                pd.DataFrame(
+                    [(name, round(s["ms"], 1), s["anzahl"]) for name, s in stufen.items()],
+                    columns=["Stufe", "ms", "Aufrufe"],
+                ).sort_values("ms", ascending=False),
+                hide_index=True,
+                use_container_width=True,
+            )
+        else:
+            st.caption("Keine gemessenen Stufen.")
+        gpt = zusammenfassung["gpt"]
+        if gpt["aufrufe"]:
+            st.caption(
+                f"🤖 GPT: {gpt['aufrufe']} Aufrufe ({gpt['fehlgeschlagen']} fehlgeschlagen, "
+                f"{gpt['retries']} Retries), {gpt['prompt_tokens'] + gpt['completion_tokens']:,} Tokens, "
+                f"Median-Latenz {gpt['latenz_ms_median']} ms".replace(",", ".")
+            )
 
-    out = df[[kuerzel_col, tage_col]].rename(
-        columns={kuerzel_col: "Kürzel", tage_col: "Einsatztage_SOLL"}
-    )
+def zeige_historie(index, key, icon="⬇️", pro_seite=20, loeschen=False, laden=None):
+    """
+    Blätterbare, filterbare Liste eines History-Ordners. Die Bytes einer Datei werden
+    erst beim Klick auf Download gelesen (callable data).
+    """
+    cols = st.columns([6, 2])
+    filter_text = cols[0].text_input("Filter", key=f"{key}_filter", placeholder="Dateiname enthält…",
+                                     label_visibility="collapsed")
+    # Ein Abgleich pro Rerun: Seite aus dem Widget-State, Gesamtzahl aus demselben Aufruf
+    seite = int(st.session_state.get(f"{key}_seite", 1))
+    eintraege, gesamt = index.seite(filter_text, seite, pro_seite)
+    seiten = max(1, -(-gesamt // pro_seite))
+    if seite > seiten:
+        # Filter hat die Trefferzahl verkleinert – auf die letzte Seite springen
+        seite = seiten
+        st.session_state[f"{key}_seite"] = seite
+        eintraege, gesamt = index.seite(filter_text, seite, pro_seite)
+    seite = cols[1].number_input("Seite", min_value=1, max_value=seiten, key=f"{key}_seite",
+                                 label_visibility="collapsed")
+    st.caption(f"{gesamt} Dateien · Seite {int(seite)}/{seiten}")
+
+    for e in eintraege:
+        name = e["name"]
+        zeilen = f" · {e['zeilen']} Zeilen" if e.get("zeilen") is not None else ""
+        groesse = f"{e['groesse'] / 1024:,.0f} KB".replace(",", ".")
+        cols = st.columns([8, 1])
+        cols[0].download_button(
+            label=f"{icon} {name} ({groesse}{zeilen})",
+            data=functools.partial(index.lese, name),
+            file_name=name,
+            key=f"{key}_dl_{name}",
+        )
+        if loeschen and cols[1].button("❌", key=f"del_{name}"):
+            index.entferne(name)
+            st.rerun()
+        if laden and cols[1].button("📂", key=f"load_{name}", help="Erneut laden (aus dem Cache, ohne Excel-Parsing)"):
+            laden(name)
 
-    # Zahlen robust konvertieren
-    out["Einsatztage_SOLL"] = (
-        out["Einsatztage_SOLL"]
-        .astype(str)
-        .str.replace(r"[^0-9,.\-]", "", regex=True)
-        .str.replace(".", "", regex=False)
-        .str.replace(",", ".", regex=False)
-    )
-    out["Einsatztage_SOLL"] = pd.to_numeric(out["Einsatztage_SOLL"], errors="coerce").fillna(0.0)
-    out["Kürzel"] = out["Kürzel"].astype(str).str.strip()
-
-    return out.groupby("Kürzel", as_index=False)["Einsatztage_SOLL"].sum()
-
-
-def lade_mapping():
-    if os.path.exists("mapping.csv"):
-        dfm = pd.read_csv("mapping.csv")
-        if "Zweck" not in dfm.columns:
-            dfm["Zweck"] = ""
-        if "Verrechenbarkeit" not in dfm.columns:
-            dfm["Verrechenbarkeit"] = "Unbekannt"
-        out = dfm[["Zweck", "Verrechenbarkeit"]].copy()
-        out["Zweck"] = out["Zweck"].astype(str).str.strip()
-        out["Verrechenbarkeit"] = out["Verrechenbarkeit"].fillna("Unbekannt")
-        out.drop_duplicates(subset=["Zweck"], inplace=True)
-        return out
-    return pd.DataFrame(columns=["Zweck", "Verrechenbarkeit"])
-
-def speichere_mapping(df):
-    out = df.copy()
-    out["Zweck"] = out["Zweck"].astype(str).str.strip()
-    out["Verrechenbarkeit"] = out["Verrechenbarkeit"].fillna("Unbekannt")
-    out.drop_duplicates(subset=["Zweck"], inplace=True)
-    out.to_csv("mapping.csv", index=False)
-
-def lade_kuerzel():
-    if os.path.exists("kuerzel.csv"):
-        dfk = pd.read_csv("kuerzel.csv")
-        if "Name" not in dfk.columns:
-            dfk["Name"] = ""
-        if "Kürzel" not in dfk.columns:
-            dfk["Kürzel"] = ""
-        out = dfk[["Name", "Kürzel"]].copy()
-        out["Name"] = out["Name"].astype(str).str.strip()
-        out["Kürzel"] = out["Kürzel"].astype(str).str.strip()
-        out.drop_duplicates(subset=["Name"], inplace=True)
-        return out
-    return pd.DataFrame(columns=["Name", "Kürzel"])
-
-def speichere_kuerzel(df):
-    out = df.copy()
-    out["Name"] = out["Name"].astype(str).str.strip()
-    out["Kürzel"] = out["Kürzel"].astype(str).str.strip()
-    out.dropna(subset=["Name"], inplace=True)
-    out.drop_duplicates(subset=["Name"], inplace=True)
-    out.to_csv("kuerzel.csv", index=False)
-
-def get_state_df(key, loader):
-    if key not in st.session_state or not isinstance(st.session_state[key], pd.DataFrame):
-        st.session_state[key] = loader()
-    return st.session_state[key]
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Session-State initialisieren
 # ──────────────────────────────────────────────────────────────────────────────
+# Mapping/Kürzel kommen erst auf den Seiten dazu, die sie brauchen (mapping_state/kuerzel_state)
 if "df" not in st.session_state:
     st.session_state["df"] = None
-if "mapping_df" not in st.session_state:
-    st.session_state["mapping_df"] = lade_mapping()
-if "kuerzel_map" not in st.session_state:
-    st.session_state["kuerzel_map"] = lade_kuerzel()
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Sidebar Navigation
@@ -185,8 +303,12 @@ with st.sidebar:
         label_visibility="collapsed",
     )
     st.markdown("---")
+    diagnose = st.checkbox("🩺 Diagnose anzeigen", key="diagnose")
     st.markdown(f"🧠 Max KI Dashboard – {APP_VERSION}")
 
+# Jeder Rerun ist ein Telemetrie-Lauf: Stufen und GPT-Aufrufe → history/telemetrie.jsonl
+telemetrie_lauf = telemetrie.beginne_lauf(page)
+
 # ──────────────────────────────────────────────────────────────────────────────
 # STARTSEITE
 # ──────────────────────────────────────────────────────────────────────────────
@@ -205,14 +327,7 @@ if page == "🏠 Start":
     )
 
     st.markdown("## 📤 Export-Historie")
-    export_files = sorted(os.listdir("history/exports"), reverse=True)
-    for f in export_files:
-        cols = st.columns([8, 1])
-        with open(os.path.join("history/exports", f), "rb") as file:
-            cols[0].download_button(label=f"⬇️ {f}", data=file.read(), file_name=f)
-        if cols[1].button("❌", key=f"del_{f}"):
-            os.remove(os.path.join("history/exports", f))
-            st.rerun()
+    zeige_historie(HistorienIndex("history/exports"), key="exports", loeschen=True)
 
 # ──────────────────────────────────────────────────────────────────────────────
 # DATEN HOCHLADEN – mit automatischem Kürzelimport
@@ -226,91 +341,148 @@ elif page == "📁 Daten hochladen":
     st.header("⏱️ Zeitdaten hochladen")
     uploaded_file = st.file_uploader("Lade eine `.xlsx` Datei mit Zeitdaten hoch", type=["xlsx"], key="zeitdaten_upload")
 
-    if uploaded_file:
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        save_path = os.path.join("history/uploads", f"upload_{timestamp}.xlsx")
-        with open(save_path, "wb") as f:
-            f.write(uploaded_file.getvalue())
+    from utils.archiv import archiv
+    from utils.datenspeicher import DatenSpeicher, ingestiere_dateien
 
-        df = load_excel(uploaded_file)
-
-        if "Unterprojekt" not in df.columns or "Mitarbeiter" not in df.columns:
-            st.error("❌ Spalten 'Unterprojekt' oder 'Mitarbeiter' fehlen.")
-        else:
-            df["Zweck"] = df["Unterprojekt"].apply(extrahiere_zweck)
-
-            dauer_spalte = None
-            for spalte in df.columns:
-                if spalte.lower() in ["stunden", "dauer"]:
-                    dauer_spalte = spalte
-                    break
-            if dauer_spalte:
-                df["Dauer"] = pd.to_numeric(df[dauer_spalte], errors="coerce").fillna(0)
-            else:
-                df["Dauer"] = 1.0
+    uploads = archiv()
 
-            st.session_state["df"] = df
+    if uploaded_file:
+        df_upload = load_excel(uploaded_file)
 
-            # ➕ Automatischer Import neuer Mitarbeitenden in kuerzel.csv
+        # Inhaltsadressiert archivieren: gleicher Inhalt liegt nur einmal im Archiv (nicht bei jedem Rerun ablegen)
+        upload_hash = df_upload.attrs.get("datensatz") if df_upload is not None else None
+        if upload_hash and st.session_state.get("upload_hash") != upload_hash:
             try:
-                kuerzel_df = get_state_df("kuerzel_map", lade_kuerzel)
-                aktuelle_namen = set(df["Mitarbeiter"].dropna().astype(str).str.strip())
-                bekannte_namen = set(kuerzel_df["Name"].astype(str).str.strip())
-                neu = sorted(list(aktuelle_namen - bekannte_namen))
-                if neu:
-                    addon = pd.DataFrame({"Name": neu, "Kürzel": ""})
-                    st.session_state["kuerzel_map"] = (
-                        pd.concat([kuerzel_df, addon], ignore_index=True)
-                          .drop_duplicates(subset=["Name"])
-                    )
-                    speichere_kuerzel(st.session_state["kuerzel_map"])
-                    st.info(f"👥 {len(neu)} neue Mitarbeitende wurden zur Kürzel-Tabelle hinzugefügt.")
+                eintrag, neu = uploads.archiviere(uploaded_file.getvalue(), df_upload, sha256=upload_hash)
+                if not neu:
+                    st.info(f"♻️ Identische Datei bereits archiviert ({eintrag['name']}, {eintrag['anzahl']}× hochgeladen).")
             except Exception as e:
-                st.warning(f"Konnte neue Mitarbeitende nicht übernehmen: {e}")
+                # Archiv ist Beiwerk – die Daten selbst sind geladen, beim nächsten Rerun nicht erneut versuchen
+                st.warning(f"Upload konnte nicht archiviert werden: {e}")
+            st.session_state["upload_hash"] = upload_hash
 
-            st.success("✅ Zeitdaten erfolgreich geladen.")
-            st.subheader("📄 Vorschau der Zeitdaten")
-            st.dataframe(df, use_container_width=True)
+        uebernehme_zeitdaten(df_upload)
+
+    def lade_aus_historie(name):
+        try:
+            df_alt = uploads.lade(name)
+        except (OSError, ValueError) as e:
+            st.error(f"❌ {e}")
+            return
+        uebernehme_zeitdaten(df_alt)
 
     st.markdown("## 📂 Hochgeladene Zeitdaten-Dateien")
-    upload_files = sorted(os.listdir("history/uploads"), reverse=True)
-    for f in upload_files:
-        with open(os.path.join("history/uploads", f), "rb") as file:
-            st.download_button(label=f"📄 {f}", data=file.read(), file_name=f)
+    st.caption("Filter nach Name, Hash-Anfang oder Monat (JJJJ-MM).")
+    zeige_historie(uploads, key="uploads", icon="📄", laden=lade_aus_historie)
+    if uploads.pflege_aktiv and st.button("🧹 Archiv pflegen", help="Aufbewahrungsregel anwenden (ARCHIV_* Einstellungen)"):
+        with st.spinner("🧹 Archiv wird gepflegt..."):
+            ergebnis = uploads.pflege()
+        st.success(f"✅ {ergebnis['verdichtet']} verdichtet, {ergebnis['geloescht']} gelöscht.")
+        if ergebnis["fehler"]:
+            st.warning(f"⚠️ Nicht lesbar, unverändert belassen: {', '.join(ergebnis['fehler'])}")
+
+    # -------------------------
+    # Mehrere Exporte in den Datensatz (nach Monat partitioniert)
+    # -------------------------
+    st.header("🗂️ Mehrere Zeitdaten-Dateien in den Datensatz übernehmen")
+    st.caption("Dateien werden parallel eingelesen; überlappende Exporte werden dedupliziert.")
+    mehrere = st.file_uploader(
+        "Eine oder mehrere `.xlsx` Dateien", type=["xlsx"], accept_multiple_files=True, key="multi_upload"
+    )
+    if mehrere and st.button("📥 In Datensatz übernehmen"):
+        balken = st.progress(0.0, text="⏳ Dateien werden eingelesen...")
+        try:
+            ergebnisse = ingestiere_dateien(
+                [f.getvalue() for f in mehrere],
+                fortschritt=lambda fertig, gesamt: balken.progress(fertig / gesamt, text=f"⏳ {fertig}/{gesamt} Dateien"),
+            )
+        except ValueError as e:
+            st.error(f"❌ {e}")
+            ergebnisse = []
+        finally:
+            balken.empty()
+
+        speicher = DatenSpeicher()
+        neu = {}
+        for h, df_teil in ergebnisse:
+            for partition, zeilen in speicher.schreibe(df_teil, h).items():
+                neu[partition] = neu.get(partition, 0) + zeilen
+        if ergebnisse:
+            st.success(f"✅ {sum(neu.values()):,} neue Buchungen übernommen.".replace(",", "."))
+            st.dataframe(
+                pd.DataFrame(sorted(neu.items(), reverse=True), columns=["Monat", "Neue Buchungen"]),
+                use_container_width=True,
+            )
 
     # -------------------------
     # Umsatzdaten hochladen
     # -------------------------
     st.header("💰 Umsatzdaten hochladen")
+    from utils.rechnung import (
+        RECHNUNG_DIR, UMSATZ, dateiname_fuer, lade_umsatzdatei, speichere_umsatzdatei, umsatzdateien,
+    )
+
+    # Eine Datei je Periode (Rechnung_JJJJ-MM.xlsx); dieselbe Periode erneut hochladen ersetzt sie
+    periode = st.text_input("Periode (JJJJ-MM)", value=datetime.now().strftime("%Y-%m"), key="rechnung_periode")
     rechnung_file = st.file_uploader("Lade eine Excel-Datei mit Kürzel und Umsatz (€)", type=["xlsx"], key="rechnung_upload")
 
     if rechnung_file:
-        save_path = os.path.join("history/rechnung", "Rechnung.xlsx")
-        with open(save_path, "wb") as f:
-            f.write(rechnung_file.getvalue())
-        st.success("✅ Umsatzdaten gespeichert als Rechnung.xlsx")
+        if not re.fullmatch(r"\d{4}-\d{2}", periode.strip()):
+            st.error("❌ Periode bitte als JJJJ-MM angeben.")
+        else:
+            # Nur einmal je Inhalt × Periode speichern – sonst schreibt jeder Rerun die Datei neu,
+            # ändert ihre mtime und verwirft damit den Umsatz-Cache
+            daten = rechnung_file.getvalue()
+            rechnung_hash = f"{hashlib.sha256(daten).hexdigest()}|{periode.strip()}"
+            if st.session_state.get("rechnung_hash") != rechnung_hash:
+                name = speichere_umsatzdatei(daten, periode.strip())
+                st.session_state["rechnung_hash"] = rechnung_hash
+                st.success(f"✅ Umsatzdaten gespeichert als {name}")
+            else:
+                name = dateiname_fuer(periode.strip())
 
-        try:
-            rechnung_df = pd.read_excel(rechnung_file, engine="openpyxl")
-            st.subheader("📄 Vorschau der Umsatzdaten")
-            st.dataframe(rechnung_df, use_container_width=True)
-        except Exception as e:
-            st.error(f"Umsatzdaten konnten nicht geladen werden: {e}")
-
-    # Anzeige vorhandener Umsatzdatei
-    if os.path.exists(os.path.join("history/rechnung", "Rechnung.xlsx")):
-        with open(os.path.join("history/rechnung", "Rechnung.xlsx"), "rb") as file:
-            st.download_button(
-                label="📄 Aktuelle Umsatzdaten (Rechnung.xlsx)",
-                data=file.read(),
-                file_name="Rechnung.xlsx"
-            )
+            try:
+                rechnung_df = lade_umsatzdatei(os.path.join(RECHNUNG_DIR, name))
+                st.subheader("📄 Vorschau der Umsatzdaten")
+                st.dataframe(rechnung_df, use_container_width=True,
+                             column_config={UMSATZ: st.column_config.NumberColumn(format="euro")})
+            except Exception as e:
+                st.error(f"Umsatzdaten konnten nicht geladen werden: {e}")
+
+    # Vorhandene Umsatzdateien (neueste Periode zuerst)
+    dateien = umsatzdateien()
+    if dateien:
+        gewaehlt = st.selectbox("Vorhandene Umsatzdaten", sorted(dateien, reverse=True),
+                                format_func=lambda p: f"{p} ({dateien[p]})", key="rechnung_datei")
+        st.download_button(
+            label=f"📄 {dateien[gewaehlt]} herunterladen",
+            data=functools.partial(HistorienIndex(RECHNUNG_DIR).lese, dateien[gewaehlt]),
+            file_name=dateien[gewaehlt]
+        )
 
 elif page == "🧠 Zweck-Kategorisierung":
     st.title("🧠 Zweck-Kategorisierung & Mapping")
 
+    from utils.jobs import AKTIV, OHNE_KI, job_store, setze_fort, starte_klassifikation
+    from utils.pipeline import neue_zwecke
+    from utils.stammdaten import aendere_kuerzel, aendere_mapping, editor_aenderungen
+    from utils.zweck import verdichte_mapping
+
+    meldung = st.session_state.pop("stammdaten_meldung", None)
+    if meldung:
+        st.success(meldung)
+
+    # Nach einem Neustart unterbrochene Klassifikations-Jobs fortsetzen
+    jobs = job_store()
+    setze_fort(jobs)
+    job = jobs.job()
+    if job and job["status"] not in AKTIV and st.session_state.get("klassifikation_gesehen") != job["id"]:
+        # Ergebnisse des beendeten Jobs liegen in der Stammdaten-DB – Editor zeigt den neuen Stand
+        stammdaten_neu_laden("mapping_editor")
+        st.session_state["klassifikation_gesehen"] = job["id"]
+
     # Mapping immer laden
-    mapping_df = st.session_state.get("mapping_df", lade_mapping())
+    mapping_df = mapping_state()
     df = st.session_state.get("df")
 
     if df is None or "Zweck" not in df.columns:
@@ -318,45 +490,53 @@ elif page == "🧠 Zweck-Kategorisierung":
 
     else:
         # ---------- 1) Automatisches GPT-Mapping nur für neue Zwecke ----------
-        aktuelle_zwecke = set(df["Zweck"].dropna().astype(str).str.strip())
-        bekannte_zwecke = set(mapping_df["Zweck"].dropna().astype(str).str.strip())
-        neue_zwecke = sorted(aktuelle_zwecke - bekannte_zwecke)
+        # Schreibvarianten bekannter Zwecke (".1 Akquise" ↔ "Akquise") gelten nicht als neu
+        neue = neue_zwecke(df["Zweck"].cat.categories, mapping_df)
 
-        st.markdown(f"🔍 Neue Zwecke im aktuellen Datensatz: **{len(neue_zwecke)}**")
+        st.markdown(f"🔍 Neue Zwecke im aktuellen Datensatz: **{len(neue)}**")
 
-        if neue_zwecke:
-            try:
-                from utils.gpt import klassifiziere_verrechenbarkeit
-                neue_mapping = []
-                with st.spinner(f"🧠 {len(neue_zwecke)} neue Zwecke – KI klassifiziert..."):
-                    for zweck in neue_zwecke:
-                        kat = klassifiziere_verrechenbarkeit(zweck)
-                        if kat not in ("Intern", "Extern"):
-                            kat = ""  # leer lassen statt None
-                        neue_mapping.append({"Zweck": zweck, "Verrechenbarkeit": kat})
-
-                # Neue Zwecke gezielt unten anhängen
-                if neue_mapping:
-                    new_df = pd.DataFrame(neue_mapping)
-                    mapping_df = pd.concat([mapping_df, new_df], ignore_index=True)
-                    mapping_df.drop_duplicates(subset=["Zweck"], keep="last", inplace=True)
-
-                    # Sortierung: erkannte zuerst, unklare ("") ganz unten
-                    mapping_df = mapping_df.sort_values(
-                        by=["Verrechenbarkeit", "Zweck"],
-                        key=lambda col: col.fillna("zzz")
-                    )
-
-                    st.session_state["mapping_df"] = mapping_df
-                    speichere_mapping(mapping_df)
-                    st.success("✅ Neues Mapping gespeichert.")
-            except Exception:
-                st.warning("⚠️ KI-Mapping konnte nicht automatisch durchgeführt werden.")
+        if job and job["status"] in AKTIV:
+            zeige_klassifikation(job["id"])
+        else:
+            # Zwecke, die im letzten Job fehlgeschlagen sind, nur auf Knopfdruck erneut versuchen
+            fehlgeschlagen = jobs.fehlerliste(job["id"]) if job else pd.DataFrame(columns=["Zweck", "Fehler"])
+            fehlgeschlagen = fehlgeschlagen[fehlgeschlagen["Zweck"].isin(neue)]
+            abgebrochen = job is not None and job["status"] == "abgebrochen"
+            zu_klassifizieren = [z for z in neue if z not in set(fehlgeschlagen["Zweck"])]
+            if zu_klassifizieren and not abgebrochen:
+                # Index → lokales Modell → KI im Hintergrund; jeder Batch wird sofort ins Mapping geschrieben
+                starte_klassifikation(zu_klassifizieren)
+                st.rerun()
+
+            if job:
+                quellen = jobs.fortschritt(job["id"])["quellen"]
+                st.caption(
+                    f"Letzte Klassifikation ({job['erstellt'].replace('T', ' ')}): "
+                    f"🔗 {quellen.get('index', 0)} über ähnliche bekannte Zwecke – "
+                    f"🤖 Lokales Modell: {quellen.get('lokal', 0)}, KI: {quellen.get('gpt', 0)}"
+                )
+                if quellen.get("gpt") or not fehlgeschlagen.empty:
+                    from utils.gpt import cache_statistik
+                    stats = cache_statistik()
+                    st.caption(f"GPT-Cache: {stats['treffer']} Treffer, {stats['fehlschlaege']} nicht im Cache")
+            if abgebrochen:
+                st.error(f"❌ Klassifikation abgebrochen: {job['fehler']}")
+            ohne_ki = int((fehlgeschlagen["Fehler"] == OHNE_KI).sum())
+            if ohne_ki:
+                st.warning(f"⚠️ {ohne_ki} Zwecke unsicher und KI nicht erreichbar – mit KI erneut versuchen "
+                           f"oder im Tab ✍️ manuell zuordnen.")
+            if len(fehlgeschlagen) > ohne_ki:
+                st.warning(f"⚠️ {len(fehlgeschlagen) - ohne_ki} Zwecke konnten nicht klassifiziert werden.")
+            if not fehlgeschlagen.empty:
+                st.dataframe(fehlgeschlagen, use_container_width=True, hide_index=True)
+            if (abgebrochen and neue) or not fehlgeschlagen.empty:
+                if st.button("🔁 Mit KI erneut versuchen", key="klassifikation_wiederholen"):
+                    starte_klassifikation(neue)
+                    st.rerun()
 
         # Mapping anwenden
         if df is not None:
-            df = df.drop(columns=["Verrechenbarkeit"], errors="ignore")
-            df = df.merge(mapping_df, on="Zweck", how="left")
+            df = mit_mapping(df)
             st.session_state["df"] = df
 
     # ---------- Tabs: Mapping und Kürzel IMMER anzeigen ----------
@@ -369,147 +549,204 @@ elif page == "🧠 Zweck-Kategorisierung":
             show_map = show_map.sort_values("Zweck")
         st.dataframe(show_map, use_container_width=True)
 
+        verdichtet = verdichte_mapping(mapping_df)
+        if len(verdichtet) < len(mapping_df):
+            st.caption(f"🧹 {len(mapping_df) - len(verdichtet)} Einträge sind nur Schreibvarianten mit gleicher Kategorie.")
+            if st.button("🧹 Mapping verdichten", key="compact_mapping"):
+                aendere_mapping(loeschungen=set(mapping_df["Zweck"]) - set(verdichtet["Zweck"]), quelle="verdichten")
+                stammdaten_neu_laden("mapping_editor")
+                st.rerun()
+
+        stammdaten_austausch("mapping", "mapping.csv")
+
+        with st.expander("🤖 GPT-Cache"):
+            from utils.gpt import PROMPT_VERSION, cache_statistik, invalidiere_cache
+            stats = cache_statistik()
+            st.caption(
+                f"{sum(stats['versionen'].values())} gespeicherte Klassifikationen "
+                f"({stats['versionen'].get(PROMPT_VERSION, 0)} aus der aktuellen Prompt-Version) – "
+                f"in diesem Prozess {stats['treffer']} Treffer, {stats['fehlschlaege']} nicht im Cache"
+            )
+            if st.button("🧹 Einträge alter Prompt-Versionen entfernen", key="gpt_cache_aufraeumen"):
+                st.success(f"✅ {invalidiere_cache(nur_alte_versionen=True)} Einträge entfernt.")
+
     with tab2:
         st.caption("Manuelle Korrektur/Ergänzung des Zweck-Mappings.")
+        mapping_stand = editor_stand("mapping_editor", "mapping", mapping_df)
         edited_df = st.data_editor(
-            mapping_df,
+            mapping_stand,
             num_rows="dynamic",
             use_container_width=True,
             key="mapping_editor"
         )
         if st.button("💾 Änderungen speichern", key="save_purpose_mapping"):
-            edited_df.drop_duplicates(subset=["Zweck"], keep="last", inplace=True)
-            st.session_state["mapping_df"] = edited_df
-            speichere_mapping(edited_df)
+            # Nur die im Editor geänderten Zeilen schreiben – parallele Änderungen anderer bleiben erhalten
+            upserts, loeschungen = editor_aenderungen("mapping", mapping_stand, st.session_state.get("mapping_editor"))
+            n = aendere_mapping(upserts, loeschungen)
+            stammdaten_neu_laden("mapping_editor")
 
             if df is not None:
-                df_tmp = df.drop(columns=["Verrechenbarkeit"], errors="ignore")
-                df_tmp = df_tmp.merge(edited_df, on="Zweck", how="left")
-                st.session_state["df"] = df_tmp
+                st.session_state["df"] = mit_mapping(df)
 
-            st.success("✅ Mapping gespeichert & angewendet.")
+            st.session_state["stammdaten_meldung"] = f"✅ Mapping gespeichert & angewendet ({n} Zeilen geändert)."
+            st.rerun()
 
     with tab3:
-        st.caption("Mitarbeiter-Kürzel pflegen (persistiert in kuerzel.csv).")
+        st.caption("Mitarbeiter-Kürzel pflegen (persistiert in der Stammdaten-Datenbank).")
 
-        kuerzel_df = st.session_state.get("kuerzel_map", lade_kuerzel())
+        kuerzel_df = kuerzel_state()
         if kuerzel_df.empty:
             kuerzel_df = pd.DataFrame(columns=["Name", "Kürzel"])
 
+        kuerzel_stand = editor_stand("kuerzel_editor", "kuerzel", kuerzel_df)
         edited_kuerzel_df = st.data_editor(
-            kuerzel_df,
+            kuerzel_stand,
             key="kuerzel_editor",
             use_container_width=True,
             num_rows="dynamic"
         )
 
         if st.button("💾 Kürzel speichern", key="save_initials"):
-            edited_kuerzel_df.drop_duplicates(subset=["Name"], keep="last", inplace=True)
-            st.session_state["kuerzel_map"] = edited_kuerzel_df
-            speichere_kuerzel(edited_kuerzel_df)
-            st.success("✅ Kürzel wurden gespeichert und bleiben erhalten.")
+            upserts, loeschungen = editor_aenderungen("kuerzel", kuerzel_stand, st.session_state.get("kuerzel_editor"))
+            n = aendere_kuerzel(upserts, loeschungen)
+            stammdaten_neu_laden("kuerzel_editor")
+            st.session_state["stammdaten_meldung"] = f"✅ Kürzel gespeichert ({n} Zeilen geändert)."
+            st.rerun()
+
+        stammdaten_austausch("kuerzel", "kuerzel.csv")
 
 elif page == "📊 Analyse & Visualisierung":
     st.title("📊 Verrechenbarkeit Gesamtübersicht")
 
+    from utils.aggregation import aggregat_fuer, zeitdaten_fuer, zusammenfassung
+    from utils.bericht import detail_tabelle, starte_pdf
+    from utils.datenspeicher import DatenSpeicher
+    from utils.processing import kompaktiere_zeitdaten
+    from utils.rechnung import UMSATZ, UMSATZ_JE_STUNDE, haenge_umsatz_an, lade_rechnung, perioden
+    from utils.wuerfel import ZEITRAEUME, upload_wuerfel, wuerfel_fuer
+
     df = st.session_state.get("df")
+
+    # Datenquelle: aktueller Upload oder ausgewählte Monate aus dem Datensatz
+    speicher = DatenSpeicher()
+    monate = speicher.partitionen()
+    datensatz_monate = []
+    wuerfel = None
+    if monate:
+        quelle = st.radio("Datenquelle", ["Aktueller Upload", "Datensatz (Monate)"], horizontal=True)
+        if quelle == "Datensatz (Monate)":
+            auswahl = st.multiselect("Monate", monate, default=monate[:1])
+            datensatz_monate = auswahl
+            df = None
+            if auswahl:
+                # Nur die gewählten Partitionen lesen – einmal pro Prozess und Dateistand, nicht pro Session;
+                # attrs["datensatz"] hält das Aggregat gecacht
+                stand = speicher.stand(auswahl)
+                df = zeitdaten_fuer(stand, lambda: kompaktiere_zeitdaten(speicher.lese(auswahl)))
+                wuerfel = wuerfel_fuer(stand, lambda: speicher.lese_wuerfel(auswahl))
+
     if not isinstance(df, pd.DataFrame):
         st.warning("Bitte zuerst eine Datei hochladen.")
     else:
-        if "Verrechenbarkeit" not in df.columns:
-            df = df.drop(columns=["Verrechenbarkeit"], errors="ignore")
-            df = df.merge(st.session_state["mapping_df"], on="Zweck", how="left")
-            st.session_state["df"] = df
-
-        export_df = df[df["Verrechenbarkeit"].isin(["Intern", "Extern"])].copy()
-        if export_df.empty:
+        # Aggregat je Datensatz gecacht; Mapping-Änderungen buchen nur betroffene Zwecke um
+        pivot_df = aggregat_fuer(df).pivot_fuer(mapping_state())
+        if pivot_df.empty:
             st.info("Keine Daten mit 'Intern'/'Extern' vorhanden.")
         else:
-            # Pivot für Stunden
-            pivot_df = export_df.groupby(["Mitarbeiter", "Verrechenbarkeit"])["Dauer"].sum().unstack(fill_value=0)
-            pivot_df["Gesamtstunden"] = pivot_df.sum(axis=1)
-            pivot_df["% Intern"] = (pivot_df.get("Intern", 0) / pivot_df["Gesamtstunden"]) * 100
-            pivot_df["% Extern"] = (pivot_df.get("Extern", 0) / pivot_df["Gesamtstunden"]) * 100
-
-            export_summary = pivot_df.reset_index()
-            export_summary = export_summary[["Mitarbeiter", "Intern", "Extern", "Gesamtstunden", "% Intern", "% Extern"]]
-            export_summary[["Intern", "Extern", "Gesamtstunden"]] = export_summary[["Intern", "Extern", "Gesamtstunden"]].round(2)
-            export_summary[["% Intern", "% Extern"]] = export_summary[["% Intern", "% Extern"]].round(1)
+            export_summary = zusammenfassung(pivot_df)
 
             # ---------------------------------------------------
-            # Umsatz-Daten einlesen und anhängen
+            # Umsatz-Daten einlesen und anhängen (je Datei mtime-gecacht, numerisch)
             # ---------------------------------------------------
-            rechnung_df = lade_rechnung()
-            kuerzel_map = st.session_state.get("kuerzel_map", lade_kuerzel())
+            umsatz_perioden = perioden()
+            if len(umsatz_perioden) > 1:
+                # Standard: die im Datensatz gewählten Monate, sonst die neueste Periode
+                passend = [p for p in umsatz_perioden if p in datensatz_monate]
+                umsatz_perioden = st.multiselect("Umsatz-Perioden", umsatz_perioden,
+                                                 default=passend or umsatz_perioden[:1], key="umsatz_perioden")
+            rechnung_df = lade_rechnung(perioden_auswahl=umsatz_perioden)
+            kuerzel_map = kuerzel_state()
 
             if rechnung_df.empty:
                 st.warning("⚠️ Keine Umsatzdaten gefunden. Bitte lade unter 📁 Daten hochladen eine Umsatzdatei hoch.")
-            elif not kuerzel_map.empty:
-                # 1) Mitarbeiter -> Kürzel mappen
-                export_summary = export_summary.merge(
-                    kuerzel_map[["Name", "Kürzel"]],
-                    left_on="Mitarbeiter", right_on="Name", how="left"
-                ).drop(columns=["Name"])
-
-                # 2) Kürzel -> Umsatz joinen
-                export_summary = export_summary.merge(
-                    rechnung_df, on="Kürzel", how="left"
-                )
-
-                # 3) Kürzel-Spalte wieder entfernen (optional)
-                export_summary.drop(columns=["Kürzel"], inplace=True, errors="ignore")
+            export_summary = haenge_umsatz_an(export_summary, kuerzel_map, rechnung_df)
 
             # ---------------------------------------------------
             # Diagramm
             # ---------------------------------------------------
             st.subheader("📊 Balkendiagramm Intern/Extern pro Mitarbeiter")
-            fig, ax = plt.subplots(figsize=(10, 5))
-            export_summary.plot(kind="bar", x="Mitarbeiter", y=["Intern", "Extern"], ax=ax)
-            ax.set_ylabel("Stunden")
-            ax.set_title("Stunden nach Verrechenbarkeit")
-            st.pyplot(fig)
+            # Aus der gecachten Zusammenfassung, gezeichnet im Browser; ein PNG entsteht nur für den PDF-Export
+            zeige_diagramm(export_summary)
 
             # ---------------------------------------------------
             # Tabelle
             # ---------------------------------------------------
             st.subheader("📄 Tabellenansicht")
-            st.dataframe(export_summary, use_container_width=True)
+            # Umsatz bleibt numerisch (sortierbar); formatiert wird nur in der Anzeige
+            st.dataframe(export_summary, use_container_width=True, column_config={
+                UMSATZ: st.column_config.NumberColumn(format="euro"),
+                UMSATZ_JE_STUNDE: st.column_config.NumberColumn(format="euro"),
+            })
 
             # ---------------------------------------------------
             # PDF-Export
             # ---------------------------------------------------
+            mit_details = st.checkbox("Detailseiten je Mitarbeiter (Stunden nach Zweck)", key="pdf_details")
             if st.button("⬇️ PDF-Bericht exportieren"):
-                fig, ax = plt.subplots(figsize=(10, 5))
-                export_summary.plot(kind="bar", x="Mitarbeiter", y=["Intern", "Extern"], ax=ax)
-                ax.set_ylabel("Stunden")
-                ax.set_title("Stunden nach Verrechenbarkeit")
-                fig.tight_layout()
-
-                image_path = "temp_chart.png"
-                fig.savefig(image_path)
-
-                pdf_path = f"history/exports/bericht_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.pdf"
-                doc = SimpleDocTemplate(pdf_path, pagesize=A4)
-                elements = [RLImage(image_path, width=500, height=300), Spacer(1, 12)]
-
-                table_data = [export_summary.columns.tolist()] + export_summary.values.tolist()
-                table = Table(table_data)
-                table.setStyle(
-                    TableStyle(
-                        [
-                            ("BACKGROUND", (0, 0), (-1, 0), colors.grey),
-                            ("GRID", (0, 0), (-1, -1), 1, colors.black),
-                            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                        ]
-                    )
-                )
-                elements.append(table)
-                doc.build(elements)
-
-                with open(pdf_path, "rb") as f:
-                    st.download_button(
-                        "⬇️ PDF-Bericht herunterladen",
-                        data=f.read(),
-                        file_name=os.path.basename(pdf_path),
-                        mime="application/pdf",
-                    )
+                os.makedirs("history/exports", exist_ok=True)
+                # Session-Kennung im Namen: gleichzeitige Exporte verschiedener Nutzer überschreiben sich nicht
+                pdf_path = f"history/exports/bericht_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_{sitzung()}.pdf"
+                # Bericht entsteht im Hintergrund-Thread; die Seite bleibt bedienbar
+                st.session_state["pdf_job"] = {
+                    "pfad": pdf_path,
+                    "zeilen": len(export_summary),
+                    "future": starte_pdf(
+                        export_summary.copy(), pdf_path,
+                        details=detail_tabelle(df) if mit_details else None,
+                    ),
+                }
+            zeige_pdf_job()
+
+            # ---------------------------------------------------
+            # Drill-down (aus dem vorberechneten Zeitwürfel, ohne Rohzeilen)
+            # ---------------------------------------------------
+            st.subheader("🔎 Drill-down nach Zeitraum, Mitarbeiter und Zweck")
+            wuerfel = wuerfel or upload_wuerfel(df)
+            sp1, sp2, sp3 = st.columns(3)
+            zeitraum = sp1.selectbox("Zeitraum", ZEITRAEUME, index=ZEITRAEUME.index("Monat"), key="drill_zeitraum")
+            aufschluesselung = sp2.selectbox("Aufschlüsseln nach", ["Mitarbeiter", "Zweck", "Unterprojekt"],
+                                             key="drill_nach")
+            von = bis = None
+            erster, letzter = wuerfel.zeitspanne
+            if erster is not None:
+                spanne = sp3.date_input("Von – Bis", value=(erster.date(), letzter.date()),
+                                        min_value=erster.date(), max_value=letzter.date(), key="drill_spanne")
+                if isinstance(spanne, (tuple, list)) and len(spanne) == 2:
+                    von, bis = spanne
+            f1, f2 = st.columns(2)
+            ma_filter = f1.multiselect("Mitarbeiter", wuerfel.werte("Mitarbeiter"), key="drill_mitarbeiter")
+            zweck_filter = f2.multiselect("Zweck", wuerfel.werte("Zweck"), key="drill_zweck")
+            filter_args = dict(
+                zeitraum=zeitraum, von=von, bis=bis,
+                mitarbeiter=ma_filter or None, zwecke=zweck_filter or None,
+            )
+
+            verlauf = wuerfel.abfrage(mapping_state(), nach=("Periode", "Verrechenbarkeit"), **filter_args)
+            if verlauf.empty:
+                st.info("Keine Buchungen für diese Auswahl.")
+            else:
+                st.bar_chart(verlauf.pivot_table(index="Periode", columns="Verrechenbarkeit", values="Stunden",
+                                                 aggfunc="sum", fill_value=0.0, observed=True))
+                detail = wuerfel.abfrage(mapping_state(), nach=(aufschluesselung, "Verrechenbarkeit"), **filter_args)
+                tabelle = detail.pivot_table(index=aufschluesselung, columns="Verrechenbarkeit", values="Stunden",
+                                             aggfunc="sum", fill_value=0.0, observed=True)
+                tabelle["Gesamt"] = tabelle.sum(axis=1)
+                st.dataframe(tabelle.sort_values("Gesamt", ascending=False).round(2), use_container_width=True)
+
+# ──────────────────────────────────────────────────────────────────────────────
+# DIAGNOSE (optional in der Sidebar)
+# ──────────────────────────────────────────────────────────────────────────────
+telemetrie_zusammenfassung = telemetrie.beende_lauf(telemetrie_lauf)
+if diagnose:
+    with st.sidebar:
+        zeige_diagnose(telemetrie_zusammenfassung)
@@ -0,0 +1,104 @@
+# bench/fake_openai.py – lokaler Stub für /v1/chat/completions (keine Kosten, reproduzierbar)
+import re
+import json
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_BATCH_ZEILE = re.compile(r"^(\d+): (\".*\")$", re.MULTILINE)
+_EINZEL = re.compile(r'Zweck: "(.*)"')
+_INTERN = re.compile(r"akquise|intern|verwaltung|personal|weiterbildung", re.IGNORECASE)
+
+
+def _kategorie(zweck: str) -> str:
+    return "Intern" if _INTERN.search(zweck) else "Extern"
+
+
+def _antwort(prompt: str) -> str:
+    """Batch-Prompt → JSON mit allen ids, Einzel-Prompt → nur die Kategorie."""
+    zeilen = _BATCH_ZEILE.findall(prompt)
+    if zeilen:
+        ergebnisse = [{"id": int(i), "kategorie": _kategorie(json.loads(z))} for i, z in zeilen]
+        return json.dumps({"ergebnisse": ergebnisse}, ensure_ascii=False)
+    treffer = _EINZEL.search(prompt)
+    return _kategorie(treffer.group(1)) if treffer else "Extern"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _senden(self, status: int, daten: dict, header: dict = None):
+        body = json.dumps(daten).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (header or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        laenge = int(self.headers.get("Content-Length", 0))
+        anfrage = json.loads(self.rfile.read(laenge) or b"{}")
+        server = self.server
+        with server.lock:
+            server.anfragen += 1
+
+        if server.fehlerquote and random.random() < server.fehlerquote:
+            with server.lock:
+                server.fehler += 1
+            self._senden(429, {"error": {"message": "Rate limit (Stub)", "type": "rate_limit"}},
+                         {"retry-after-ms": "20"})
+            return
+
+        time.sleep(server.latenz)
+        prompt = "\n".join(m.get("content") or "" for m in anfrage.get("messages", []))
+        inhalt = _antwort(prompt)
+        prompt_tokens, antwort_tokens = len(prompt) // 4, len(inhalt) // 4
+        self._senden(200, {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": anfrage.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": inhalt}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": antwort_tokens,
+                      "total_tokens": prompt_tokens + antwort_tokens},
+        })
+
+
+def starte_server(latenz: float = 0.05, fehlerquote: float = 0.0, port: int = 0):
+    """
+    Startet den Stub in einem Daemon-Thread. Rückgabe: (server, base_url).
+    latenz: Sekunden pro Antwort; fehlerquote: Anteil 429-Antworten (mit retry-after-ms).
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+    server.daemon_threads = True
+    server.latenz, server.fehlerquote = latenz, fehlerquote
+    server.anfragen, server.fehler = 0, 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def stub_client(base_url: str):
+    """OpenAI-Client gegen den Stub; Retries macht _chat selbst."""
+    from openai import OpenAI
+    return OpenAI(base_url=base_url, api_key="stub", max_retries=0)
+
+
+# ──────────────────────────────
+# Manuell: python -m bench.fake_openai 8765  (dann OPENAI_BASE_URL=http://127.0.0.1:8765/v1)
+# ──────────────────────────────
+if __name__ == "__main__":
+    import sys
+    server, url = starte_server(port=int(sys.argv[1]) if len(sys.argv) > 1 else 8765)
+    print(f"Stub läuft unter {url} – Strg+C beendet")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
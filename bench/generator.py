@@ -0,0 +1,129 @@
+# bench/generator.py – synthetische Zeitdaten, Umsatz- und Abrechnungsdateien für Benchmarks
+import os
+import csv
+
+import numpy as np
+
+INTERN_BASIS = ["Akquise", "Interne Besprechung", "Verwaltung", "Personal", "Weiterbildung"]
+EXTERN_BASIS = ["DGNB Neubau", "LCA Berechnung", "Zertifizierung", "Audit", "Planung", "Ausführung", "LCC Analyse"]
+# Schreibvarianten wie in echten Exporten ("P1 - .1 Akquise", "02_Planung [+]")
+PRAEFIXE = ["", ".1 ", ".2 ", "01_", "02_", "+03_"]
+SUFFIXE = ["", "", " [+]"]
+
+
+def zwecke(anzahl: int, seed: int = 0) -> list:
+    """`anzahl` unterschiedliche Zwecke mit (Zweck, Kategorie); ca. 30 % Intern."""
+    rng = np.random.default_rng(seed)
+    out = []
+    for i in range(anzahl):
+        intern = rng.random() < 0.3
+        basis = rng.choice(INTERN_BASIS if intern else EXTERN_BASIS)
+        out.append((f"{basis} {i}", "Intern" if intern else "Extern"))
+    return out
+
+
+def mitarbeiter(anzahl: int) -> list:
+    return [f"Mitarbeiter {i:03d}" for i in range(anzahl)]
+
+
+def kuerzel(anzahl: int) -> list:
+    return [f"M{i:03d}" for i in range(anzahl)]
+
+
+def erzeuge_zeitdaten(pfad: str, zeilen: int = 50_000, n_mitarbeiter: int = 25, n_unterprojekte: int = 400,
+                      n_zwecke: int = 120, extra_spalten: int = 10, seed: int = 0) -> list:
+    """
+    Schreibt ein Zeitdaten-Workbook wie der Export der Zeiterfassung (Datum, Mitarbeiter,
+    Projekt, Unterprojekt, Stunden, Bemerkung + `extra_spalten` Füllspalten).
+    Rückgabe: Liste (Zweck, Kategorie) der verwendeten Zwecke.
+    """
+    from openpyxl import Workbook
+
+    rng = np.random.default_rng(seed)
+    zweck_liste = zwecke(n_zwecke, seed)
+    # Jedes Unterprojekt trägt einen Zweck in einer zufälligen Schreibvariante
+    unterprojekte = []
+    for i in range(n_unterprojekte):
+        zweck, _ = zweck_liste[i % n_zwecke]
+        unterprojekte.append(f"P{i} - {rng.choice(PRAEFIXE)}{zweck}{rng.choice(SUFFIXE)}")
+    namen = mitarbeiter(n_mitarbeiter)
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Zeitdaten")
+    ws.append(["Datum", "Mitarbeiter", "Projekt", "Unterprojekt", "Stunden", "Bemerkung"]
+              + [f"Feld {k}" for k in range(extra_spalten)])
+
+    tage = np.datetime64("2025-01-01") + rng.integers(0, 365, zeilen).astype("timedelta64[D]")
+    ma = rng.integers(0, n_mitarbeiter, zeilen)
+    up = rng.integers(0, n_unterprojekte, zeilen)
+    stunden = rng.integers(1, 17, zeilen) / 2
+    fuell = rng.integers(0, 1000, (zeilen, extra_spalten)) if extra_spalten else None
+    for i in range(zeilen):
+        zeile = [tage[i].item(), namen[ma[i]], f"Projekt {up[i] % 50}", unterprojekte[up[i]], float(stunden[i]),
+                 "Notiz" if i % 7 == 0 else None]
+        if extra_spalten:
+            zeile += fuell[i].tolist()
+        ws.append(zeile)
+    wb.save(pfad)
+    return zweck_liste
+
+
+def erzeuge_rechnung(pfad: str, n_mitarbeiter: int = 25, seed: int = 0):
+    """Rechnung.xlsx ohne Kopfzeile: A = Kürzel, B = Umsatz."""
+    from openpyxl import Workbook
+
+    rng = np.random.default_rng(seed)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Umsatz")
+    for k in kuerzel(n_mitarbeiter):
+        ws.append([k, float(rng.integers(10_000, 250_000))])
+    wb.save(pfad)
+
+
+def erzeuge_abrechnung(pfad: str, n_mitarbeiter: int = 25, seed: int = 0):
+    """Abrechnungsdatei: 7 Zeilen Vorspann, Kopfzeile in Zeile 8 (PL, Projekt, Einsatztage_SOLL)."""
+    from openpyxl import Workbook
+
+    rng = np.random.default_rng(seed)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Abrechnung")
+    for i in range(7):
+        ws.append([f"Vorspann {i}"] if i % 2 == 0 else [])
+    ws.append(["PL", "Projekt", "Einsatztage_SOLL"])
+    for k in kuerzel(n_mitarbeiter):
+        for p in range(int(rng.integers(1, 6))):
+            ws.append([k, f"Projekt {p}", f"{rng.integers(1, 40)},{rng.integers(0, 10)}"])
+    wb.save(pfad)
+
+
+def erzeuge_stammdaten(ordner: str, zweck_liste: list, n_mitarbeiter: int = 25, neu_anteil: float = 0.1,
+                       seed: int = 0) -> list:
+    """
+    mapping.csv (ohne `neu_anteil` der Zwecke – die gelten als neu) und kuerzel.csv.
+    Rückgabe: die weggelassenen, also neuen Zwecke.
+    """
+    rng = np.random.default_rng(seed)
+    neu_maske = rng.random(len(zweck_liste)) < neu_anteil
+    with open(os.path.join(ordner, "mapping.csv"), "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["Zweck", "Verrechenbarkeit"])
+        w.writerows(z for z, neu in zip(zweck_liste, neu_maske) if not neu)
+    with open(os.path.join(ordner, "kuerzel.csv"), "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["Name", "Kürzel"])
+        w.writerows(zip(mitarbeiter(n_mitarbeiter), kuerzel(n_mitarbeiter)))
+    return [z for (z, _), neu in zip(zweck_liste, neu_maske) if neu]
+
+
+# ──────────────────────────────
+# Manuell: python -m bench.generator zeit.xlsx 100000
+# ──────────────────────────────
+if __name__ == "__main__":
+    import sys
+    import time
+
+    ziel = sys.argv[1] if len(sys.argv) > 1 else "zeitdaten_bench.xlsx"
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 50_000
+    t = time.perf_counter()
+    erzeuge_zeitdaten(ziel, zeilen=n)
+    print(f"{ziel}: {n:,} Zeilen in {time.perf_counter() - t:.1f}s")
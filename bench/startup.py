@@ -0,0 +1,68 @@
+# bench/startup.py – Kaltstart der App messen: python bench/startup.py [--app app.py] [--wiederholungen 5]
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+SCHWERE_MODULE = ("matplotlib", "reportlab", "openai", "pyarrow", "openpyxl")
+SEITEN = ("🏠 Start", "📁 Daten hochladen", "🧠 Zweck-Kategorisierung", "📊 Analyse & Visualisierung")
+
+# Läuft in einem frischen Interpreter: erster Lauf einer Seite + geladene schwere Module
+_MESSUNG = r"""
+import sys, time, json
+from streamlit.testing.v1 import AppTest
+app, seite = sys.argv[1], sys.argv[2]
+t = time.perf_counter()
+at = AppTest.from_file(app, default_timeout=120)
+at.run()
+if seite != at.sidebar.radio[0].value:
+    at.sidebar.radio[0].set_value(seite).run()
+dauer = time.perf_counter() - t
+print(json.dumps({
+    "sekunden": dauer,
+    "fehler": [str(e.value) for e in at.exception],
+    "module": sorted({m.split(".")[0] for m in sys.modules} & set(sys.argv[3].split(","))),
+}))
+"""
+
+
+def miss(app: str, seite: str) -> dict:
+    env = dict(os.environ)
+    env.pop("OPENAI_API_KEY", None)
+    env["PYTHONPATH"] = os.path.dirname(os.path.abspath(app)) + os.pathsep + env.get("PYTHONPATH", "")
+    out = subprocess.run(
+        [sys.executable, "-c", _MESSUNG, os.path.abspath(app), seite, ",".join(SCHWERE_MODULE)],
+        capture_output=True, text=True, env=env, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Kaltstart je Seite (frischer Prozess pro Messung)")
+    parser.add_argument("--app", default=os.path.join(os.path.dirname(__file__), "..", "app.py"))
+    parser.add_argument("--wiederholungen", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="Ergebnis als JSON ausgeben")
+    args = parser.parse_args(argv)
+
+    ergebnisse = {}
+    for seite in SEITEN:
+        laeufe = [miss(args.app, seite) for _ in range(args.wiederholungen)]
+        ergebnisse[seite] = {
+            "median_s": round(statistics.median(l["sekunden"] for l in laeufe), 3),
+            "module": laeufe[-1]["module"],
+            "fehler": laeufe[-1]["fehler"],
+        }
+
+    if args.json:
+        print(json.dumps(ergebnisse, ensure_ascii=False, indent=2))
+    else:
+        for seite, r in ergebnisse.items():
+            print(f"{seite:<30} {r['median_s']:>7.3f}s  {', '.join(r['module']) or '–'}"
+                  + (f"  FEHLER: {r['fehler'][0]}" if r["fehler"] else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+# bench/suite.py – Laufzeit je Pipeline-Stufe: python -m bench.suite [--zeilen 100000] [--ausgabe bench.json]
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+
+import pandas as pd
+
+from bench.fake_openai import starte_server, stub_client
+from bench.generator import erzeuge_abrechnung, erzeuge_rechnung, erzeuge_stammdaten, erzeuge_zeitdaten
+
+
+def _messe(fn, wiederholungen: int, vorbereitung=None) -> dict:
+    """Führt fn `wiederholungen` mal aus (vorbereitung läuft ungemessen davor). Rückgabe: Statistik + letztes Ergebnis."""
+    laeufe, ergebnis = [], None
+    for _ in range(wiederholungen):
+        arg = vorbereitung() if vorbereitung else None
+        t = time.perf_counter()
+        ergebnis = fn(arg) if vorbereitung else fn()
+        laeufe.append(time.perf_counter() - t)
+    return {
+        "median_s": round(statistics.median(laeufe), 4),
+        "min_s": round(min(laeufe), 4),
+        "laeufe": [round(x, 4) for x in laeufe],
+    }, ergebnis
+
+
+def _git_stand() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unbekannt"
+
+
+def lauf(args) -> dict:
+    ordner = tempfile.mkdtemp(prefix="bench_")
+    try:
+        return _lauf(args, ordner)
+    finally:
+        shutil.rmtree(ordner, ignore_errors=True)
+
+
+def _lauf(args, ordner: str) -> dict:
+    from utils.aggregation import StundenAggregat, zusammenfassung
+    from utils.bericht import detail_tabelle, erstelle_pdf
+    from utils.gpt import KlassifikationsEngine
+    from utils.processing import kompaktiere_zeitdaten, lade_zeitdaten, leite_spalten_ab, wende_mapping_an
+    from utils.rechnung import lade_rechnung, read_abrechnung
+    from utils.stammdaten import StammdatenStore, lade_mapping_csv
+    from utils.wuerfel import ZeitWuerfel, baue_wuerfel
+
+    zeit_pfad = os.path.join(ordner, "zeitdaten.xlsx")
+    t = time.perf_counter()
+    zweck_liste = erzeuge_zeitdaten(zeit_pfad, args.zeilen, args.mitarbeiter, args.unterprojekte, args.zwecke,
+                                    args.extra_spalten, args.seed)
+    erzeuge_rechnung(os.path.join(ordner, "Rechnung.xlsx"), args.mitarbeiter, args.seed)
+    erzeuge_abrechnung(os.path.join(ordner, "Abrechnung.xlsx"), args.mitarbeiter, args.seed)
+    neue = erzeuge_stammdaten(ordner, zweck_liste, args.mitarbeiter, args.neu_anteil, args.seed)
+    print(f"Testdaten in {time.perf_counter() - t:.1f}s erzeugt ({ordner})", file=sys.stderr)
+
+    with open(zeit_pfad, "rb") as f:
+        daten = f.read()
+    mapping_df = lade_mapping_csv(os.path.join(ordner, "mapping.csv"))
+    w = args.wiederholungen
+    stufen = {}
+
+    # load_excel: erster Upload (Parsen + Arrow-Cache schreiben) und Wiederholung (Cache-Treffer)
+    stufen["load_excel_kalt"], _ = _messe(lambda d: lade_zeitdaten(daten, cache_dir=d), w, lambda: tempfile.mkdtemp(dir=ordner))
+    cache_dir = tempfile.mkdtemp(dir=ordner)
+    lade_zeitdaten(daten, cache_dir=cache_dir)
+    stufen["load_excel_cache"], roh = _messe(lambda: lade_zeitdaten(daten, cache_dir=cache_dir), w)
+
+    stufen["zweck_extraktion"], df = _messe(leite_spalten_ab, w, lambda: roh.copy())
+    stufen["session_schema"], df = _messe(lambda: kompaktiere_zeitdaten(df), w)
+    stufen["mapping_merge"], df = _messe(lambda: wende_mapping_an(df, mapping_df), w)
+
+    # Zeitwürfel: Aufbau beim Upload, danach Drill-down nur auf dem Würfel
+    abgeleitet = leite_spalten_ab(roh.copy())
+    stufen["wuerfel_aufbau"], wuerfel = _messe(lambda: ZeitWuerfel(baue_wuerfel(abgeleitet)), w)
+    stufen["wuerfel_abfrage"], _ = _messe(
+        lambda: wuerfel.abfrage(mapping_df, "Woche", nach=("Periode", "Mitarbeiter", "Verrechenbarkeit")), w)
+
+    def pivot():
+        return zusammenfassung(StundenAggregat(df).pivot_fuer(mapping_df))
+    stufen["pivot"], summary = _messe(pivot, w)
+
+    # Mapping-Änderung: nur ein Zweck wird umgebucht
+    aggregat = StundenAggregat(df)
+    aggregat.pivot_fuer(mapping_df)
+    geaendert = mapping_df.copy()
+    geaendert.iloc[0, 1] = "Extern" if geaendert.iloc[0, 1] == "Intern" else "Intern"
+    wechsel = itertools.cycle([geaendert, mapping_df])
+    stufen["pivot_umbuchung"], _ = _messe(aggregat.pivot_fuer, w, lambda: next(wechsel))
+
+    # Mapping speichern: eine geänderte Zeile als Upsert in die Stammdaten-DB
+    stammdaten = StammdatenStore(os.path.join(ordner, "stammdaten.sqlite"),
+                                 {"mapping": os.path.join(ordner, "mapping.csv"), "kuerzel": None})
+    zweck = mapping_df["Zweck"].iat[0]
+    kategorien = itertools.cycle(["Extern", "Intern"])
+    stufen["mapping_upsert"], _ = _messe(lambda: stammdaten.aendere("mapping", {zweck: next(kategorien)}), w)
+
+    stufen["lade_rechnung"], _ = _messe(lambda: lade_rechnung(os.path.join(ordner, "Rechnung.xlsx")), w)
+    stufen["read_abrechnung"], _ = _messe(lambda: read_abrechnung(os.path.join(ordner, "Abrechnung.xlsx")), w)
+
+    stufen["pdf"], pdf = _messe(lambda: erstelle_pdf(summary), w)
+    details = detail_tabelle(df)
+    stufen["pdf_details"], _ = _messe(lambda: erstelle_pdf(summary, details=details), w)
+
+    # GPT-Klassifikation der neuen Zwecke gegen den lokalen Stub (ohne Cache)
+    server, url = starte_server(latenz=args.gpt_latenz, fehlerquote=args.gpt_fehlerquote)
+    try:
+        engine = KlassifikationsEngine(client=stub_client(url), cache=False, rpm=100_000, tpm=100_000_000)
+        stufen["gpt_klassifikation"], gpt = _messe(lambda: engine.klassifiziere(neue)[0], w)
+    finally:
+        server.shutdown()
+
+    return {
+        "meta": {
+            "git": _git_stand(),
+            "zeitpunkt": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "plattform": platform.platform(),
+        },
+        "parameter": {k: v for k, v in vars(args).items() if k not in ("ausgabe", "vergleich")},
+        "umfang": {
+            "zeilen": len(df),
+            "mitarbeiter": int(df["Mitarbeiter"].nunique()),
+            "zwecke": int(df["Zweck"].nunique()),
+            "neue_zwecke": len(neue),
+            "gpt_requests": server.anfragen,
+            "gpt_429": server.fehler,
+            "gpt_klassifiziert": sum(1 for k in gpt.values() if k in ("Intern", "Extern")),
+            "pdf_kib": round(len(pdf) / 1024, 1),
+        },
+        "stufen": stufen,
+    }
+
+
+def vergleiche(neu: dict, alt: dict, schwelle: float) -> list:
+    """Stufen, die gegenüber `alt` um mehr als `schwelle` (relativ) langsamer sind."""
+    regressionen = []
+    if alt.get("parameter") != neu["parameter"]:
+        print("⚠️ Parameter weichen vom Vergleichslauf ab – Zeiten nur bedingt vergleichbar", file=sys.stderr)
+    for stufe, werte in neu["stufen"].items():
+        vorher = alt.get("stufen", {}).get(stufe)
+        if not vorher or not vorher["median_s"]:
+            continue
+        faktor = werte["median_s"] / vorher["median_s"]
+        markierung = "  ← langsamer" if faktor > 1 + schwelle else ""
+        print(f"{stufe:<20} {vorher['median_s']:>8.3f}s → {werte['median_s']:>8.3f}s  ({faktor - 1:+.0%}){markierung}", file=sys.stderr)
+        if markierung:
+            regressionen.append(stufe)
+    return regressionen
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark der Pipeline-Stufen mit synthetischen Daten")
+    parser.add_argument("--zeilen", type=int, default=50_000)
+    parser.add_argument("--mitarbeiter", type=int, default=25)
+    parser.add_argument("--unterprojekte", type=int, default=400)
+    parser.add_argument("--zwecke", type=int, default=120)
+    parser.add_argument("--extra-spalten", type=int, default=10, help="Füllspalten im Export")
+    parser.add_argument("--neu-anteil", type=float, default=0.2, help="Anteil Zwecke, die nicht im Mapping stehen")
+    parser.add_argument("--gpt-latenz", type=float, default=0.05, help="Sekunden pro Stub-Antwort")
+    parser.add_argument("--gpt-fehlerquote", type=float, default=0.0, help="Anteil 429-Antworten des Stubs")
+    parser.add_argument("--wiederholungen", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ausgabe", help="JSON-Datei für die Ergebnisse (sonst stdout)")
+    parser.add_argument("--vergleich", help="frühere JSON-Ausgabe; meldet Regressionen")
+    parser.add_argument("--schwelle", type=float, default=0.2, help="Regressionsschwelle (0.2 = 20 %%)")
+    args = parser.parse_args(argv)
+
+    ergebnis = lauf(args)
+    text = json.dumps(ergebnis, ensure_ascii=False, indent=2)
+    if args.ausgabe:
+        with open(args.ausgabe, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.vergleich:
+        with open(args.vergleich, encoding="utf-8") as f:
+            regressionen = vergleiche(ergebnis, json.load(f), args.schwelle)
+        return 1 if regressionen else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+# cli.py – Monatsbericht ohne Browser: python cli.py zeitdaten/*.xlsx --pdf
+import os
+import sys
+import time
+import argparse
+
+from utils import telemetrie
+from utils.pipeline import EXPORT_DIR, exportiere, lauf
+from utils.rechnung import RECHNUNG_DIR, lade_rechnung
+from utils.stammdaten import (
+    DB_PFAD, aendere_mapping, lade_csv, lade_kuerzel, lade_mapping, registriere_mitarbeitende, store,
+)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Zeitdaten einlesen → klassifizieren → aggregieren → exportieren")
+    parser.add_argument("dateien", nargs="+", help="Zeitdaten-Workbooks (.xlsx)")
+    parser.add_argument("--ausgabe", default=EXPORT_DIR, help=f"Zielordner (Standard: {EXPORT_DIR})")
+    parser.add_argument("--name", help="Dateiname ohne Endung (Standard: bericht_<Zeitstempel>)")
+    parser.add_argument("--pdf", action="store_true", help="zusätzlich PDF-Bericht erzeugen")
+    parser.add_argument("--details", action="store_true", help="PDF mit Detailseite je Mitarbeiter")
+    parser.add_argument("--ohne-ki", action="store_true", help="keine KI-Aufrufe; unsichere Zwecke bleiben offen")
+    parser.add_argument("--stammdaten", default=DB_PFAD, help=f"Stammdaten-DB (Standard: {DB_PFAD})")
+    parser.add_argument("--mapping", help="Mapping-CSV vorher importieren (mit --nicht-speichern: nur verwenden)")
+    parser.add_argument("--kuerzel", help="Kürzel-CSV vorher importieren (mit --nicht-speichern: nur verwenden)")
+    parser.add_argument("--csv-export", metavar="ORDNER", help="mapping.csv und kuerzel.csv nach dem Lauf dorthin schreiben")
+    parser.add_argument("--rechnung", default=RECHNUNG_DIR, help="Umsatzdatei oder Ordner mit Rechnung_JJJJ-MM.xlsx")
+    parser.add_argument("--perioden", nargs="+", metavar="JJJJ-MM", help="nur diese Umsatz-Perioden (Standard: alle)")
+    parser.add_argument("--nicht-speichern", action="store_true", help="Mapping/Kürzel nicht zurückschreiben")
+    parser.add_argument("--profil", action="store_true", help="Laufzeit je Stufe und GPT-Nutzung ausgeben")
+    args = parser.parse_args(argv)
+
+    fehlend = [p for p in args.dateien if not os.path.exists(p)]
+    if fehlend:
+        parser.error(f"Datei(en) nicht gefunden: {', '.join(fehlend)}")
+
+    with telemetrie.lauf("cli") as lauf:
+        code = _ausfuehren(args)
+    if args.profil:
+        zusammenfassung = lauf.zusammenfassung()
+        for name, s in sorted(zusammenfassung["stufen"].items(), key=lambda kv: -kv[1]["ms"]):
+            print(f"  {name:<22} {s['ms']:>10.1f} ms  ({s['anzahl']}×)", file=sys.stderr)
+        gpt = zusammenfassung["gpt"]
+        print(f"  GPT: {gpt['aufrufe']} Aufrufe, {gpt['retries']} Retries, "
+              f"{gpt['prompt_tokens'] + gpt['completion_tokens']} Tokens", file=sys.stderr)
+    return code
+
+
+def _ausfuehren(args) -> int:
+    start = time.perf_counter()
+    stammdaten = store(args.stammdaten)
+    for tabelle, pfad in (("mapping", args.mapping), ("kuerzel", args.kuerzel)):
+        if pfad and not args.nicht_speichern:
+            stammdaten.importiere_csv(tabelle, pfad)
+    # Mit Herkunft, damit das lokale Modell geratene Zeilen nicht als Label lernt
+    mapping_df = (lade_csv("mapping", args.mapping) if args.mapping and args.nicht_speichern
+                  else lade_mapping(args.stammdaten, herkunft=True))
+    kuerzel_df = lade_csv("kuerzel", args.kuerzel) if args.kuerzel and args.nicht_speichern else lade_kuerzel(args.stammdaten)
+    try:
+        df, mapping_neu, export_summary, statistik = lauf(
+            args.dateien, mapping_df, ki=not args.ohne_ki,
+            kuerzel_df=kuerzel_df, rechnung_df=lade_rechnung(args.rechnung, args.perioden),
+        )
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+
+    print(f"{len(df):,} Zeilen aus {len(args.dateien)} Datei(en)".replace(",", "."))
+    if statistik:
+        print(
+            f"Neue Zwecke: {statistik['index']} ähnlich, {statistik['lokal']} lokal, "
+            f"{statistik['gpt']} KI, {statistik['offen']} offen"
+        )
+        if statistik["fehler"]:
+            print(f"⚠️ Klassifikation: {statistik['fehler']}", file=sys.stderr)
+
+    if not args.nicht_speichern:
+        # Nur die neu klassifizierten Zwecke schreiben, bestehende Zeilen bleiben unangetastet
+        bekannt = set(mapping_df["Zweck"])
+        # Unsichere Zwecke (leer) nicht speichern – sonst gelten sie als bekannt und erreichen die KI nie
+        neue_zeilen = mapping_neu[~mapping_neu["Zweck"].isin(bekannt) & (mapping_neu["Verrechenbarkeit"] != "")]
+        aendere_mapping(dict(zip(neue_zeilen["Zweck"], neue_zeilen["Verrechenbarkeit"])), path=args.stammdaten,
+                        quelle="cli", herkunft=dict(zip(neue_zeilen["Zweck"], neue_zeilen["Herkunft"])))
+        neu = registriere_mitarbeitende(df["Mitarbeiter"].cat.categories, path=args.stammdaten, quelle="cli")
+        if neu:
+            print(f"{len(neu)} neue Mitarbeitende in der Kürzel-Tabelle (ohne Kürzel)")
+        if args.csv_export:
+            os.makedirs(args.csv_export, exist_ok=True)
+            for tabelle in ("mapping", "kuerzel"):
+                print(f"→ {stammdaten.exportiere_csv(tabelle, os.path.join(args.csv_export, f'{tabelle}.csv'))}")
+
+    formate = ("csv", "pdf") if args.pdf else ("csv",)
+    details = None
+    if args.pdf and args.details:
+        from utils.bericht import detail_tabelle
+        details = detail_tabelle(df)
+    for pfad in exportiere(export_summary, args.ausgabe, formate, args.name, details):
+        print(f"→ {pfad}")
+    print(f"Fertig in {time.perf_counter() - start:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
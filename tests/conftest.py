@@ -0,0 +1,30 @@
+import pytest
+
+from bench.fake_openai import starte_server, stub_client
+
+
+class AufzeichnenderClient:
+    """OpenAI-Client gegen den Stub, der jede Anfrage mitschreibt; `antwort` darf die Antwort umschreiben."""
+
+    def __init__(self, url: str, antwort=None):
+        self._client = stub_client(url)
+        self._antwort = antwort
+        self.prompts = []
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        prompt = kwargs["messages"][-1]["content"]
+        self.prompts.append(prompt)
+        r = self._client.chat.completions.create(**kwargs)
+        if self._antwort:
+            r.choices[0].message.content = self._antwort(len(self.prompts), prompt, r.choices[0].message.content)
+        return r
+
+
+@pytest.fixture(scope="module")
+def stub():
+    """Lokaler OpenAI-Stub (bench/fake_openai.py). Rückgabe: (server, base_url)."""
+    server, url = starte_server(latenz=0.0)
+    yield server, url
+    server.shutdown()
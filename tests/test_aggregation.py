@@ -0,0 +1,58 @@
+import pandas as pd
+
+from utils.aggregation import StundenAggregat
+
+
+def _zeiten():
+    return pd.DataFrame({
+        "Zweck": ["Akquise", "Akquise", "Audit", "Planung", "Planung", "Urlaub"],
+        "Mitarbeiter": ["Anna", "Ben", "Anna", "Ben", "Anna", "Ben"],
+        "Dauer": [1.5, 2.0, 3.0, 4.0, 0.5, 8.0],
+    })
+
+
+def _mapping(**labels):
+    return pd.DataFrame({"Zweck": list(labels), "Verrechenbarkeit": list(labels.values())})
+
+
+class _LocProtokoll:
+    """Stellt `basis` bereit und merkt sich, welche Zwecke über .loc gelesen werden."""
+    def __init__(self, basis):
+        self._basis = basis
+        self.index = basis.index
+        self.gelesen = []
+
+    @property
+    def loc(self):
+        return self
+
+    def __getitem__(self, zweck):
+        self.gelesen.append(zweck)
+        return self._basis.loc[zweck]
+
+
+def test_umbuchen_nur_geaenderte_zwecke():
+    aggregat = StundenAggregat(_zeiten())
+    aggregat.pivot_fuer(_mapping(Akquise="Intern", Audit="Extern", Planung="Extern", Urlaub="Intern"))
+
+    protokoll = _LocProtokoll(aggregat.basis)
+    aggregat.basis = protokoll
+    neu = _mapping(Akquise="Intern", Audit="Intern", Planung="Extern")
+    pivot = aggregat.pivot_fuer(neu)
+
+    # Audit wechselt die Kategorie, Urlaub fällt aus dem Mapping – der Rest bleibt liegen
+    assert sorted(protokoll.gelesen) == ["Audit", "Urlaub"]
+    erwartet = StundenAggregat(_zeiten()).pivot_fuer(neu)
+    pd.testing.assert_frame_equal(pivot, erwartet)
+    assert pivot.loc["Anna"].to_dict() == {"Intern": 4.5, "Extern": 0.5}
+
+
+def test_gleiches_mapping_rechnet_nicht_neu():
+    aggregat = StundenAggregat(_zeiten())
+    mapping = _mapping(Akquise="Intern", Audit="Extern")
+    erst = aggregat.pivot_fuer(mapping)
+
+    protokoll = _LocProtokoll(aggregat.basis)
+    aggregat.basis = protokoll
+    pd.testing.assert_frame_equal(aggregat.pivot_fuer(mapping.copy()), erst)
+    assert protokoll.gelesen == []
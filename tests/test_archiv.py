@@ -0,0 +1,54 @@
+import json
+import os
+
+import pandas as pd
+
+from utils.archiv import ALT_MANIFEST, UploadArchiv
+from utils.processing import datei_hash
+
+
+def _archiv(tmp_path):
+    return UploadArchiv(str(tmp_path / "uploads"), cache_dir=str(tmp_path / "cache"))
+
+
+def test_gleicher_inhalt_liegt_nur_einmal(tmp_path):
+    a = _archiv(tmp_path)
+    df = pd.DataFrame({"Datum": pd.to_datetime(["2024-01-31", "2024-03-01"])})
+
+    erst, neu = a.archiviere(b"zeitdaten", df)
+    assert neu and erst["anzahl"] == 1
+    assert (erst["periode_von"], erst["periode_bis"], erst["zeilen"]) == ("2024-01", "2024-03", 2)
+
+    zweit, neu = a.archiviere(b"zeitdaten")
+    assert not neu
+    assert zweit["anzahl"] == 2 and zweit["name"] == erst["name"]
+    assert os.listdir(a.objekte) == [f"{datei_hash(b'zeitdaten')}.xlsx"]
+    assert a.lese(erst["name"]) == b"zeitdaten"
+
+    a.archiviere(b"andere zeitdaten")
+    assert a.seite()[1] == 2
+    assert [e["name"] for e in a.fuer_periode("2024-02")] == [erst["name"]]
+
+
+def test_altbestand_wird_uebernommen(tmp_path):
+    ordner = tmp_path / "uploads"
+    ordner.mkdir()
+    for name, daten in (("upload_2024-01-01_10-00-00.xlsx", b"a"), ("upload_2024-02-01_10-00-00.xlsx", b"b"),
+                        ("upload_2024-03-01_10-00-00.xlsx", b"a")):
+        (ordner / name).write_bytes(daten)
+    os.utime(ordner / "upload_2024-03-01_10-00-00.xlsx", (2_000_000_000, 2_000_000_000))
+    (ordner / ALT_MANIFEST).write_text(json.dumps({"upload_2024-02-01_10-00-00.xlsx": {"zeilen": 7}}))
+
+    a = _archiv(tmp_path)
+
+    # Der alte Ordner ist leer geräumt, doppelte Inhalte sind zusammengelegt
+    assert list(ordner.glob("*.xlsx")) == [] and not (ordner / ALT_MANIFEST).exists()
+    eintraege = {e["sha256"]: e for e in a.seite()[0]}
+    assert set(eintraege) == {datei_hash(b"a"), datei_hash(b"b")}
+    assert eintraege[datei_hash(b"a")]["anzahl"] == 2
+    assert eintraege[datei_hash(b"a")]["zuletzt"].startswith("2033-")
+    assert eintraege[datei_hash(b"b")]["zeilen"] == 7
+    assert a.lese(eintraege[datei_hash(b"a")]["name"]) == b"a"
+
+    # Zweites Öffnen findet nichts mehr zu übernehmen
+    assert _archiv(tmp_path).seite()[1] == 2
@@ -0,0 +1,54 @@
+import pandas as pd
+
+from utils.datenspeicher import DatenSpeicher, _mit_vorkommen
+
+
+def _buchungen(*zeilen):
+    return pd.DataFrame(zeilen, columns=["Datum", "Mitarbeiter", "Unterprojekt", "Zweck", "Dauer"]).astype(
+        {"Datum": "datetime64[ns]", "Dauer": "float32"}
+    )
+
+
+def test_vorkommen_nummeriert_gleiche_buchungen():
+    df = _buchungen(
+        ("2024-01-08", "Anna", "P1", "Akquise", 2.0),
+        ("2024-01-08", "Anna", "P1", "Akquise", 2.0),
+        ("2024-01-09", "Anna", "P1", "Akquise", 2.0),
+    )
+    assert _mit_vorkommen(df)["_vorkommen"].tolist() == [0, 1, 0]
+
+
+def test_ueberlappende_exporte_werden_dedupliziert(tmp_path):
+    speicher = DatenSpeicher(str(tmp_path))
+    januar = _buchungen(
+        ("2024-01-08", "Anna", "P1", "Akquise", 2.0),
+        ("2024-01-08", "Anna", "P1", "Akquise", 2.0),  # echte Doppelbuchung
+        ("2024-01-31", "Ben", "P2", "Audit", 4.0),
+    )
+    bis_februar = _buchungen(
+        ("2024-01-08", "Anna", "P1", "Akquise", 2.0),
+        ("2024-01-08", "Anna", "P1", "Akquise", 2.0),
+        ("2024-01-31", "Ben", "P2", "Audit", 4.0),
+        ("2024-02-01", "Ben", "P2", "Audit", 1.0),
+    )
+
+    assert speicher.schreibe(januar, "a" * 64) == {"2024-01": 3}
+    assert speicher.schreibe(bis_februar, "b" * 64) == {"2024-01": 0, "2024-02": 1}
+    assert speicher.partitionen() == ["2024-02", "2024-01"]
+
+    df = speicher.lese(["2024-01", "2024-02"])
+    assert len(df) == 4
+    assert "_vorkommen" not in df.columns
+    assert len(speicher.lese(["2024-02"])) == 1
+
+
+def test_zeilen_ohne_datum_landen_in_upload_partition(tmp_path):
+    speicher = DatenSpeicher(str(tmp_path))
+    df = _buchungen(
+        (None, "Anna", "P1", "Akquise", 2.0),
+        ("2024-03-04", "Anna", "P1", "Akquise", 2.0),
+    )
+    quelle = "0123456789abcdef" * 4
+
+    assert speicher.schreibe(df, quelle) == {"upload-0123456789ab": 1, "2024-03": 1}
+    assert sorted(speicher.partitionen()) == ["2024-03", "upload-0123456789ab"]
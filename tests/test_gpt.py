@@ -0,0 +1,128 @@
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from bench.fake_openai import starte_server
+from tests.conftest import AufzeichnenderClient
+from utils import gpt
+from utils.gpt import KlassifikationsEngine, RateLimiter, TokenBucket, _backoff, _parse_batch_antwort, _retry_after
+
+
+def _engine(client, **kwargs):
+    return KlassifikationsEngine(client=client, cache=False, rpm=100_000, tpm=100_000_000, **kwargs)
+
+
+def test_parse_batch_antwort_nur_gueltige_eintraege():
+    ans = json.dumps({"ergebnisse": [
+        {"id": 1, "kategorie": "Intern"},
+        {"id": "2", "kategorie": " extern "},
+        {"id": 3, "kategorie": "Vielleicht"},
+        {"id": 9, "kategorie": "Intern"},
+        {"kategorie": "Extern"},
+        "kaputt",
+    ]})
+    assert _parse_batch_antwort(ans, {1, 2, 3}) == {1: "Intern", 2: "Extern"}
+    # Liste statt Objekt ist ebenfalls erlaubt
+    assert _parse_batch_antwort('[{"id": 1, "kategorie": "Extern"}]', {1}) == {1: "Extern"}
+    assert _parse_batch_antwort("kein JSON", {1}) == {}
+    assert _parse_batch_antwort('{"ergebnisse": "x"}', {1}) == {}
+
+
+def test_fehlende_antworten_werden_gezielt_nachgefragt(stub):
+    _, url = stub
+
+    def erste_antwort_ohne_id_2(nummer, prompt, inhalt):
+        if nummer > 1:
+            return inhalt
+        daten = json.loads(inhalt)
+        daten["ergebnisse"] = [e for e in daten["ergebnisse"] if e["id"] != 2]
+        return json.dumps(daten)
+
+    client = AufzeichnenderClient(url, erste_antwort_ohne_id_2)
+    ergebnis, fehler = _engine(client).klassifiziere(["Akquise", "DGNB Nachweis", "Interne Besprechung"])
+
+    assert ergebnis == {"Akquise": "Intern", "DGNB Nachweis": "Extern", "Interne Besprechung": "Intern"}
+    assert fehler == {}
+    assert len(client.prompts) == 2
+    # Zweite Runde fragt nur den fehlenden Zweck nach
+    assert '1: "DGNB Nachweis"' in client.prompts[1] and '"Akquise"' not in client.prompts[1]
+
+
+def test_token_bucket_wartet_erst_nach_verbrauchter_kapazitaet():
+    bucket = TokenBucket(rate_pro_minute=60, kapazitaet=2)
+    assert bucket.wartezeit(1) == 0.0
+    assert bucket.wartezeit(1) == 0.0
+    assert bucket.wartezeit(1) == pytest.approx(1.0, abs=0.05)
+    # Mehr als die Kapazität wird auf die Kapazität begrenzt statt ewig zu warten
+    assert TokenBucket(rate_pro_minute=60, kapazitaet=2).wartezeit(100) == 0.0
+
+
+def test_retry_after_und_backoff():
+    fehler = SimpleNamespace(response=SimpleNamespace(headers={"retry-after-ms": "250"}))
+    assert _retry_after(fehler) == 0.25
+    assert _retry_after(SimpleNamespace(response=SimpleNamespace(headers={"retry-after": "3"}))) == 3.0
+    assert _retry_after(ValueError("ohne Response")) is None
+    assert 3.0 <= _backoff(0, retry_after=3.0) <= 3.5
+    assert all(0 <= _backoff(v) <= 30.0 for v in range(10))
+
+
+def test_429_mit_retry_after_pausiert_alle_threads(monkeypatch):
+    monkeypatch.setattr(gpt.random, "uniform", lambda a, b: 0.0)
+    server, url = starte_server(latenz=0.0, fehlerquote=1.0)
+    try:
+        limiter = RateLimiter(rpm=100_000, tpm=100_000_000)
+        with pytest.raises(Exception):
+            gpt._chat([{"role": "user", "content": "x"}], client=AufzeichnenderClient(url), limiter=limiter)
+        assert server.anfragen == 3
+        # retry-after-ms: 20 aus dem Stub → gemeinsame Pause des Limiters
+        assert limiter.pause_bis > 0
+    finally:
+        server.shutdown()
+
+
+def test_engine_ohne_parallel_haelt_hoechstens_einen_request_offen(stub):
+    _, url = stub
+    laufend, spitze, lock = [0], [0], threading.Lock()
+
+    class ZaehlenderClient(AufzeichnenderClient):
+        def create(self, **kwargs):
+            with lock:
+                laufend[0] += 1
+                spitze[0] = max(spitze[0], laufend[0])
+            time.sleep(0.01)
+            try:
+                # Batch-Antworten leer → alle Zwecke gehen in den Einzel-Fallback
+                return super().create(**kwargs)
+            finally:
+                with lock:
+                    laufend[0] -= 1
+
+    client = ZaehlenderClient(url, lambda n, prompt, inhalt: "{}" if "ergebnisse" in prompt else inhalt)
+    zwecke = [f"Projekt {i}" for i in range(6)]
+    ergebnis, _ = _engine(client, max_parallel=4).klassifiziere(zwecke, batch_size=2, max_runden=1, parallel=False)
+    assert len(ergebnis) == 6
+    assert spitze[0] == 1
+
+    spitze[0] = 0
+    _engine(client, max_parallel=4).klassifiziere(zwecke, batch_size=2, max_runden=1)
+    assert 1 < spitze[0] <= 4
+
+
+def test_einzelner_fehler_kostet_nur_seinen_zweck(stub, monkeypatch):
+    monkeypatch.setattr(gpt.random, "uniform", lambda a, b: 0.0)
+    _, url = stub
+
+    class Client(AufzeichnenderClient):
+        def create(self, **kwargs):
+            if 'Zweck: "kaputt"' in kwargs["messages"][-1]["content"]:
+                raise ConnectionError("Verbindung abgebrochen")
+            return super().create(**kwargs)
+
+    # Erste Antwort ohne Ergebnisse → alle Zwecke einzeln; "kaputt" scheitert dort endgültig
+    client = Client(url, lambda n, prompt, inhalt: "{}" if "ergebnisse" in prompt else inhalt)
+    ergebnis, fehler = _engine(client).klassifiziere(["Akquise", "kaputt", "DGNB Nachweis"], max_runden=1)
+    assert ergebnis == {"Akquise": "Intern", "DGNB Nachweis": "Extern"}
+    assert list(fehler) == ["kaputt"] and "Verbindung abgebrochen" in fehler["kaputt"]
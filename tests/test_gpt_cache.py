@@ -0,0 +1,49 @@
+from tests.conftest import AufzeichnenderClient
+from utils.gpt import PROMPT_VERSION, KlassifikationsEngine
+from utils.gpt_cache import KlassifikationsCache, prompt_version
+
+
+def test_treffer_fehlschlaege_und_normalisierung(tmp_path):
+    cache = KlassifikationsCache(str(tmp_path / "cache.sqlite"))
+    cache.speichere({"DGNB  Nachweis": "Extern", "Akquise": "Intern"}, "v1")
+
+    assert cache.hole(["dgnb nachweis", " AKQUISE ", "Neu"], "v1") == {"dgnb nachweis": "Extern", " AKQUISE ": "Intern"}
+    assert (cache.treffer, cache.fehlschlaege) == (2, 1)
+
+
+def test_unbekannt_wird_nie_gecacht(tmp_path):
+    cache = KlassifikationsCache(str(tmp_path / "cache.sqlite"))
+    cache.speichere({"Unklar": "Unbekannt", "Leer": ""}, "v1")
+    assert cache.hole(["Unklar", "Leer"], "v1") == {}
+    assert cache.statistik()["versionen"] == {}
+
+
+def test_versionen_getrennt_und_invalidierbar(tmp_path):
+    cache = KlassifikationsCache(str(tmp_path / "cache.sqlite"))
+    alt, neu = prompt_version("Prompt A", "gpt-4o-mini"), prompt_version("Prompt B", "gpt-4o-mini")
+    assert alt != neu
+    cache.speichere({"Akquise": "Intern"}, alt)
+    cache.speichere({"Akquise": "Extern", "Audit": "Extern"}, neu)
+
+    assert cache.hole(["Akquise"], alt) == {"Akquise": "Intern"}
+    assert cache.hole(["Akquise"], neu) == {"Akquise": "Extern"}
+    assert cache.invalidiere(ausser_version=neu) == 1
+    assert cache.statistik()["versionen"] == {neu: 2}
+    assert cache.invalidiere(zwecke=["AUDIT"]) == 1
+
+
+def test_engine_fragt_gecachte_zwecke_nicht_erneut(tmp_path, stub):
+    _, url = stub
+    cache = KlassifikationsCache(str(tmp_path / "cache.sqlite"))
+    client = AufzeichnenderClient(url)
+    engine = KlassifikationsEngine(client=client, cache=cache, rpm=100_000, tpm=100_000_000)
+
+    erst, _ = engine.klassifiziere(["Akquise", "DGNB Nachweis"])
+    assert len(client.prompts) == 1
+    assert cache.hole(["Akquise", "DGNB Nachweis"], PROMPT_VERSION) == erst
+
+    zweit, _ = engine.klassifiziere(["akquise", "DGNB Nachweis", "Audit"])
+    assert zweit == {"akquise": "Intern", "DGNB Nachweis": "Extern", "Audit": "Extern"}
+    # Nur der neue Zweck geht noch an die KI
+    assert len(client.prompts) == 2
+    assert '1: "Audit"' in client.prompts[1] and '"DGNB Nachweis"' not in client.prompts[1]
@@ -0,0 +1,17 @@
+import os
+
+from utils.historie import HistorienIndex
+
+
+def test_seite_neueste_zuerst_nach_zeitstempel(tmp_path):
+    index = HistorienIndex(str(tmp_path))
+    for i, name in enumerate(["bericht_2025-03-01.csv", "Rechnung_2024-12.xlsx", "export.csv"]):
+        pfad = tmp_path / name
+        pfad.write_text(name)
+        os.utime(pfad, (1_700_000_000 + i * 60, 1_700_000_000 + i * 60))
+        index.registriere(name)
+
+    eintraege, gesamt = index.seite()
+    assert gesamt == 3
+    assert [e["name"] for e in eintraege] == ["export.csv", "Rechnung_2024-12.xlsx", "bericht_2025-03-01.csv"]
+    assert [e["name"] for e in index.seite(pro_seite=1, seite=2)[0]] == ["Rechnung_2024-12.xlsx"]
@@ -0,0 +1,79 @@
+import sqlite3
+
+import pytest
+
+from tests.conftest import AufzeichnenderClient
+from utils import gpt, jobs, stammdaten
+from utils.gpt import KlassifikationsEngine
+from utils.jobs import OHNE_KI, JobStore, _ausfuehren
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """Job-Store und Stammdaten (history/ unter tmp_path) ohne Altbestand aus CSV und Modell."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(stammdaten, "_CSV", {})
+    monkeypatch.setattr(stammdaten, "_STORES", {})
+    monkeypatch.setattr(gpt, "_MODELL", None)
+    return JobStore(str(tmp_path / "jobs.sqlite"))
+
+
+class _StoerClient(AufzeichnenderClient):
+    def create(self, **kwargs):
+        if '"Störfall"' in kwargs["messages"][-1]["content"]:
+            raise ConnectionError("Verbindung abgebrochen")
+        return super().create(**kwargs)
+
+
+def _engine(client):
+    return KlassifikationsEngine(client=client, cache=False, rpm=100_000, tpm=100_000_000, max_parallel=2)
+
+
+def _status(store, job_id):
+    with sqlite3.connect(store.path) as con:
+        return dict(con.execute("SELECT zweck, status FROM job_eintrag WHERE job_id = ?", (job_id,)).fetchall())
+
+
+def test_verwaister_job_wird_fortgesetzt(store, stub, monkeypatch):
+    _, url = stub
+    job_id = store.lege_an(["Akquise", "DGNB Nachweis", "Audit"])
+    # Erster Worker sichert einen Zweck und stirbt dann ohne Herzschlag
+    assert store.beanspruche(job_id, besitzer="anderer:1")
+    store.erledige(job_id, {"Akquise": ("Intern", "gpt")})
+    assert not store.beanspruche(job_id)
+    assert store.verwaiste() == []
+
+    monkeypatch.setattr(jobs, "VERWAIST_NACH_S", -1)
+    assert store.verwaiste() == [job_id]
+    client = AufzeichnenderClient(url)
+    _ausfuehren(job_id, store, _engine(client))
+
+    assert store.job(job_id)["status"] == "fertig"
+    assert store.offene(job_id) == []
+    # Bereits gesicherte Zwecke gehen nicht noch einmal an die KI
+    assert not any('"Akquise"' in p for p in client.prompts)
+    mapping = stammdaten.lade_mapping(herkunft=True).set_index("Zweck")
+    assert mapping.loc["DGNB Nachweis", "Verrechenbarkeit"] == "Extern"
+    assert mapping.loc["DGNB Nachweis", "Herkunft"] == "gpt"
+
+
+def test_checkpoint_je_batch(store, stub):
+    _, url = stub
+    job_id = store.lege_an(["Akquise", "Störfall", "Audit"])
+    _ausfuehren(job_id, store, _engine(_StoerClient(url)), batch_groesse=1)
+
+    assert _status(store, job_id) == {"Akquise": "fertig", "Störfall": "fehler", "Audit": "fertig"}
+    assert store.job(job_id)["status"] == "fertig_mit_fehlern"
+    fehler = store.fehlerliste(job_id)
+    assert fehler["Zweck"].tolist() == ["Störfall"] and "Verbindung abgebrochen" in fehler["Fehler"][0]
+    assert set(stammdaten.lade_mapping()["Zweck"]) == {"Akquise", "Audit"}
+    assert store.fortschritt(job_id)["quellen"] == {"gpt": 2}
+
+
+def test_ohne_ki_bleiben_zwecke_als_fehler_stehen(store):
+    job_id = store.lege_an(["Akquise", "Audit"], ki=False)
+    _ausfuehren(job_id, store)
+
+    assert _status(store, job_id) == {"Akquise": "fehler", "Audit": "fehler"}
+    assert set(store.fehlerliste(job_id)["Fehler"]) == {OHNE_KI}
+    assert stammdaten.lade_mapping().empty
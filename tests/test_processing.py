@@ -0,0 +1,51 @@
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+from utils.processing import _chunk_frame, datum_spalte, extrahiere_zweck, zweck_spalte
+
+
+def test_datum_gemischt_iso_und_deutsch_in_einem_chunk():
+    werte = ["2025-01-05", "2025-01-20", "05.01.2025", "20.01.2025", "2025-02-03 08:15:00",
+             dt.datetime(2025, 3, 4), None, "kein Datum"]
+    erwartet = pd.to_datetime(["2025-01-05", "2025-01-20", "2025-01-05", "2025-01-20", "2025-02-03",
+                               "2025-03-04", None, None])
+    ergebnis = datum_spalte(werte)
+    assert ergebnis.dtype == "datetime64[ns]"
+    assert ergebnis.tolist() == pd.Series(erwartet).tolist()
+
+
+def test_chunk_frame_datum_nach_festen_formaten():
+    zeilen = [("P - A", "Anna", 1.0, "2025-01-05"), ("P - B", "Bob", 2.0, "05.01.2025")]
+    auswahl = {"Unterprojekt": 0, "Mitarbeiter": 1, "Stunden": 2, "Datum": 3}
+    df = _chunk_frame(zeilen, auswahl)
+    assert df["Datum"].tolist() == [pd.Timestamp("2025-01-05")] * 2
+
+
+def _wie_apply(serie: pd.Series) -> list:
+    return serie.apply(extrahiere_zweck).astype(object).where(lambda s: s.notna(), None).tolist()
+
+
+def _ergebnis(serie: pd.Series) -> list:
+    return zweck_spalte(serie).astype(object).where(lambda s: s.notna(), None).tolist()
+
+
+def test_zweck_spalte_wie_apply():
+    serie = pd.Series(["P1 - 01_Planung", "P2 - .1 Akquise", "Ohne Strich", "A - B - 12Zweck", "X -  ", "Y-3",
+                       None, float("nan"), "", " - 007_Audit [+]", "Kunde GmbH - Workshop II", 42.0, 7,
+                       "P1 - 01_Planung"], dtype="object")
+    assert _ergebnis(serie) == _wie_apply(serie)
+
+
+def test_zweck_spalte_kategorial():
+    serie = pd.Series(["P1 - 01_Planung", None, "Ohne Strich", "P1 - 01_Planung", "Z - 3_x"], dtype="category")
+    assert _ergebnis(serie) == _wie_apply(serie.astype(object))
+
+
+def test_zweck_spalte_ohne_kategorien():
+    leer = (pd.Series([np.nan, np.nan]), pd.Series([None, None], dtype="category"), pd.Series([], dtype="object"))
+    for serie in leer:
+        ergebnis = zweck_spalte(serie)
+        assert isinstance(ergebnis.dtype, pd.CategoricalDtype)
+        assert _ergebnis(serie) == _wie_apply(serie.astype(object))
@@ -0,0 +1,21 @@
+from utils import rechnung
+from utils.rechnung import lese_abrechnung_lokal
+
+
+def test_abrechnung_kurze_zeile_am_ende(monkeypatch):
+    # openpyxl (read_only) liefert Zeilen ohne <dimension> nur so lang wie ihre letzte Zelle
+    zeilen = [["PL", "Name", "Einsatztage"], ["SS", "Anna", 3], ["PK", "Bob", "1,5"], ["IT"]]
+    monkeypatch.setattr(rechnung, "_blaetter", lambda upload, ext: iter([("Tabelle1", zeilen)]))
+    df, rest = lese_abrechnung_lokal("Abrechnung.xlsx")
+    assert rest is None
+    assert dict(zip(df["Kürzel"], df["Einsatztage_SOLL"])) == {"IT": 0.0, "PK": 1.5, "SS": 3.0}
+
+
+def test_zahl_deutsche_schreibweise():
+    assert rechnung._zahl("1.234") == 1234.0
+    assert rechnung._zahl("1.234.567") == 1234567.0
+    assert rechnung._zahl("1.234,5") == 1234.5
+    assert rechnung._zahl("12,5 Tage") == 12.5
+    assert rechnung._zahl("12.5") == 12.5
+    assert rechnung._zahl(7.25) == 7.25
+    assert rechnung._zahl("–") is None
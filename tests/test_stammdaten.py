@@ -0,0 +1,35 @@
+import pandas as pd
+
+from utils.lokal_modell import LokalesModell
+from utils.stammdaten import EDITOR_INDEX, StammdatenStore, editor_aenderungen, editor_daten
+
+
+def test_editor_aenderungen_ueber_schluessel():
+    angezeigt = editor_daten(pd.DataFrame({
+        "Zweck": ["Akquise", "Planung", "Verwaltung"],
+        "Verrechenbarkeit": ["Intern", "Extern", "Intern"],
+    }), "mapping")
+    zustand = {
+        "edited_rows": {"2": {"Verrechenbarkeit": "Extern"}, "0": {"Verrechenbarkeit": "Extern"}},
+        "deleted_rows": [0, 1],
+        "added_rows": [{EDITOR_INDEX: " Schulung ", "Verrechenbarkeit": "Intern"}, {"Verrechenbarkeit": "Intern"}],
+    }
+    upserts, loeschungen = editor_aenderungen("mapping", angezeigt, zustand)
+    assert upserts == {"Verwaltung": "Extern", "Schulung": "Intern"}
+    assert loeschungen == ["Akquise", "Planung"]
+
+
+def test_lokales_modell_lernt_nur_bestaetigte_labels(tmp_path):
+    s = StammdatenStore(str(tmp_path / "stammdaten.sqlite"), csv_quellen={"mapping": None, "kuerzel": None})
+    s.aendere("mapping", {"Akquise": "Intern", "DGNB Nachweis": "Extern", "Akquise alt": "Extern"},
+              quelle="job 1", herkunft={"Akquise": "gpt", "DGNB Nachweis": "index", "Akquise alt": "lokal"})
+    assert s.historie()["Herkunft"].tolist().count("lokal") == 1
+
+    modell = LokalesModell()
+    modell.synchronisiere(s.tabelle("mapping", herkunft=True))
+    assert sorted(modell.labels) == ["Akquise"]
+
+    # Manuell bestätigt → wird Trainingslabel
+    s.aendere("mapping", {"Akquise alt": "Intern"}, quelle="app")
+    modell.synchronisiere(s.tabelle("mapping", herkunft=True))
+    assert sorted(modell.labels) == ["Akquise", "Akquise alt"]
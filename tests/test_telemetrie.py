@@ -0,0 +1,22 @@
+from utils import telemetrie
+
+
+def test_rotation_und_leere_laeufe(tmp_path, monkeypatch):
+    pfad = tmp_path / "telemetrie.jsonl"
+    monkeypatch.setattr(telemetrie, "TELEMETRIE_PFAD", str(pfad))
+    monkeypatch.setattr(telemetrie, "AKTIV", True)
+    monkeypatch.setattr(telemetrie, "MAX_BYTES", 500)
+    monkeypatch.setattr(telemetrie, "ANZAHL_ALT", 2)
+
+    # Rerun ohne gemessene Stufe → nichts geschrieben
+    with telemetrie.lauf("leer"):
+        pass
+    assert not pfad.exists()
+
+    for _ in range(40):
+        with telemetrie.lauf("seite"):
+            with telemetrie.messe("laden", zeilen=10):
+                pass
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["telemetrie.jsonl", "telemetrie.jsonl.1",
+                                                          "telemetrie.jsonl.2"]
+    assert all(p.stat().st_size < 500 + 1000 for p in tmp_path.iterdir())
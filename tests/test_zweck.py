@@ -0,0 +1,16 @@
+import pandas as pd
+
+from utils.zweck import verdichte_mapping, verrechenbarkeit_fuer
+
+
+def test_verdichte_mapping_nur_einheitliche_gruppen():
+    mapping = pd.DataFrame({
+        "Zweck": ["Akquise", ".1 Akquise", "02_Akquise", "Planung", ".1 Planung", "01_Planung"],
+        "Verrechenbarkeit": ["Intern", "Intern", "Intern", "Extern", "Extern", "Intern"],
+    })
+    verdichtet = verdichte_mapping(mapping)
+    assert verdichtet["Zweck"].tolist() == ["Akquise", "Planung", ".1 Planung", "01_Planung"]
+
+    # Jede Variante löst nach dem Verdichten noch genauso auf wie vorher
+    zwecke = mapping["Zweck"]
+    assert verrechenbarkeit_fuer(zwecke, verdichtet).tolist() == verrechenbarkeit_fuer(zwecke, mapping).tolist()
@@ -0,0 +1,72 @@
+# utils/ablage.py
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: nur Sperre zwischen Threads eines Prozesses
+    fcntl = None
+
+# Beginnt mit "_" → taucht in keinem History-Manifest auf
+SPERRDATEI = "_sperre"
+
+
+def tmp_pfad(ziel: str) -> str:
+    """Eindeutiger Zwischenpfad neben `ziel` (Prozess + Thread) für atomares Schreiben per os.replace."""
+    return f"{ziel}.tmp{os.getpid()}.{threading.get_ident()}"
+
+
+def schreibe_atomar(ziel: str, daten: bytes) -> str:
+    os.makedirs(os.path.dirname(ziel) or ".", exist_ok=True)
+    tmp = tmp_pfad(ziel)
+    with open(tmp, "wb") as f:
+        f.write(daten)
+    os.replace(tmp, ziel)
+    return ziel
+
+
+# ──────────────────────────────
+# Ordner-Sperren (History-Ordner)
+# ──────────────────────────────
+class _Sperre:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.tiefe = 0
+        self.datei = None
+
+
+_SPERREN = {}
+_SPERREN_LOCK = threading.Lock()
+
+
+def _sperre_fuer(ordner: str) -> _Sperre:
+    with _SPERREN_LOCK:
+        if ordner not in _SPERREN:
+            _SPERREN[ordner] = _Sperre()
+        return _SPERREN[ordner]
+
+
+@contextmanager
+def ordner_sperre(ordner: str):
+    """
+    Exklusive Sperre auf einen Ordner: zwischen Sessions (Threads) über ein prozessweites
+    RLock je Pfad, zwischen Prozessen über flock auf ordner/_sperre (wo fcntl verfügbar ist).
+    Verschachtelt im selben Thread nutzbar.
+    """
+    ordner = os.path.abspath(ordner)
+    os.makedirs(ordner, exist_ok=True)
+    sperre = _sperre_fuer(ordner)
+    with sperre.lock:
+        if sperre.tiefe == 0 and fcntl is not None:
+            sperre.datei = open(os.path.join(ordner, SPERRDATEI), "a")
+            fcntl.flock(sperre.datei, fcntl.LOCK_EX)
+        sperre.tiefe += 1
+        try:
+            yield
+        finally:
+            sperre.tiefe -= 1
+            if sperre.tiefe == 0 and sperre.datei is not None:
+                fcntl.flock(sperre.datei, fcntl.LOCK_UN)
+                sperre.datei.close()
+                sperre.datei = None
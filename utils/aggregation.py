@@ -0,0 +1,148 @@
+# utils/aggregation.py
+import hashlib
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from utils import telemetrie
+from utils.zweck import KATEGORIEN, verrechenbarkeit_fuer
+
+MAX_DATENSAETZE = 16
+
+
+def datensatz_schluessel(df: pd.DataFrame) -> str:
+    """Schlüssel des Datensatzes: Inhalts-Hash aus der Ingestion (df.attrs), sonst über die Daten."""
+    schluessel = df.attrs.get("datensatz")
+    if schluessel:
+        return schluessel
+    werte = pd.util.hash_pandas_object(df[["Mitarbeiter", "Zweck", "Dauer"]], index=False).to_numpy()
+    return hashlib.sha1(werte.tobytes()).hexdigest()
+
+
+def mapping_version(mapping_df: pd.DataFrame) -> str:
+    """Hash über alle Zweck→Verrechenbarkeit-Paare."""
+    if mapping_df is None or mapping_df.empty:
+        return "leer"
+    werte = pd.util.hash_pandas_object(mapping_df[["Zweck", "Verrechenbarkeit"]].astype(str), index=False)
+    return hashlib.sha1(werte.to_numpy().tobytes()).hexdigest()
+
+
+class StundenAggregat:
+    """
+    Stunden je Zweck × Mitarbeiter – einmal pro Datensatz aus den Rohzeilen gebildet.
+    Die Intern/Extern-Pivot pro Mitarbeiter entsteht daraus über das Mapping; ändert sich
+    das Mapping, werden nur die Stunden der betroffenen Zwecke umgebucht.
+    """
+
+    @telemetrie.gemessen("aggregat_aufbau")
+    def __init__(self, df: pd.DataFrame):
+        basis = (
+            df.groupby(["Zweck", "Mitarbeiter"], observed=True)["Dauer"].sum()
+            .astype("float64")
+            .unstack(fill_value=0.0)
+        )
+        basis.index = basis.index.astype(object)
+        basis.columns = basis.columns.astype(object)
+        self.basis = basis
+        self.labels = None
+        self.pivot = None
+        self.version = None
+        self._lock = threading.Lock()
+
+    def _labels(self, mapping_df: pd.DataFrame) -> pd.Series:
+        labels = verrechenbarkeit_fuer(pd.Series(self.basis.index, dtype="object"), mapping_df)
+        labels.index = self.basis.index
+        return labels.where(labels.isin(KATEGORIEN), None)
+
+    @telemetrie.gemessen("aggregation")
+    def pivot_fuer(self, mapping_df: pd.DataFrame) -> pd.DataFrame:
+        """Stunden pro Mitarbeiter (Index) mit Spalten Intern/Extern."""
+        version = mapping_version(mapping_df)
+        with self._lock:
+            if version != self.version:
+                labels = self._labels(mapping_df)
+                if self.pivot is None:
+                    self.pivot = pd.DataFrame(
+                        {k: self.basis[labels == k].sum(axis=0) for k in KATEGORIEN},
+                        index=self.basis.columns,
+                    ).astype("float64")
+                else:
+                    self._umbuchen(labels)
+                self.labels, self.version = labels, version
+            pivot = self.pivot.copy()
+
+        pivot.index.name = "Mitarbeiter"
+        return pivot[pivot.sum(axis=1) > 0]
+
+    def _umbuchen(self, labels: pd.Series):
+        """Verschiebt nur die Stunden der Zwecke, deren Kategorie sich geändert hat."""
+        alt = self.labels.fillna("")
+        neu = labels.fillna("")
+        for zweck in neu.index[alt != neu]:
+            stunden = self.basis.loc[zweck]
+            if alt[zweck]:
+                self.pivot[alt[zweck]] -= stunden
+            if neu[zweck]:
+                self.pivot[neu[zweck]] += stunden
+        # Rundungsreste aus dem Umbuchen nicht als "Stunden" stehen lassen
+        self.pivot = self.pivot.mask(self.pivot.abs() < 1e-9, 0.0)
+
+
+_AGGREGATE = OrderedDict()
+_AGGREGATE_LOCK = threading.Lock()
+
+
+def aggregat_fuer(df: pd.DataFrame) -> StundenAggregat:
+    """Prozessweiter LRU-Cache: ein StundenAggregat pro Datensatz-Schlüssel."""
+    schluessel = datensatz_schluessel(df)
+    with _AGGREGATE_LOCK:
+        if schluessel in _AGGREGATE:
+            _AGGREGATE.move_to_end(schluessel)
+            return _AGGREGATE[schluessel]
+
+    aggregat = StundenAggregat(df)
+    with _AGGREGATE_LOCK:
+        _AGGREGATE[schluessel] = aggregat
+        while len(_AGGREGATE) > MAX_DATENSAETZE:
+            _AGGREGATE.popitem(last=False)
+    return aggregat
+
+
+_DATENSAETZE = OrderedDict()
+_DATENSAETZE_LOCK = threading.Lock()
+
+
+def zeitdaten_fuer(schluessel: str, laden) -> pd.DataFrame:
+    """
+    Prozessweiter LRU-Cache für Session-DataFrames: Sessions mit demselben Datensatz
+    (und Mapping-Stand) teilen sich ein Objekt, statt je eine Kopie zu halten.
+    Geteilte Frames gelten als unveränderlich – Änderungen nur über neue Objekte (assign).
+    """
+    with _DATENSAETZE_LOCK:
+        if schluessel in _DATENSAETZE:
+            _DATENSAETZE.move_to_end(schluessel)
+            return _DATENSAETZE[schluessel]
+
+    df = laden()
+    with _DATENSAETZE_LOCK:
+        # Parallel geladen: das zuerst eingetragene Objekt gewinnt
+        df = _DATENSAETZE.setdefault(schluessel, df)
+        _DATENSAETZE.move_to_end(schluessel)
+        while len(_DATENSAETZE) > MAX_DATENSAETZE:
+            _DATENSAETZE.popitem(last=False)
+    return df
+
+
+def zusammenfassung(pivot_df: pd.DataFrame) -> pd.DataFrame:
+    """Tabelle für Anzeige/Export: Stunden, Gesamtstunden und Anteile pro Mitarbeiter."""
+    pivot_df = pivot_df.copy()
+    pivot_df["Gesamtstunden"] = pivot_df.sum(axis=1)
+    pivot_df["% Intern"] = (pivot_df.get("Intern", 0) / pivot_df["Gesamtstunden"]) * 100
+    pivot_df["% Extern"] = (pivot_df.get("Extern", 0) / pivot_df["Gesamtstunden"]) * 100
+
+    export_summary = pivot_df.reset_index()
+    export_summary = export_summary[["Mitarbeiter", "Intern", "Extern", "Gesamtstunden", "% Intern", "% Extern"]]
+    export_summary[["Intern", "Extern", "Gesamtstunden"]] = export_summary[["Intern", "Extern", "Gesamtstunden"]].round(2)
+    export_summary[["% Intern", "% Extern"]] = export_summary[["% Intern", "% Extern"]].round(1)
+    return export_summary
@@ -0,0 +1,343 @@
+# utils/archiv.py
+import io
+import os
+import json
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pandas as pd
+from pyarrow import feather
+
+from utils import telemetrie
+from utils.ablage import ordner_sperre, schreibe_atomar, tmp_pfad
+from utils.processing import CACHE_DIR, _arrow_tauglich, cache_pfad, datei_hash, lade_zeitdaten
+
+UPLOAD_DIR = os.path.join("history", "uploads")
+OBJEKTE = "objekte"
+DB_NAME = "_archiv.sqlite"
+ALT_MANIFEST = "_manifest.json"
+
+# Aufbewahrung – alles optional, 0 = aus (Standard: Rohdateien bleiben, nichts wird gelöscht).
+# ARCHIV_ROH_TAGE: Rohdateien nach so vielen Tagen ohne erneuten Upload zu komprimiertem Arrow
+#   verdichten (das Original-Workbook entfällt, Download dann nur noch mit den eingelesenen Spalten)
+# ARCHIV_MAX_TAGE / ARCHIV_MAX_ANZAHL: ältere Einträge bzw. alle über der Anzahl samt Caches löschen
+# Angewendet nur über pflege() (Schaltfläche auf der Upload-Seite), nie beim Upload selbst.
+ARCHIV_ROH_TAGE = int(os.getenv("ARCHIV_ROH_TAGE", "0"))
+ARCHIV_MAX_TAGE = int(os.getenv("ARCHIV_MAX_TAGE", "0"))
+ARCHIV_MAX_ANZAHL = int(os.getenv("ARCHIV_MAX_ANZAHL", "0"))
+
+log = logging.getLogger(__name__)
+
+SPALTEN = ("sha256", "name", "erstellt", "zuletzt", "anzahl", "zeilen", "groesse_roh", "groesse",
+           "format", "periode_von", "periode_bis")
+
+
+def _jetzt() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def _perioden(df: pd.DataFrame) -> tuple:
+    """(erster Monat, letzter Monat) der Buchungen als JJJJ-MM, ohne Datumsspalte (None, None)."""
+    if df is None or "Datum" not in df.columns:
+        return None, None
+    tage = pd.to_datetime(df["Datum"], errors="coerce").dropna()
+    if tage.empty:
+        return None, None
+    return tage.min().strftime("%Y-%m"), tage.max().strftime("%Y-%m")
+
+
+class UploadArchiv:
+    """
+    Inhaltsadressiertes Archiv der Zeitdaten-Uploads unter history/uploads.
+
+    Jede Datei liegt genau einmal unter objekte/<sha256>.xlsx (xlsx ist bereits zip-komprimiert);
+    ein erneuter Upload desselben Inhalts zählt nur den Eintrag hoch. Optional (`roh_tage`)
+    wird eine Rohdatei ohne erneuten Upload zu zstd-komprimiertem Arrow der eingelesenen
+    Spalten verdichtet. Index (Name, Hash, Perioden, Größen) in SQLite – Auflisten und Suchen
+    nach Hash oder Monat ohne Verzeichnis-Scan.
+
+    Liefert seite/lese/entferne wie HistorienIndex und lässt sich so in zeige_historie verwenden.
+    """
+
+    def __init__(self, ordner: str = UPLOAD_DIR, roh_tage: int = ARCHIV_ROH_TAGE, max_tage: int = ARCHIV_MAX_TAGE,
+                 max_anzahl: int = ARCHIV_MAX_ANZAHL, cache_dir: str = CACHE_DIR):
+        self.ordner = ordner
+        self.objekte = os.path.join(ordner, OBJEKTE)
+        self.db = os.path.join(ordner, DB_NAME)
+        self.roh_tage, self.max_tage, self.max_anzahl = roh_tage, max_tage, max_anzahl
+        self.cache_dir = cache_dir
+        os.makedirs(self.objekte, exist_ok=True)
+        with self._connect() as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute(
+                """
+                CREATE TABLE IF NOT EXISTS upload (
+                    sha256      TEXT PRIMARY KEY,
+                    name        TEXT NOT NULL UNIQUE,
+                    erstellt    TEXT NOT NULL,
+                    zuletzt     TEXT NOT NULL,
+                    anzahl      INTEGER NOT NULL DEFAULT 1,
+                    zeilen      INTEGER,
+                    groesse_roh INTEGER,
+                    groesse     INTEGER,
+                    format      TEXT NOT NULL,
+                    periode_von TEXT,
+                    periode_bis TEXT
+                )
+                """
+            )
+            con.execute("CREATE INDEX IF NOT EXISTS upload_zuletzt ON upload (zuletzt)")
+            con.execute("CREATE INDEX IF NOT EXISTS upload_periode ON upload (periode_von, periode_bis)")
+        self._uebernimm_altbestand()
+
+    @contextmanager
+    def _connect(self):
+        con = sqlite3.connect(self.db, timeout=10)
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    def _objekt(self, h: str, fmt: str) -> str:
+        return os.path.join(self.objekte, f"{h}.{fmt}")
+
+    def _eintraege(self, where: str = "", parameter=(), rest: str = "") -> list:
+        with self._connect() as con:
+            rows = con.execute(f"SELECT {', '.join(SPALTEN)} FROM upload {where} {rest}", parameter).fetchall()
+        eintraege = [dict(zip(SPALTEN, r)) for r in rows]
+        for e in eintraege:
+            e["zeitstempel"] = e["zuletzt"]
+        return eintraege
+
+    # ---------- Übernahme des alten Ordners (upload_<Zeitstempel>.xlsx + Manifest) ----------
+    def _altdateien(self) -> list:
+        return [e for e in os.scandir(self.ordner) if e.is_file() and e.name.endswith(".xlsx")]
+
+    def _uebernimm_altbestand(self):
+        if not self._altdateien():
+            return
+
+        with ordner_sperre(self.ordner):
+            # Erst unter der Sperre auflisten – ein anderer Prozess kann inzwischen übernommen haben
+            alt = self._altdateien()
+            try:
+                with open(os.path.join(self.ordner, ALT_MANIFEST), "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+            except (FileNotFoundError, ValueError):
+                manifest = {}
+
+            for e in sorted(alt, key=lambda e: e.stat().st_mtime):
+                meta = manifest.get(e.name, {})
+                with open(e.path, "rb") as f:
+                    h = meta.get("sha256") or datei_hash(f.read())
+                stat = e.stat()
+                zeit = datetime.fromtimestamp(stat.st_mtime).isoformat(timespec="seconds")
+                with self._connect() as con:
+                    vorhanden = con.execute("SELECT 1 FROM upload WHERE sha256 = ?", (h,)).fetchone()
+                    if vorhanden:
+                        con.execute("UPDATE upload SET anzahl = anzahl + 1, zuletzt = MAX(zuletzt, ?) WHERE sha256 = ?",
+                                    (zeit, h))
+                        os.remove(e.path)
+                        continue
+                    os.replace(e.path, self._objekt(h, "xlsx"))
+                    con.execute(
+                        "INSERT INTO upload (sha256, name, erstellt, zuletzt, zeilen, groesse_roh, groesse, format) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, 'xlsx')",
+                        (h, e.name, zeit, zeit, meta.get("zeilen"), stat.st_size, stat.st_size),
+                    )
+            if os.path.exists(os.path.join(self.ordner, ALT_MANIFEST)):
+                os.remove(os.path.join(self.ordner, ALT_MANIFEST))
+
+    # ---------- Schreiben ----------
+    @telemetrie.gemessen("archiv_ablage")
+    def archiviere(self, daten: bytes, df: pd.DataFrame = None, sha256: str = None) -> tuple:
+        """
+        Legt einen Upload ab. Bekannter Inhalt → nur Zähler und Zeitstempel aktualisieren.
+        Rückgabe: (Eintrag, neu: bool). Die Aufbewahrungsregel läuft getrennt (pflege).
+        """
+        h = sha256 or datei_hash(daten)
+        jetzt = _jetzt()
+        von, bis = _perioden(df)
+        zeilen = None if df is None else len(df)
+        with ordner_sperre(self.ordner):
+            with self._connect() as con:
+                geaendert = con.execute(
+                    "UPDATE upload SET anzahl = anzahl + 1, zuletzt = ?, zeilen = COALESCE(zeilen, ?), "
+                    "periode_von = COALESCE(periode_von, ?), periode_bis = COALESCE(periode_bis, ?) WHERE sha256 = ?",
+                    (jetzt, zeilen, von, bis, h),
+                ).rowcount
+            neu = not geaendert
+            if neu:
+                schreibe_atomar(self._objekt(h, "xlsx"), daten)
+                name = f"upload_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_{h[:8]}.xlsx"
+                with self._connect() as con:
+                    con.execute(
+                        "INSERT INTO upload (sha256, name, erstellt, zuletzt, zeilen, groesse_roh, groesse, format, "
+                        "periode_von, periode_bis) VALUES (?, ?, ?, ?, ?, ?, ?, 'xlsx', ?, ?)",
+                        (h, name, jetzt, jetzt, zeilen, len(daten), len(daten), von, bis),
+                    )
+        return self.suche(h), neu
+
+    def _verdichte(self, e: dict):
+        """Rohdatei → zstd-Arrow der eingelesenen Spalten (über den Arrow-Cache, falls vorhanden)."""
+        roh = self._objekt(e["sha256"], "xlsx")
+        with open(roh, "rb") as f:
+            df = lade_zeitdaten(f.read(), self.cache_dir)
+        ziel = self._objekt(e["sha256"], "arrow")
+        tmp = tmp_pfad(ziel)
+        feather.write_feather(_arrow_tauglich(df), tmp, compression="zstd")
+        os.replace(tmp, ziel)
+        von, bis = _perioden(df)
+        with self._connect() as con:
+            con.execute(
+                "UPDATE upload SET format = 'arrow', groesse = ?, zeilen = ?, periode_von = COALESCE(periode_von, ?), "
+                "periode_bis = COALESCE(periode_bis, ?) WHERE sha256 = ?",
+                (os.path.getsize(ziel), len(df), von, bis, e["sha256"]),
+            )
+        os.remove(roh)
+
+    def _loesche(self, e: dict):
+        """Eintrag samt Objekt und abgeleiteten Caches (Arrow-Spaltencache, Zeitwürfel) entfernen."""
+        from utils.wuerfel import wuerfel_pfad
+
+        h = e["sha256"]
+        for pfad in (self._objekt(h, "xlsx"), self._objekt(h, "arrow"),
+                     cache_pfad(h, self.cache_dir), wuerfel_pfad(h, self.cache_dir)):
+            if os.path.exists(pfad):
+                os.remove(pfad)
+        with self._connect() as con:
+            con.execute("DELETE FROM upload WHERE sha256 = ?", (h,))
+
+    @property
+    def pflege_aktiv(self) -> bool:
+        return bool(self.roh_tage or self.max_tage or self.max_anzahl)
+
+    @telemetrie.gemessen("archiv_pflege")
+    def pflege(self, jetzt: datetime = None) -> dict:
+        """
+        Aufbewahrungsregel anwenden (Wartung, nicht im Upload-Pfad: Verdichten liest alte
+        Workbooks ggf. neu ein). Rückgabe: {"verdichtet": n, "geloescht": n, "fehler": [Namen]}.
+        """
+        jetzt = jetzt or datetime.now()
+        ergebnis = {"verdichtet": 0, "geloescht": 0, "fehler": []}
+        with ordner_sperre(self.ordner):
+            weg = []
+            if self.max_tage:
+                grenze = (jetzt - timedelta(days=self.max_tage)).isoformat(timespec="seconds")
+                weg += self._eintraege("WHERE zuletzt < ?", (grenze,))
+            if self.max_anzahl:
+                weg += self._eintraege(rest=f"ORDER BY zuletzt DESC LIMIT -1 OFFSET {int(self.max_anzahl)}")
+            for e in {e["sha256"]: e for e in weg}.values():
+                self._loesche(e)
+                ergebnis["geloescht"] += 1
+
+            if self.roh_tage:
+                grenze = (jetzt - timedelta(days=self.roh_tage)).isoformat(timespec="seconds")
+                for e in self._eintraege("WHERE format = 'xlsx' AND zuletzt < ?", (grenze,)):
+                    try:
+                        self._verdichte(e)
+                        ergebnis["verdichtet"] += 1
+                    except Exception as ex:
+                        # Nicht lesbar (beschädigt, kein xlsx, kein Zeitdaten-Workbook) – Rohdatei bleibt
+                        log.warning("Archiv: %s nicht verdichtet: %s: %s", e["name"], type(ex).__name__, ex)
+                        ergebnis["fehler"].append(e["name"])
+        return ergebnis
+
+    def entferne(self, name: str):
+        with ordner_sperre(self.ordner):
+            for e in self._eintraege("WHERE name = ?", (name,)):
+                self._loesche(e)
+
+    # ---------- Abfragen ----------
+    def suche(self, sha256: str):
+        """Eintrag mit diesem Inhalts-Hash oder None."""
+        treffer = self._eintraege("WHERE sha256 = ?", (sha256,))
+        return treffer[0] if treffer else None
+
+    def fuer_periode(self, periode: str) -> list:
+        """Uploads, deren Buchungen den Monat (JJJJ-MM) berühren – neueste zuerst."""
+        return self._eintraege("WHERE periode_von <= ? AND periode_bis >= ?", (periode, periode),
+                               "ORDER BY zuletzt DESC")
+
+    def seite(self, filter_text: str = "", seite: int = 1, pro_seite: int = 20):
+        """
+        Rückgabe: (Einträge der Seite, Anzahl Treffer gesamt) – zuletzt hochgeladene zuerst.
+        Filter: Teilstring im Namen, Hash-Präfix oder Monat (JJJJ-MM) innerhalb der Perioden.
+        """
+        where, parameter = "", ()
+        if filter_text:
+            f = filter_text.strip().lower()
+            where = "WHERE lower(name) LIKE ? OR sha256 LIKE ? OR (periode_von <= ? AND periode_bis >= ?)"
+            parameter = (f"%{f}%", f"{f}%", f, f)
+        with self._connect() as con:
+            gesamt = con.execute(f"SELECT COUNT(*) FROM upload {where}", parameter).fetchone()[0]
+        start = max(0, (seite - 1) * pro_seite)
+        eintraege = self._eintraege(where, parameter, f"ORDER BY zuletzt DESC LIMIT {int(pro_seite)} OFFSET {start}")
+        return eintraege, gesamt
+
+    def _eintrag_von(self, name: str) -> dict:
+        treffer = self._eintraege("WHERE name = ?", (name,))
+        if not treffer:
+            raise FileNotFoundError(f"Nicht im Upload-Archiv: {name}")
+        return treffer[0]
+
+    def lese(self, name: str) -> bytes:
+        """Datei zum Download – verdichtete Einträge als xlsx der archivierten Spalten."""
+        e = self._eintrag_von(name)
+        if e["format"] == "xlsx":
+            with open(self._objekt(e["sha256"], "xlsx"), "rb") as f:
+                return f.read()
+        puffer = io.BytesIO()
+        self.lade(name).to_excel(puffer, index=False)
+        return puffer.getvalue()
+
+    def lade(self, name: str, fortschritt=None) -> pd.DataFrame:
+        """Zeitdaten eines Eintrags wie lade_zeitdaten (df.attrs["datensatz"] = Inhalts-Hash)."""
+        e = self._eintrag_von(name)
+        if e["format"] == "xlsx":
+            with open(self._objekt(e["sha256"], "xlsx"), "rb") as f:
+                df = lade_zeitdaten(f.read(), self.cache_dir, fortschritt)
+            if e["periode_von"] is None:
+                # Aus dem alten Ordner übernommen: Perioden/Zeilen beim ersten Laden nachtragen
+                with self._connect() as con:
+                    con.execute("UPDATE upload SET zeilen = ?, periode_von = ?, periode_bis = ? WHERE sha256 = ?",
+                                (len(df), *_perioden(df), e["sha256"]))
+            return df
+        df = feather.read_table(self._objekt(e["sha256"], "arrow")).to_pandas()
+        df.attrs["datensatz"] = e["sha256"]
+        return df
+
+
+_ARCHIVE = {}
+_ARCHIVE_LOCK = threading.Lock()
+
+
+def archiv(ordner: str = UPLOAD_DIR) -> UploadArchiv:
+    """Prozessweites Archiv je Ordner (Schema und Übernahme des Altbestands nur beim ersten Zugriff)."""
+    with _ARCHIVE_LOCK:
+        if ordner not in _ARCHIVE:
+            _ARCHIVE[ordner] = UploadArchiv(ordner)
+        return _ARCHIVE[ordner]
+
+
+# ──────────────────────────────
+# Manuell testen: Ordner mit Zeitdaten-Workbooks archivieren
+# ──────────────────────────────
+if __name__ == "__main__":
+    import sys
+    import time
+
+    ordner = sys.argv[1] if len(sys.argv) > 1 else "."
+    a = UploadArchiv(os.path.join("history", "uploads_test"), roh_tage=30)
+    t = time.perf_counter()
+    for datei in sorted(os.listdir(ordner)):
+        if datei.endswith(".xlsx"):
+            with open(os.path.join(ordner, datei), "rb") as f:
+                daten = f.read()
+            e, neu = a.archiviere(daten, lade_zeitdaten(daten))
+            print(f"{'neu ' if neu else 'dup '} {e['name']}  {e['periode_von']}…{e['periode_bis']}  {e['zeilen']} Zeilen")
+    print(f"{time.perf_counter() - t:.2f} s, verdichtet: {a.pflege(datetime.now() + timedelta(days=3650))}")
@@ -0,0 +1,240 @@
+# utils/bericht.py
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+from utils import telemetrie
+from utils.ablage import schreibe_atomar
+from utils.rechnung import formatiere_euro
+
+# PDF-Erzeugung läuft neben der UI; zwei Worker reichen, Berichte sind CPU-gebunden
+_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="bericht")
+_MATPLOTLIB_LOCK = threading.Lock()
+MAX_BALKEN = 40
+
+
+# ──────────────────────────────
+# Diagrammdaten: Top-N, "Übrige", Sortierung
+# ──────────────────────────────
+SORTIERUNGEN = ("Gesamtstunden", "Extern", "Intern", "% Extern", "Mitarbeiter")
+
+
+def diagramm_daten(export_summary: pd.DataFrame, top_n: int = MAX_BALKEN, sortierung: str = "Gesamtstunden",
+                   uebrige: bool = True) -> pd.DataFrame:
+    """
+    [Mitarbeiter, Intern, Extern] für die Balken: die top_n Mitarbeitenden nach `sortierung`
+    (bei "Mitarbeiter" nach Gesamtstunden ausgewählt, dann alphabetisch), der Rest optional
+    als ein Balken "Übrige (k)" am Ende.
+    """
+    daten = export_summary[["Mitarbeiter", "Intern", "Extern"]].copy()
+    daten["Mitarbeiter"] = daten["Mitarbeiter"].astype(str)
+    gesamt = daten["Intern"] + daten["Extern"]
+    schluessel = {
+        "Gesamtstunden": gesamt,
+        "Intern": daten["Intern"],
+        "Extern": daten["Extern"],
+        "% Extern": daten["Extern"] / gesamt.where(gesamt > 0),
+        "Mitarbeiter": gesamt,
+    }[sortierung]
+
+    reihenfolge = schluessel.fillna(-1).sort_values(ascending=False, kind="stable").index
+    oben, rest = daten.loc[reihenfolge[:top_n]], daten.loc[reihenfolge[top_n:]]
+    if sortierung == "Mitarbeiter":
+        oben = oben.sort_values("Mitarbeiter")
+    if uebrige and len(rest):
+        oben = pd.concat([oben, pd.DataFrame({
+            "Mitarbeiter": [f"Übrige ({len(rest)})"],
+            "Intern": [rest["Intern"].sum()],
+            "Extern": [rest["Extern"].sum()],
+        })], ignore_index=True)
+    return oben.reset_index(drop=True)
+
+
+def plotly_diagramm(daten: pd.DataFrame):
+    """Gestapelte Intern/Extern-Balken als plotly-Figure – gezeichnet wird im Browser."""
+    import plotly.graph_objects as go
+
+    fig = go.Figure([
+        go.Bar(
+            name=spalte, x=daten["Mitarbeiter"], y=daten[spalte],
+            hovertemplate="%{x}<br>" + spalte + ": %{y:.2f} Std.<extra></extra>",
+        )
+        for spalte in ("Intern", "Extern")
+    ])
+    fig.update_layout(
+        barmode="stack", yaxis_title="Stunden", xaxis_tickangle=-60, legend_orientation="h",
+        margin=dict(l=10, r=10, t=30, b=10), height=450,
+    )
+    return fig
+
+
+# ──────────────────────────────
+# Diagramm für den PDF-Bericht (matplotlib erst beim Aufruf)
+# ──────────────────────────────
+def balkendiagramm(export_summary: pd.DataFrame):
+    """Intern/Extern pro Mitarbeiter gestapelt. Figure ohne pyplot: kein globaler Zustand, threadsicher."""
+    import numpy as np
+    from matplotlib.figure import Figure
+
+    # Hunderte Balken sind unlesbar und das Zeichnen der Achsenbeschriftung dauert Sekunden;
+    # die vollständigen Zahlen stehen in der Tabelle
+    titel = "Stunden nach Verrechenbarkeit"
+    if len(export_summary) > MAX_BALKEN:
+        titel += f" (Top {MAX_BALKEN} nach Stunden)"
+    daten = diagramm_daten(export_summary)
+
+    n = len(daten)
+    fig = Figure(figsize=(max(10, 0.3 * n), 5))
+    ax = fig.subplots()
+    x = np.arange(n)
+    unten = np.zeros(n)
+    for spalte in ("Intern", "Extern"):
+        werte = daten[spalte].to_numpy(dtype="float64")
+        ax.bar(x, werte, width=0.6, bottom=unten, label=spalte)
+        unten += werte
+    ax.set_xticks(x, daten["Mitarbeiter"], rotation=90)
+    ax.legend()
+    ax.set_ylabel("Stunden")
+    ax.set_title(titel)
+    fig.tight_layout()
+    return fig
+
+
+@telemetrie.gemessen("diagramm")
+def diagramm_png(export_summary: pd.DataFrame, dpi: int = 100) -> bytes:
+    """Balkendiagramm als PNG – nur für den PDF-Bericht, die App zeichnet interaktiv (plotly_diagramm)."""
+    puffer = io.BytesIO()
+    with _MATPLOTLIB_LOCK:  # Font-Cache/Ticker von matplotlib sind nicht threadsicher
+        balkendiagramm(export_summary).savefig(puffer, format="png", dpi=dpi)
+    return puffer.getvalue()
+
+
+# ──────────────────────────────
+# Detaildaten pro Mitarbeiter
+# ──────────────────────────────
+def detail_tabelle(df: pd.DataFrame) -> pd.DataFrame:
+    """Stunden je Mitarbeiter × Zweck × Verrechenbarkeit (für die Detailseiten)."""
+    spalten = ["Mitarbeiter", "Zweck"] + (["Verrechenbarkeit"] if "Verrechenbarkeit" in df.columns else [])
+    out = (
+        df.groupby(spalten, observed=True, dropna=False)["Dauer"].sum()
+        .astype("float64").round(2)
+        .rename("Stunden")
+        .reset_index()
+    )
+    out = out[out["Stunden"] > 0]
+    return out.sort_values(["Mitarbeiter", "Stunden"], ascending=[True, False], ignore_index=True)
+
+
+# ──────────────────────────────
+# PDF-Bericht (reportlab erst beim Aufruf)
+# ──────────────────────────────
+def _tabelle(df: pd.DataFrame, breite: float):
+    """LongTable: bricht über Seiten um und wiederholt die Kopfzeile auf jeder Seite."""
+    from reportlab.lib import colors
+    from reportlab.platypus import LongTable, TableStyle
+
+    def zelle(v, spalte):
+        if v is None or (isinstance(v, float) and pd.isna(v)):
+            return ""
+        if str(spalte).endswith("(€)") and isinstance(v, (int, float)):
+            return formatiere_euro(v)
+        return f"{v:g}" if isinstance(v, float) else str(v)
+
+    spalten = list(df.columns)
+    daten = [[str(c) for c in spalten]] + [
+        [zelle(v, c) for v, c in zip(zeile, spalten)] for zeile in df.itertuples(index=False)
+    ]
+    tabelle = LongTable(daten, colWidths=[breite / len(df.columns)] * len(df.columns), repeatRows=1)
+    tabelle.setStyle(
+        TableStyle(
+            [
+                ("BACKGROUND", (0, 0), (-1, 0), colors.grey),
+                ("GRID", (0, 0), (-1, -1), 0.5, colors.black),
+                ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+                ("FONTSIZE", (0, 0), (-1, -1), 8),
+                ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.whitesmoke]),
+            ]
+        )
+    )
+    return tabelle
+
+
+@telemetrie.gemessen("pdf_export")
+def erstelle_pdf(export_summary: pd.DataFrame, ziel=None, diagramm: bytes = None, details: pd.DataFrame = None,
+                 titel: str = "Verrechenbarkeit Gesamtübersicht") -> bytes:
+    """
+    Baut den Bericht komplett im Speicher: Diagramm (PNG-Bytes, sonst hier gerendert),
+    paginierte Übersichtstabelle und – mit `details` – eine Seite je Mitarbeiter.
+    ziel: optionaler Pfad, unter dem das PDF zusätzlich abgelegt wird. Rückgabe: PDF-Bytes.
+    """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.utils import ImageReader
+    from reportlab.platypus import Image as RLImage, PageBreak, Paragraph, SimpleDocTemplate, Spacer
+
+    if diagramm is None and not export_summary.empty:
+        diagramm = diagramm_png(export_summary)
+
+    puffer = io.BytesIO()
+    doc = SimpleDocTemplate(puffer, pagesize=A4, title=titel)
+    styles = getSampleStyleSheet()
+    elements = [
+        Paragraph(titel, styles["Title"]),
+        Paragraph(datetime.now().strftime("Stand: %d.%m.%Y %H:%M"), styles["Normal"]),
+        Spacer(1, 12),
+    ]
+    if diagramm:
+        # Seitenverhältnis aus dem PNG übernehmen, Breite = Satzspiegel
+        w, h = ImageReader(io.BytesIO(diagramm)).getSize()
+        elements += [RLImage(io.BytesIO(diagramm), width=doc.width, height=doc.width * h / w), Spacer(1, 12)]
+    elements.append(_tabelle(export_summary, doc.width))
+
+    if details is not None and not details.empty:
+        ohne_name = [c for c in details.columns if c != "Mitarbeiter"]
+        for mitarbeiter, teil in details.groupby("Mitarbeiter", observed=True, sort=True):
+            elements += [
+                PageBreak(),
+                Paragraph(str(mitarbeiter), styles["Heading2"]),
+                Paragraph(f"{teil['Stunden'].sum():,.2f} Stunden".replace(",", "."), styles["Normal"]),
+                Spacer(1, 8),
+                _tabelle(teil[ohne_name], doc.width),
+            ]
+
+    doc.build(elements)
+    daten = puffer.getvalue()
+    if ziel:
+        schreibe_atomar(ziel, daten)
+    return daten
+
+
+def starte_pdf(*args, **kwargs):
+    """erstelle_pdf im Hintergrund. Rückgabe: Future mit den PDF-Bytes."""
+    return _POOL.submit(telemetrie.im_kontext(erstelle_pdf), *args, **kwargs)
+
+
+# ──────────────────────────────
+# Manuell testen: python -m utils.bericht [Anzahl Mitarbeitende]
+# ──────────────────────────────
+if __name__ == "__main__":
+    import sys
+    import time
+    import numpy as np
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    rng = np.random.default_rng(0)
+    roh = pd.DataFrame({
+        "Mitarbeiter": [f"Person {i:04d}" for i in rng.integers(0, n, n * 20)],
+        "Zweck": rng.choice(["Planung", "Akquise", "Workshop", "Audit", "Intern Orga"], n * 20),
+        "Verrechenbarkeit": rng.choice(["Intern", "Extern"], n * 20),
+        "Dauer": rng.integers(1, 16, n * 20) / 2,
+    })
+    pivot = roh.pivot_table(index="Mitarbeiter", columns="Verrechenbarkeit", values="Dauer", aggfunc="sum", fill_value=0)
+    from utils.aggregation import zusammenfassung
+    summary = zusammenfassung(pivot)
+
+    t = time.perf_counter()
+    pdf = starte_pdf(summary, details=detail_tabelle(roh)).result()
+    print(f"{n} Mitarbeitende: {len(pdf) / 1024:.0f} KiB in {time.perf_counter() - t:.2f}s")
@@ -0,0 +1,218 @@
+# utils/datenspeicher.py
+import os
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+from pyarrow import feather
+
+from utils import telemetrie
+from utils.ablage import ordner_sperre, tmp_pfad
+from utils.processing import _arrow_tauglich, lade_zeitdaten, leite_spalten_ab
+from utils.wuerfel import baue_wuerfel, lese_wuerfel, schreibe_wuerfel
+
+DATASET_DIR = os.path.join("history", "dataset")
+DATEI = "daten.arrow"
+WUERFEL_DATEI = "wuerfel.arrow"
+
+# Was im Speicher liegt; Buchungsschlüssel = alle Spalten außer Zweck (abgeleitet)
+SPALTEN = ["Datum", "Mitarbeiter", "Unterprojekt", "Zweck", "Dauer"]
+BUCHUNG = ["Datum", "Mitarbeiter", "Unterprojekt", "Dauer"]
+
+
+# ──────────────────────────────
+# Paralleles Einlesen mehrerer Workbooks
+# ──────────────────────────────
+def _parse_datei(daten: bytes):
+    """Worker (eigener Prozess): Workbook lesen (über den Arrow-Cache) und Zweck/Dauer ableiten."""
+    df = lade_zeitdaten(daten)
+    h = df.attrs.get("datensatz")
+    df = leite_spalten_ab(df)
+    if "Datum" not in df.columns:
+        df["Datum"] = pd.NaT
+    out = df[SPALTEN].copy()
+    out["Dauer"] = out["Dauer"].astype("float32")
+    return h, out
+
+
+@telemetrie.gemessen("ingestion_parallel")
+def ingestiere_dateien(dateien, max_worker: int = None, fortschritt=None) -> list:
+    """
+    Parst mehrere Workbooks parallel in einem Prozess-Pool.
+    dateien: Liste von Bytes. Rückgabe: Liste von (Inhalts-Hash, DataFrame) in Eingabereihenfolge.
+    """
+    dateien = list(dateien)
+    if len(dateien) <= 1:
+        ergebnisse = [_parse_datei(d) for d in dateien]
+        if fortschritt:
+            fortschritt(len(dateien), len(dateien))
+        return ergebnisse
+
+    max_worker = max_worker or min(len(dateien), os.cpu_count() or 2)
+    # spawn statt fork: der Streamlit-Server ist multithreaded
+    ctx = multiprocessing.get_context("spawn")
+    ergebnisse = [None] * len(dateien)
+    with ProcessPoolExecutor(max_workers=max_worker, mp_context=ctx) as pool:
+        futures = {pool.submit(_parse_datei, d): i for i, d in enumerate(dateien)}
+        for fertig, future in enumerate(as_completed(futures), start=1):
+            ergebnisse[futures[future]] = future.result()
+            if fortschritt:
+                fortschritt(fertig, len(dateien))
+    return ergebnisse
+
+
+# ──────────────────────────────
+# Monatspartitionierter Datensatz
+# ──────────────────────────────
+def _partition_von(datum: pd.Series, quelle: str) -> pd.Series:
+    """'YYYY-MM' je Zeile; ohne Datum landet die Zeile in einer Partition pro Upload."""
+    monat = pd.to_datetime(datum, errors="coerce").dt.strftime("%Y-%m")
+    return monat.fillna(f"upload-{quelle[:12]}")
+
+
+def _mit_vorkommen(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Nummeriert identische Buchungen innerhalb einer Quelle (0, 1, …). So verschwinden
+    beim Zusammenführen nur Überschneidungen zwischen Dateien, nicht echte Doppelbuchungen.
+    """
+    schluessel = pd.util.hash_pandas_object(df[BUCHUNG], index=False, categorize=True)
+    df = df.copy()
+    df["_vorkommen"] = schluessel.groupby(schluessel.to_numpy()).cumcount().to_numpy()
+    return df
+
+
+def _verbinde(frames: list) -> pd.DataFrame:
+    """Concat mit vereinigten Kategorien (statt Rückfall auf object)."""
+    frames = [f for f in frames if len(f)]
+    if not frames:
+        return pd.DataFrame(columns=SPALTEN)
+    out = {}
+    for spalte in frames[0].columns:
+        teile = [f[spalte] for f in frames]
+        if all(isinstance(t.dtype, pd.CategoricalDtype) for t in teile):
+            # Nach dem Arrow-Roundtrip sind die Kategorien ggf. str statt object
+            teile = [
+                pd.Categorical.from_codes(t.cat.codes, categories=pd.Index(t.cat.categories, dtype="object"))
+                for t in teile
+            ]
+            out[spalte] = pd.Series(union_categoricals(teile))
+        else:
+            out[spalte] = pd.concat(teile, ignore_index=True)
+    return pd.DataFrame(out)
+
+
+class DatenSpeicher:
+    """
+    Persistenter Datensatz unter history/dataset, partitioniert nach Monat
+    (monat=YYYY-MM/daten.arrow). Überlappende Exporte werden beim Schreiben
+    dedupliziert; gelesen werden nur die ausgewählten Partitionen.
+    """
+
+    def __init__(self, root: str = DATASET_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _pfad(self, partition: str) -> str:
+        return os.path.join(self.root, f"monat={partition}", DATEI)
+
+    def partitionen(self) -> list:
+        """Alle vorhandenen Partitionen, neueste zuerst."""
+        namen = [
+            e.name.split("=", 1)[1]
+            for e in os.scandir(self.root)
+            if e.is_dir() and e.name.startswith("monat=") and os.path.exists(os.path.join(e.path, DATEI))
+        ]
+        return sorted(namen, reverse=True)
+
+    def _wuerfel_pfad(self, partition: str) -> str:
+        return os.path.join(self.root, f"monat={partition}", WUERFEL_DATEI)
+
+    def _lese_partition(self, partition: str, columns=None) -> pd.DataFrame:
+        return feather.read_table(self._pfad(partition), columns=columns, memory_map=True).to_pandas()
+
+    @telemetrie.gemessen("datensatz_schreiben")
+    def schreibe(self, df: pd.DataFrame, quelle: str) -> dict:
+        """
+        Fügt die Buchungen einer Quelle (Upload-Hash) ein. Rückgabe: {Partition: neue Zeilen}.
+        """
+        df = _mit_vorkommen(df[SPALTEN])
+        df["_partition"] = _partition_von(df["Datum"], quelle)
+
+        neu_je_partition = {}
+        # Lesen-Zusammenführen-Schreiben je Partition: nie zwei Sessions/Prozesse gleichzeitig
+        with ordner_sperre(self.root):
+            for partition, teil in df.groupby("_partition", sort=False):
+                teil = teil.drop(columns=["_partition"])
+                pfad = self._pfad(partition)
+                if os.path.exists(pfad):
+                    alt = self._lese_partition(partition)
+                    kombiniert = _verbinde([alt, teil])
+                else:
+                    alt, kombiniert = None, teil
+                schluessel = BUCHUNG + ["_vorkommen"]
+                kombiniert = kombiniert.drop_duplicates(subset=schluessel, keep="first").reset_index(drop=True)
+                neu_je_partition[partition] = len(kombiniert) - (0 if alt is None else len(alt))
+                if neu_je_partition[partition] == 0 and alt is not None:
+                    continue
+
+                os.makedirs(os.path.dirname(pfad), exist_ok=True)
+                tmp = tmp_pfad(pfad)
+                feather.write_feather(_arrow_tauglich(kombiniert), tmp, compression="uncompressed")
+                os.replace(tmp, pfad)
+                # Würfel nur für die geänderte Partition neu bilden
+                schreibe_wuerfel(baue_wuerfel(kombiniert), self._wuerfel_pfad(partition))
+        return neu_je_partition
+
+    def lese(self, partitionen, columns=None) -> pd.DataFrame:
+        """
+        Liest nur die gewählten Partitionen (memory-mapped) als ein DataFrame.
+        df.attrs["datensatz"] identifiziert Auswahl + Dateistand für nachgelagerte Caches.
+        """
+        partitionen = sorted(partitionen)
+        frames = [self._lese_partition(p, columns) for p in partitionen]
+        df = _verbinde(frames).drop(columns=["_vorkommen"], errors="ignore")
+        df.attrs["datensatz"] = self.stand(partitionen)
+        return df
+
+    def stand(self, partitionen) -> str:
+        """Schlüssel für Auswahl + Dateistand (wie df.attrs["datensatz"] von lese)."""
+        stand = "|".join(f"{p}:{os.stat(self._pfad(p)).st_mtime_ns}" for p in sorted(partitionen))
+        return hashlib.sha256(stand.encode("utf-8")).hexdigest()
+
+    def lese_wuerfel(self, partitionen) -> pd.DataFrame:
+        """
+        Würfel der gewählten Partitionen (liegen neben daten.arrow). Partitionen aus der Zeit
+        vor dem Würfel bekommen ihn beim ersten Lesen nachträglich.
+        """
+        teile = []
+        for p in sorted(partitionen):
+            wuerfel = lese_wuerfel(self._wuerfel_pfad(p))
+            if wuerfel is None:
+                with ordner_sperre(self.root):
+                    wuerfel = baue_wuerfel(self._lese_partition(p))
+                    schreibe_wuerfel(wuerfel, self._wuerfel_pfad(p))
+            teile.append(wuerfel)
+        return _verbinde(teile)
+
+
+# ──────────────────────────────
+# Manuell testen: python -m utils.datenspeicher a.xlsx b.xlsx …
+# ──────────────────────────────
+if __name__ == "__main__":
+    import sys
+    import time
+
+    t = time.perf_counter()
+    ergebnisse = ingestiere_dateien(
+        [open(p, "rb").read() for p in sys.argv[1:]],
+        fortschritt=lambda fertig, gesamt: print(f"{fertig}/{gesamt} Dateien"),
+    )
+    print(f"Eingelesen in {time.perf_counter() - t:.2f}s")
+
+    speicher = DatenSpeicher()
+    for h, df in ergebnisse:
+        neu = speicher.schreibe(df, h)
+        print(f"{h[:12]}: {len(df):,} Zeilen, davon neu {sum(neu.values()):,}")
+    print("Partitionen:", ", ".join(speicher.partitionen()))
@@ -1,35 +1,227 @@
 # utils/gpt.py
 import os
+import sys
+import json
 import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
-from openai import OpenAI
 
-# API-Key: zuerst ENV, optional Streamlit-Secrets als Fallback
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    try:
-        import streamlit as st
-        api_key = st.secrets.get("OPENAI_API_KEY")
-    except Exception:
-        api_key = None
+from utils import telemetrie
+from utils.gpt_cache import KlassifikationsCache, prompt_version
+from utils.lokal_modell import LokalesModell
 
-if not api_key:
-    raise RuntimeError(
-        "Kein OpenAI-API-Key gefunden. Setze OPENAI_API_KEY oder st.secrets['OPENAI_API_KEY']."
-    )
+# Client entsteht erst beim ersten GPT-Aufruf – das openai-Paket (~0,5 s Import) wird
+# nur geladen, wenn wirklich klassifiziert wird. Ohne Key scheitert erst der Aufruf.
+client = None
+_CLIENT_LOCK = threading.Lock()
 
-client = OpenAI(api_key=api_key)
+
+def _api_key():
+    """Zuerst ENV, Streamlit-Secrets nur, wenn wir in der App laufen (CLI importiert kein streamlit)."""
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key and "streamlit" in sys.modules:
+        try:
+            import streamlit as st
+            api_key = st.secrets.get("OPENAI_API_KEY")
+        except Exception:
+            api_key = None
+    return api_key
+
+
+def _standard_client():
+    global client
+    with _CLIENT_LOCK:
+        if client is None:
+            api_key = _api_key()
+            if api_key:
+                from openai import OpenAI
+                # Retries übernimmt _chat (mit Rate-Limiter), nicht der Client selbst
+                client = OpenAI(api_key=api_key, max_retries=0)
+    return client
 
 SYSTEM_MSG = "Du bist ein Klassifizierungs- und Extraktions-Experte für Zeitdaten und Abrechnungs-Excel."
+MODEL = "gpt-4o-mini"
+
+# Limits des Accounts (ENV überschreibt die Defaults von gpt-4o-mini, Tier 1)
+MAX_PARALLEL = int(os.getenv("OPENAI_MAX_PARALLEL", "4"))
+# Ab dieser Konfidenz entscheidet das lokale Modell ohne GPT
+LOKAL_SCHWELLE = float(os.getenv("LOKAL_SCHWELLE", "0.8"))
+REQUESTS_PRO_MINUTE = int(os.getenv("OPENAI_RPM", "500"))
+TOKENS_PRO_MINUTE = int(os.getenv("OPENAI_TPM", "200000"))
+
 
 # ──────────────────────────────
-# Verrechenbarkeit (Intern/Extern)
+# Rate-Limiting & Retries
 # ──────────────────────────────
-def klassifiziere_verrechenbarkeit(zweck: str) -> str:
+class TokenBucket:
     """
-    Gibt 'Intern' oder 'Extern' zurück. Fehler werden nach wenigen Retries hochgereicht.
+    Thread-sicherer Token-Bucket: füllt sich mit `rate_pro_minute` auf, maximal bis `kapazitaet`.
     """
-    prompt = f"""
+
+    def __init__(self, rate_pro_minute: float, kapazitaet: float = None):
+        self.rate = rate_pro_minute / 60.0
+        self.kapazitaet = float(kapazitaet or rate_pro_minute)
+        self.stand = self.kapazitaet
+        self.zuletzt = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _auffuellen(self):
+        jetzt = time.monotonic()
+        self.stand = min(self.kapazitaet, self.stand + (jetzt - self.zuletzt) * self.rate)
+        self.zuletzt = jetzt
+
+    def wartezeit(self, menge: float) -> float:
+        """Reserviert `menge` und gibt zurück, wie lange bis dahin gewartet werden muss."""
+        menge = min(menge, self.kapazitaet)
+        with self.lock:
+            self._auffuellen()
+            self.stand -= menge
+            if self.stand >= 0:
+                return 0.0
+            return -self.stand / self.rate
+
+
+class RateLimiter:
+    """
+    Kombiniert Requests/min und Tokens/min. Nach einem 429 mit Retry-After
+    pausieren alle Threads gemeinsam, statt einzeln weiter anzuklopfen.
+    """
+
+    def __init__(self, rpm: int = REQUESTS_PRO_MINUTE, tpm: int = TOKENS_PRO_MINUTE):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.pause_bis = 0.0
+        self.lock = threading.Lock()
+
+    def pausieren(self, sekunden: float):
+        with self.lock:
+            self.pause_bis = max(self.pause_bis, time.monotonic() + sekunden)
+
+    def warten(self, tokens: int) -> float:
+        """Blockiert bis zur Freigabe. Rückgabe: gewartete Sekunden."""
+        warte = max(self.requests.wartezeit(1), self.tokens.wartezeit(tokens))
+        with self.lock:
+            warte = max(warte, self.pause_bis - time.monotonic())
+        if warte > 0:
+            time.sleep(warte)
+        return max(0.0, warte)
+
+
+LIMITER = RateLimiter()
+_CACHE = None
+
+
+def _cache(cache=None):
+    """cache=None → gemeinsamer Cache unter history/, cache=False → kein Cache."""
+    global _CACHE
+    if cache is False:
+        return None
+    if cache is not None:
+        return cache
+    if _CACHE is None:
+        _CACHE = KlassifikationsCache()
+    return _CACHE
+
+
+def _schaetze_tokens(messages, max_antwort: int = 0) -> int:
+    """Grobe Schätzung (~4 Zeichen pro Token) – reicht fürs Rate-Limiting."""
+    zeichen = sum(len(m.get("content") or "") for m in messages)
+    return zeichen // 4 + max_antwort
+
+
+def _retry_after(err) -> float:
+    """Liest Retry-After (Sekunden) aus einer OpenAI-Exception, falls vorhanden."""
+    response = getattr(err, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for key in ("retry-after-ms", "retry-after"):
+        wert = headers.get(key)
+        if wert is None:
+            continue
+        try:
+            sekunden = float(wert)
+        except (TypeError, ValueError):
+            continue
+        return sekunden / 1000.0 if key.endswith("-ms") else sekunden
+    return None
+
+
+def _backoff(attempt: int, retry_after: float = None) -> float:
+    """Exponentielles Backoff mit Full-Jitter; Retry-After des Servers hat Vorrang."""
+    if retry_after is not None:
+        return retry_after + random.uniform(0, 0.5)
+    return random.uniform(0, min(30.0, 1.5 * 2 ** attempt))
+
+
+class GPTFehler(RuntimeError):
+    """GPT-Aufruf endgültig gescheitert (kein Key, Netz, Auth, Limits) – die Ursache hängt als __cause__ dran."""
+
+
+def _chat(messages, client=None, limiter=None, max_versuche: int = 3, model: str = MODEL, **kwargs):
+    """
+    Ein Chat-Completion-Request mit Rate-Limit, Retries und Backoff.
+    Der Client ist injizierbar (Tests/Stub), Default ist das Modul-Attribut `client`.
+    Nach `max_versuche` Fehlversuchen wird die letzte Exception weitergereicht.
+    """
+    client = client or _standard_client()
+    if client is None:
+        raise RuntimeError(
+            "Kein OpenAI-API-Key gefunden. Setze OPENAI_API_KEY oder st.secrets['OPENAI_API_KEY']."
+        )
+    limiter = limiter or LIMITER
+    tokens = _schaetze_tokens(messages, kwargs.get("max_tokens") or 256)
+    start = time.perf_counter()
+    fehler = []
+
+    for attempt in range(max_versuche):
+        wartezeit = limiter.warten(tokens)
+        t = time.perf_counter()
+        try:
+            r = client.chat.completions.create(
+                model=model,
+                temperature=0,
+                messages=messages,
+                **kwargs,
+            )
+        except Exception as e:
+            # Fehlversuche nicht verschlucken: Typ/Status landen in der Telemetrie
+            fehler.append(f"{type(e).__name__}:{getattr(e, 'status_code', '')}".rstrip(":"))
+            if attempt == max_versuche - 1:
+                _erfasse_aufruf(model, start, t, attempt + 1, fehler, None, wartezeit)
+                raise
+            retry_after = _retry_after(e)
+            if retry_after is not None:
+                limiter.pausieren(retry_after)
+            time.sleep(_backoff(attempt, retry_after))
+        else:
+            _erfasse_aufruf(model, start, t, attempt + 1, fehler, r, wartezeit)
+            return r
+
+
+def _erfasse_aufruf(model, start, t_letzter, versuche, fehler, antwort, wartezeit):
+    """Ein GPT-Aufruf als Telemetrie-Ereignis: Latenz des letzten Versuchs, Gesamtdauer, Tokens, Retries."""
+    usage = getattr(antwort, "usage", None)
+    jetzt = time.perf_counter()
+    telemetrie.erfasse({
+        "typ": "gpt",
+        "modell": model,
+        "ok": antwort is not None,
+        "versuche": versuche,
+        "fehler": fehler,
+        "latenz_ms": round((jetzt - t_letzter) * 1000, 1),
+        "gesamt_ms": round((jetzt - start) * 1000, 1),
+        "limiter_wartezeit_ms": round((wartezeit or 0) * 1000, 1),
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+    })
+
+
+# ──────────────────────────────
+# Verrechenbarkeit (Intern/Extern)
+# ──────────────────────────────
+KLASSIFIZIERUNG_PROMPT = """
 Der folgende Zweck stammt aus einer Zeitbuchung eines Ingenieurbüros für Nachhaltigkeitsberatung.
 
 Klassifiziere als:
@@ -43,37 +235,322 @@ Zweck: "{zweck}"
 Antworte nur mit: Intern oder Extern.
 """.strip()
 
-    last_err = None
-    for attempt in range(3):
+
+def klassifiziere_verrechenbarkeit(zweck: str, client=None, limiter=None, cache=None) -> str:
+    """
+    Gibt 'Intern' oder 'Extern' zurück. Fehler werden nach wenigen Retries als GPTFehler hochgereicht.
+    Bereits klassifizierte Zwecke kommen aus dem Cache (cache=False schaltet ihn ab).
+    """
+    cache = _cache(cache)
+    if cache:
+        treffer = cache.hole([zweck], PROMPT_VERSION)
+        if zweck in treffer:
+            return treffer[zweck]
+
+    prompt = KLASSIFIZIERUNG_PROMPT.format(zweck=zweck)
+
+    try:
+        r = _chat(
+            [
+                {"role": "system", "content": SYSTEM_MSG},
+                {"role": "user", "content": prompt},
+            ],
+            client=client,
+            limiter=limiter,
+        )
+    except Exception as e:
+        raise GPTFehler(f"GPT-Klassifizierung fehlgeschlagen: {e}") from e
+
+    ans = (r.choices[0].message.content or "").strip().lower()
+    if ans.startswith("intern"):
+        kat = "Intern"
+    elif ans.startswith("extern"):
+        kat = "Extern"
+    else:
+        kat = "Unbekannt"
+
+    if cache:
+        cache.speichere({zweck: kat}, PROMPT_VERSION, MODEL)
+    return kat
+
+
+# ──────────────────────────────
+# Verrechenbarkeit im Batch (viele Zwecke pro Request)
+# ──────────────────────────────
+BATCH_PROMPT = """
+Die folgenden Zwecke stammen aus Zeitbuchungen eines Ingenieurbüros für Nachhaltigkeitsberatung.
+
+Klassifiziere jeden Zweck als:
+- Extern: projektbezogene Kundenleistung (z.B. Berechnung, DGNB, LCA/LCC, Zertifizierung, Planung, Audit, Ausführung).
+- Intern: firmeninterne Tätigkeit (z.B. Akquise, interne Besprechung, Verwaltung, Personal).
+
+Wenn nicht klar intern, dann Extern.
+
+Zwecke (id: Zweck):
+{liste}
+
+Antworte ausschließlich mit JSON in der Form:
+{{"ergebnisse": [{{"id": 1, "kategorie": "Intern"}}, {{"id": 2, "kategorie": "Extern"}}]}}
+""".strip()
+
+# Ändert sich System-Message, Prompt oder Modell, greifen alte Cache-Einträge nicht mehr
+PROMPT_VERSION = prompt_version(SYSTEM_MSG, KLASSIFIZIERUNG_PROMPT, BATCH_PROMPT, MODEL)
+
+
+def invalidiere_cache(zwecke=None, nur_alte_versionen: bool = False) -> int:
+    """
+    Räumt den Klassifizierungs-Cache auf: einzelne Zwecke (alle Versionen),
+    nur Einträge veralteter Prompt-Versionen oder – ohne Argumente – alles.
+    """
+    ausser = PROMPT_VERSION if nur_alte_versionen else None
+    return _cache().invalidiere(ausser_version=ausser, zwecke=zwecke)
+
+
+def cache_statistik() -> dict:
+    return _cache().statistik()
+
+
+def _parse_batch_antwort(ans: str, ids) -> dict:
+    """
+    Liest die JSON-Antwort eines Batch-Requests. Gibt {id: 'Intern'|'Extern'} zurück –
+    nur für gültige Einträge; alles andere fehlt im Ergebnis und wird nachgefragt.
+    """
+    try:
+        daten = json.loads(ans)
+    except (TypeError, ValueError):
+        return {}
+
+    eintraege = daten.get("ergebnisse", []) if isinstance(daten, dict) else daten
+    if not isinstance(eintraege, list):
+        return {}
+
+    gueltig = {}
+    for e in eintraege:
+        if not isinstance(e, dict):
+            continue
         try:
-            r = client.chat.completions.create(
-                model="gpt-4o-mini",
-                temperature=0,
-                messages=[
-                    {"role": "system", "content": SYSTEM_MSG},
-                    {"role": "user", "content": prompt},
-                ],
-            )
-            ans = (r.choices[0].message.content or "").strip().lower()
-            if ans.startswith("intern"):
-                return "Intern"
-            if ans.startswith("extern"):
-                return "Extern"
-            return "Unbekannt"
-        except Exception as e:
-            last_err = str(e)
-            time.sleep(1.5 ** attempt)
+            i = int(e.get("id"))
+        except (TypeError, ValueError):
+            continue
+        kat = str(e.get("kategorie", "")).strip().lower()
+        if i not in ids:
+            continue
+        if kat.startswith("intern"):
+            gueltig[i] = "Intern"
+        elif kat.startswith("extern"):
+            gueltig[i] = "Extern"
+    return gueltig
+
+
+def _klassifiziere_batch_request(zwecke: list, client=None, limiter=None) -> dict:
+    """
+    Ein einzelner Batch-Request. Rückgabe: {Zweck: 'Intern'|'Extern'} für alle gültig beantworteten Zwecke.
+    """
+    nummeriert = {i + 1: z for i, z in enumerate(zwecke)}
+    liste = "\n".join(f"{i}: {json.dumps(z, ensure_ascii=False)}" for i, z in nummeriert.items())
+    prompt = BATCH_PROMPT.format(liste=liste)
+
+    try:
+        r = _chat(
+            [
+                {"role": "system", "content": SYSTEM_MSG},
+                {"role": "user", "content": prompt},
+            ],
+            client=client,
+            limiter=limiter,
+            response_format={"type": "json_object"},
+            max_tokens=20 * len(zwecke) + 50,
+        )
+    except Exception as e:
+        raise GPTFehler(f"GPT-Batch-Klassifizierung fehlgeschlagen: {e}") from e
+
+    ans = (r.choices[0].message.content or "").strip()
+    gueltig = _parse_batch_antwort(ans, set(nummeriert))
+    return {nummeriert[i]: kat for i, kat in gueltig.items()}
+
+
+def klassifiziere_verrechenbarkeit_batch(zwecke, batch_size: int = 40, max_runden: int = 3,
+                                         max_parallel: int = None, cache=None) -> dict:
+    """
+    Klassifiziert viele Zwecke mit wenigen Requests (batch_size Zwecke pro Prompt).
+    Fehlende oder ungültige Antworten werden in weiteren Runden gezielt nachgefragt,
+    Reste danach einzeln über klassifiziere_verrechenbarkeit. Cache-Treffer kosten keinen Request.
+
+    Rückgabe: ({Zweck: 'Intern' | 'Extern' | 'Unbekannt'}, {Zweck: Fehlertext}) – Zwecke,
+    deren Requests scheitern, stehen nur in den Fehlern; die übrigen Ergebnisse bleiben erhalten.
+    """
+    engine = KlassifikationsEngine(max_parallel=max_parallel, cache=cache)
+    return engine.klassifiziere(zwecke, batch_size=batch_size, max_runden=max_runden)
+
+
+# ──────────────────────────────
+# Parallele Engine (begrenzte Parallelität + Rate-Limit)
+# ──────────────────────────────
+class KlassifikationsEngine:
+    """
+    Führt GPT-Aufrufe in einem Thread-Pool aus – höchstens `max_parallel` gleichzeitig,
+    gedrosselt über einen gemeinsamen RateLimiter (Requests/min + Tokens/min).
+
+    `client` ersetzt den Modul-Client (z.B. Stub oder lokaler Fake-Server),
+    `rpm`/`tpm` erzeugen einen eigenen Limiter statt des globalen LIMITER,
+    `cache` einen eigenen KlassifikationsCache (False = ohne Cache).
+    """
+
+    def __init__(self, max_parallel: int = None, rpm: int = None, tpm: int = None, client=None, cache=None):
+        self.max_parallel = max(1, int(max_parallel or MAX_PARALLEL))
+        self.client = client
+        self.cache = _cache(cache)
+        if rpm or tpm:
+            self.limiter = RateLimiter(rpm or REQUESTS_PRO_MINUTE, tpm or TOKENS_PRO_MINUTE)
+        else:
+            self.limiter = LIMITER
+
+    def _map(self, fn, items, parallel: bool = True):
+        """Wendet fn parallel auf items an; Reihenfolge der Ergebnisse bleibt erhalten."""
+        items = list(items)
+        if not parallel or self.max_parallel == 1 or len(items) <= 1:
+            return [fn(x) for x in items]
+        # Worker-Threads erfassen ihre GPT-Aufrufe im Telemetrie-Lauf des Aufrufers
+        with ThreadPoolExecutor(max_workers=min(self.max_parallel, len(items))) as pool:
+            return list(pool.map(telemetrie.im_kontext(fn), items))
+
+    def klassifiziere(self, zwecke, batch_size: int = 40, max_runden: int = 3, parallel: bool = True) -> tuple:
+        """
+        Batch-Klassifizierung wie klassifiziere_verrechenbarkeit_batch, Batches parallel.
+        Rückgabe: (Ergebnisse, Fehler {Zweck: Text}); ein gescheiterter Request kostet nur
+        seine eigenen Zwecke – sie werden nicht einzeln nachgefragt. parallel=False für Aufrufer, die selbst schon parallel klassifizieren (z.B. der
+        Klassifikations-Job) – sonst wären bis zu max_parallel² Requests gleichzeitig offen.
+        """
+        offen = list(dict.fromkeys(str(z).strip() for z in zwecke if str(z).strip()))
+        ergebnis, fehler = {}, {}
+
+        if self.cache:
+            ergebnis.update(self.cache.hole(offen, PROMPT_VERSION))
+            offen = [z for z in offen if z not in ergebnis]
+
+        def batch(teil):
+            try:
+                return _klassifiziere_batch_request(teil, client=self.client, limiter=self.limiter), None
+            except GPTFehler as e:
+                return {}, str(e)
+
+        def einzeln(zweck):
+            try:
+                return klassifiziere_verrechenbarkeit(
+                    zweck, client=self.client, limiter=self.limiter, cache=self.cache or False
+                ), None
+            except GPTFehler as e:
+                return None, str(e)
+
+        for _ in range(max_runden):
+            if not offen:
+                break
+            teile = [offen[i:i + batch_size] for i in range(0, len(offen), batch_size)]
+            for teil, (teil_ergebnis, text) in zip(teile, self._map(batch, teile, parallel)):
+                if text is not None:
+                    fehler.update(dict.fromkeys(teil, text))
+                    continue
+                ergebnis.update(teil_ergebnis)
+                if self.cache:
+                    self.cache.speichere(teil_ergebnis, PROMPT_VERSION, MODEL)
+            offen = [z for z in offen if z not in ergebnis and z not in fehler]
+
+        # Letzte Reste einzeln klassifizieren
+        for zweck, (kat, text) in zip(offen, self._map(einzeln, offen, parallel)):
+            if text is None:
+                ergebnis[zweck] = kat
+            else:
+                fehler[zweck] = text
+        return ergebnis, fehler
+
+    def extrahiere(self, dfs: dict) -> dict:
+        """
+        extrahiere_abrechnungsblock für mehrere Dateien parallel.
+        dfs: {Name: rohes DataFrame} → Rückgabe: {Name: DataFrame ["Kürzel", "Einsatztage_SOLL"]}
+        """
+        namen = list(dfs)
+        ergebnisse = self._map(
+            lambda n: extrahiere_abrechnungsblock(dfs[n], client=self.client, limiter=self.limiter),
+            namen,
+        )
+        return dict(zip(namen, ergebnisse))
+
+
+# ──────────────────────────────
+# Gestufte Klassifizierung: lokales Modell → GPT
+# ──────────────────────────────
+_MODELL = None
+_MODELL_LOCK = threading.Lock()
+
+
+def lokales_modell(mapping_df: pd.DataFrame = None) -> LokalesModell:
+    """
+    Prozessweites lokales Modell. Beim ersten Aufruf aus dem Stammdaten-Mapping trainiert;
+    mit `mapping_df` werden nur die geänderten Zeilen nachgelernt. Ohne Spalte "Herkunft"
+    gilt jede Zeile als bestätigt – Aufrufer mit Stammdaten-Mapping laden es mit herkunft=True.
+    """
+    global _MODELL
+    with _MODELL_LOCK:
+        if _MODELL is None:
+            _MODELL = LokalesModell()
+            if mapping_df is None:
+                from utils.stammdaten import lade_mapping
+                mapping_df = lade_mapping(herkunft=True)
+    if mapping_df is not None and "Verrechenbarkeit" in mapping_df.columns:
+        _MODELL.synchronisiere(mapping_df)
+    return _MODELL
 
-    raise RuntimeError(f"GPT-Klassifizierung fehlgeschlagen: {last_err}")
+
+def klassifiziere_gestuft(zwecke, mapping_df: pd.DataFrame = None, schwelle: float = None, ki: bool = True,
+                          **batch_kwargs) -> dict:
+    """
+    Lokales Modell zuerst; nur unsichere Zwecke (Konfidenz < schwelle) gehen an
+    klassifiziere_verrechenbarkeit_batch. Ist GPT nicht erreichbar (offline, kein Key)
+    oder ki=False, bleiben diese Zwecke offen (Kategorie "") statt geraten zu werden.
+
+    Rückgabe: ({Zweck: (Kategorie, Quelle 'lokal'|'gpt'|'offen', Konfidenz)}, {Zweck: Fehlertext}).
+    Gescheiterte KI-Anfragen stehen mit Grund in den Fehlern (und in der Telemetrie) –
+    nur so unterscheiden sie sich von Zwecken, die die KI nicht eindeutig zuordnen konnte.
+    """
+    schwelle = LOKAL_SCHWELLE if schwelle is None else schwelle
+    modell = lokales_modell(mapping_df)
+    ergebnis, unsicher, fehler = {}, {}, {}
+    for zweck, (kat, konf) in modell.vorhersage_viele(zwecke).items():
+        if kat is not None and konf >= schwelle:
+            ergebnis[zweck] = (kat, "lokal", round(konf, 3))
+        else:
+            unsicher[zweck] = konf
+
+    if unsicher:
+        gpt = {}
+        if ki:
+            try:
+                gpt, fehler = klassifiziere_verrechenbarkeit_batch(list(unsicher), **batch_kwargs)
+            except GPTFehler as e:
+                fehler = dict.fromkeys(unsicher, str(e))
+        for text in set(fehler.values()):
+            telemetrie.erfasse({
+                "typ": "klassifikation_fehler",
+                "fehler": text,
+                "zwecke": sum(1 for t in fehler.values() if t == text),
+            })
+        for zweck, konf in unsicher.items():
+            kat = gpt.get(zweck)
+            if kat in ("Intern", "Extern"):
+                ergebnis[zweck] = (kat, "gpt", round(konf, 3))
+            else:
+                ergebnis[zweck] = ("", "offen", round(konf, 3))
+    return ergebnis, fehler
 
 
 # ──────────────────────────────
 # Abrechnungs-Zusammenfassung aus Excel
 # ──────────────────────────────
-def extrahiere_abrechnungsblock(df: pd.DataFrame) -> pd.DataFrame:
+def extrahiere_abrechnungsblock(df: pd.DataFrame, client=None, limiter=None) -> pd.DataFrame:
     """
     Nimmt ein rohes Excel-DataFrame (ohne Header), schickt es an GPT
     und bekommt zurück, welche Kürzel + Einsatztage SOLL relevant sind.
+    Nur Fallback für Dateien, in denen rechnung.lese_abrechnung_lokal keinen Block findet.
 
     Rückgabe: DataFrame mit ["Kürzel", "Einsatztage_SOLL"]
     """
@@ -97,48 +574,48 @@ Hier ist der Tabellenausschnitt (als Text):
 {preview}
 """
 
-    last_err = None
-    for attempt in range(3):
-        try:
-            r = client.chat.completions.create(
-                model="gpt-4o-mini",
-                temperature=0,
-                messages=[
-                    {"role": "system", "content": SYSTEM_MSG},
-                    {"role": "user", "content": prompt},
-                ],
-            )
-            ans = (r.choices[0].message.content or "").strip()
-
-            # CSV-Parsing in DataFrame
-            from io import StringIO
-            try:
-                parsed = pd.read_csv(StringIO(ans))
-                if "Kürzel" in parsed.columns and "Einsatztage_SOLL" in parsed.columns:
-                    parsed["Kürzel"] = parsed["Kürzel"].astype(str).str.strip()
-                    parsed["Einsatztage_SOLL"] = pd.to_numeric(parsed["Einsatztage_SOLL"], errors="coerce").fillna(0.0)
-                    return parsed
-            except Exception:
-                pass
+    try:
+        r = _chat(
+            [
+                {"role": "system", "content": SYSTEM_MSG},
+                {"role": "user", "content": prompt},
+            ],
+            client=client,
+            limiter=limiter,
+        )
+    except Exception as e:
+        raise GPTFehler(f"GPT-Extraktion fehlgeschlagen: {e}") from e
 
-            # Falls nicht parsebar → zurückgeben als leeres DF
-            return pd.DataFrame(columns=["Kürzel", "Einsatztage_SOLL"])
+    ans = (r.choices[0].message.content or "").strip()
 
-        except Exception as e:
-            last_err = str(e)
-            time.sleep(1.5 ** attempt)
+    # CSV-Parsing in DataFrame
+    from io import StringIO
+    try:
+        parsed = pd.read_csv(StringIO(ans))
+        if "Kürzel" in parsed.columns and "Einsatztage_SOLL" in parsed.columns:
+            parsed["Kürzel"] = parsed["Kürzel"].astype(str).str.strip()
+            parsed["Einsatztage_SOLL"] = pd.to_numeric(parsed["Einsatztage_SOLL"], errors="coerce").fillna(0.0)
+            return parsed
+    except Exception:
+        pass
 
-    raise RuntimeError(f"GPT-Extraktion fehlgeschlagen: {last_err}")
+    # Falls nicht parsebar → zurückgeben als leeres DF
+    return pd.DataFrame(columns=["Kürzel", "Einsatztage_SOLL"])
 
 
 # ──────────────────────────────
 # Manuell testen
 # ──────────────────────────────
 if __name__ == "__main__":
-    import sys
     if len(sys.argv) > 1 and sys.argv[1] == "zweck":
         text = " ".join(sys.argv[2:]) or "DGNB Nachweis"
         print(klassifiziere_verrechenbarkeit(text))
+    elif len(sys.argv) > 1 and sys.argv[1] == "gestuft":
+        zwecke = sys.argv[2:] or [".3 Planungsphase", "Akquise intern", "Quantencomputing"]
+        print(klassifiziere_gestuft(zwecke))
+    elif len(sys.argv) > 1 and sys.argv[1] == "batch":
+        zwecke = sys.argv[2:] or ["DGNB Nachweis", "Akquise", "Interne Besprechung"]
+        print(klassifiziere_verrechenbarkeit_batch(zwecke))
     else:
         # Dummy-Test mit Fake-Daten
         test_df = pd.DataFrame({
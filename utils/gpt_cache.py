@@ -0,0 +1,138 @@
+# utils/gpt_cache.py
+import os
+import re
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+CACHE_PATH = os.path.join("history", "gpt_cache.sqlite")
+
+
+def normalisiere_schluessel(zweck: str) -> str:
+    """Cache-Schlüssel: Leerraum zusammenfassen, Groß-/Kleinschreibung ignorieren."""
+    return re.sub(r"\s+", " ", str(zweck)).strip().casefold()
+
+
+def prompt_version(*teile) -> str:
+    """Kurzer Hash über System-Message, Prompt-Vorlagen und Modell."""
+    h = hashlib.sha256()
+    for t in teile:
+        h.update(str(t).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:16]
+
+
+class KlassifikationsCache:
+    """
+    Persistenter Cache (SQLite) für GPT-Klassifizierungen.
+    Schlüssel: normalisierter Zweck + Prompt-Version (Hash aus SYSTEM_MSG, Prompt, Modell).
+    Zählt Treffer/Fehlschläge pro Prozess.
+    """
+
+    def __init__(self, path: str = CACHE_PATH):
+        self.path = path
+        self.treffer = 0
+        self.fehlschlaege = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as con:
+            con.execute(
+                """
+                CREATE TABLE IF NOT EXISTS klassifikation (
+                    zweck_norm TEXT NOT NULL,
+                    version    TEXT NOT NULL,
+                    zweck      TEXT,
+                    kategorie  TEXT NOT NULL,
+                    model      TEXT,
+                    erstellt   TEXT,
+                    PRIMARY KEY (zweck_norm, version)
+                )
+                """
+            )
+
+    @contextmanager
+    def _connect(self):
+        con = sqlite3.connect(self.path, timeout=10)
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    def hole(self, zwecke, version: str) -> dict:
+        """Rückgabe: {Zweck: Kategorie} für alle Zwecke, die im Cache liegen."""
+        zwecke = list(dict.fromkeys(zwecke))
+        nach_schluessel = {}
+        for z in zwecke:
+            nach_schluessel.setdefault(normalisiere_schluessel(z), []).append(z)
+
+        gefunden = {}
+        schluessel = list(nach_schluessel)
+        with self._connect() as con:
+            for start in range(0, len(schluessel), 500):
+                teil = schluessel[start:start + 500]
+                platzhalter = ",".join("?" * len(teil))
+                rows = con.execute(
+                    f"SELECT zweck_norm, kategorie FROM klassifikation "
+                    f"WHERE version = ? AND zweck_norm IN ({platzhalter})",
+                    [version, *teil],
+                ).fetchall()
+                for key, kat in rows:
+                    for z in nach_schluessel[key]:
+                        gefunden[z] = kat
+
+        with self._lock:
+            self.treffer += len(gefunden)
+            self.fehlschlaege += len(zwecke) - len(gefunden)
+        return gefunden
+
+    def speichere(self, ergebnisse: dict, version: str, model: str = None):
+        """Legt {Zweck: Kategorie} ab. 'Unbekannt' wird nicht gecacht, damit es erneut versucht wird."""
+        jetzt = datetime.now().isoformat(timespec="seconds")
+        rows = [
+            (normalisiere_schluessel(z), version, z, kat, model, jetzt)
+            for z, kat in ergebnisse.items()
+            if kat in ("Intern", "Extern")
+        ]
+        if not rows:
+            return
+        with self._connect() as con:
+            con.executemany(
+                "INSERT OR REPLACE INTO klassifikation "
+                "(zweck_norm, version, zweck, kategorie, model, erstellt) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def invalidiere(self, version: str = None, ausser_version: str = None, zwecke=None) -> int:
+        """
+        Löscht Einträge gezielt – z.B. alle alten Prompt-Versionen (`ausser_version=aktuell`),
+        eine bestimmte Version oder einzelne Zwecke. Ohne Argumente: alles.
+        Rückgabe: Anzahl gelöschter Einträge.
+        """
+        bedingungen, params = [], []
+        if version is not None:
+            bedingungen.append("version = ?")
+            params.append(version)
+        if ausser_version is not None:
+            bedingungen.append("version <> ?")
+            params.append(ausser_version)
+        if zwecke is not None:
+            schluessel = [normalisiere_schluessel(z) for z in zwecke]
+            if not schluessel:
+                return 0
+            bedingungen.append(f"zweck_norm IN ({','.join('?' * len(schluessel))})")
+            params.extend(schluessel)
+
+        sql = "DELETE FROM klassifikation"
+        if bedingungen:
+            sql += " WHERE " + " AND ".join(bedingungen)
+        with self._connect() as con:
+            return con.execute(sql, params).rowcount
+
+    def statistik(self) -> dict:
+        """Treffer/Fehlschläge dieses Prozesses und Anzahl Einträge je Prompt-Version."""
+        with self._connect() as con:
+            versionen = dict(con.execute("SELECT version, COUNT(*) FROM klassifikation GROUP BY version").fetchall())
+        return {"treffer": self.treffer, "fehlschlaege": self.fehlschlaege, "versionen": versionen}
@@ -0,0 +1,118 @@
+# utils/historie.py
+import os
+import json
+import hashlib
+from datetime import datetime
+
+from utils.ablage import ordner_sperre, tmp_pfad
+
+MANIFEST = "_manifest.json"
+
+
+def _sha256_datei(pfad: str) -> str:
+    h = hashlib.sha256()
+    with open(pfad, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class HistorienIndex:
+    """
+    Manifest über einen History-Ordner (Name, Größe, Zeitstempel, Hash, Zeilen).
+    Seiten und Filter arbeiten nur auf dem Manifest; Dateiinhalte werden erst gelesen,
+    wenn ein Download tatsächlich angefordert wird (lese).
+    """
+
+    def __init__(self, ordner: str):
+        self.ordner = ordner
+        self.pfad = os.path.join(ordner, MANIFEST)
+        os.makedirs(ordner, exist_ok=True)
+
+    # ---------- Manifest lesen/schreiben ----------
+    def _laden(self) -> dict:
+        try:
+            with open(self.pfad, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _speichern(self, eintraege: dict):
+        tmp = tmp_pfad(self.pfad)
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(eintraege, f, ensure_ascii=False)
+        os.replace(tmp, self.pfad)
+
+    def _eintrag(self, name: str, stat, sha256: str = None, zeilen: int = None) -> dict:
+        return {
+            "name": name,
+            "groesse": stat.st_size,
+            "zeitstempel": datetime.fromtimestamp(stat.st_mtime).isoformat(timespec="seconds"),
+            "mtime": stat.st_mtime,
+            "sha256": sha256,
+            "zeilen": zeilen,
+        }
+
+    def synchronisiere(self) -> dict:
+        """
+        Gleicht das Manifest per os.scandir mit dem Ordner ab (nur Metadaten, kein Lesen).
+        Neue oder geänderte Dateien bekommen einen Eintrag, gelöschte verschwinden.
+        """
+        with ordner_sperre(self.ordner):
+            eintraege = self._laden()
+            gefunden = {}
+            for e in os.scandir(self.ordner):
+                if not e.is_file() or e.name.startswith("_") or ".tmp" in e.name:
+                    continue
+                stat = e.stat()
+                alt = eintraege.get(e.name)
+                if alt and alt.get("groesse") == stat.st_size and alt.get("mtime") == stat.st_mtime:
+                    gefunden[e.name] = alt
+                else:
+                    gefunden[e.name] = self._eintrag(e.name, stat)
+            if gefunden != eintraege:
+                self._speichern(gefunden)
+            return gefunden
+
+    def registriere(self, name: str, zeilen: int = None, sha256: str = None):
+        """Trägt eine gerade geschriebene Datei mit Hash und Zeilenzahl ins Manifest ein."""
+        pfad = os.path.join(self.ordner, name)
+        with ordner_sperre(self.ordner):
+            eintraege = self._laden()
+            eintraege[name] = self._eintrag(name, os.stat(pfad), sha256 or _sha256_datei(pfad), zeilen)
+            self._speichern(eintraege)
+
+    def entferne(self, name: str):
+        with ordner_sperre(self.ordner):
+            pfad = os.path.join(self.ordner, name)
+            if os.path.exists(pfad):
+                os.remove(pfad)
+            eintraege = self._laden()
+            if eintraege.pop(name, None) is not None:
+                self._speichern(eintraege)
+
+    # ---------- Abfragen ----------
+    def seite(self, filter_text: str = "", seite: int = 1, pro_seite: int = 20):
+        """
+        Rückgabe: (Einträge der Seite, Anzahl Treffer gesamt) – neueste zuerst (nach der
+        gespeicherten mtime, nicht nach dem Namen), gefiltert über Teilstring im Dateinamen.
+        """
+        eintraege = sorted(self.synchronisiere().values(), key=lambda e: (e.get("mtime") or 0, e["name"]),
+                           reverse=True)
+        if filter_text:
+            f = filter_text.lower()
+            eintraege = [e for e in eintraege if f in e["name"].lower()]
+        start = max(0, (seite - 1) * pro_seite)
+        return eintraege[start:start + pro_seite], len(eintraege)
+
+    def suche_hash(self, sha256: str):
+        """Eintrag mit diesem Inhalts-Hash oder None."""
+        return next((e for e in self.synchronisiere().values() if e.get("sha256") == sha256), None)
+
+    def pfad_von(self, name: str) -> str:
+        return os.path.join(self.ordner, name)
+
+    def lese(self, name: str) -> bytes:
+        """Dateiinhalt – erst beim tatsächlichen Download aufgerufen."""
+        with open(self.pfad_von(name), "rb") as f:
+            return f.read()
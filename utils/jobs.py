@@ -0,0 +1,337 @@
+# utils/jobs.py
+import os
+import time
+import socket
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import pandas as pd
+
+from utils import telemetrie
+
+JOBS_PATH = os.path.join("history", "jobs.sqlite")
+AKTIV = ("wartend", "laeuft")
+# Ohne Herzschlag so lange gilt ein laufender Job als verwaist (Prozess beendet) und wird übernommen
+VERWAIST_NACH_S = 120
+BATCH_GROESSE = 40
+# Fehlertext für unsichere Zwecke ohne KI – bleiben im Job zum erneuten Versuch, nie leer ins Mapping
+OHNE_KI = "unsicher – KI nicht erreichbar"
+
+BESITZER = f"{socket.gethostname()}:{os.getpid()}"
+log = logging.getLogger(__name__)
+
+
+class JobStore:
+    """
+    Persistente Klassifikations-Jobs (SQLite): ein Datensatz je Job und je Zweck
+    (offen/fertig/fehler mit Kategorie, Quelle und Fehlertext). Ergebnisse werden pro
+    Batch festgeschrieben – ein Abbruch verliert höchstens den laufenden Batch.
+    """
+
+    def __init__(self, path: str = JOBS_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute(
+                """
+                CREATE TABLE IF NOT EXISTS job (
+                    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+                    status     TEXT NOT NULL,
+                    ki         INTEGER NOT NULL,
+                    erstellt   TEXT,
+                    gestartet  REAL,
+                    beendet    TEXT,
+                    besitzer   TEXT,
+                    herzschlag REAL,
+                    fehler     TEXT
+                )
+                """
+            )
+            con.execute(
+                """
+                CREATE TABLE IF NOT EXISTS job_eintrag (
+                    job_id    INTEGER NOT NULL,
+                    zweck     TEXT NOT NULL,
+                    status    TEXT NOT NULL,
+                    kategorie TEXT,
+                    quelle    TEXT,
+                    fehler    TEXT,
+                    erledigt  REAL,
+                    PRIMARY KEY (job_id, zweck)
+                )
+                """
+            )
+
+    @contextmanager
+    def _connect(self):
+        con = sqlite3.connect(self.path, timeout=10)
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    # ---------- Anlegen & Übernehmen ----------
+    def lege_an(self, zwecke, ki: bool = True) -> int:
+        zwecke = list(dict.fromkeys(str(z).strip() for z in zwecke if str(z).strip()))
+        with self._connect() as con:
+            job_id = con.execute(
+                "INSERT INTO job (status, ki, erstellt) VALUES ('wartend', ?, ?)",
+                (int(ki), datetime.now().isoformat(timespec="seconds")),
+            ).lastrowid
+            con.executemany(
+                "INSERT INTO job_eintrag (job_id, zweck, status) VALUES (?, ?, 'offen')",
+                [(job_id, z) for z in zwecke],
+            )
+        return job_id
+
+    def beanspruche(self, job_id: int, besitzer: str = BESITZER) -> bool:
+        """Übernimmt einen wartenden oder verwaisten Job atomar – nie zwei Worker pro Job."""
+        jetzt = time.time()
+        with self._connect() as con:
+            return con.execute(
+                "UPDATE job SET status = 'laeuft', besitzer = ?, herzschlag = ?, gestartet = ? "
+                "WHERE id = ? AND (status = 'wartend' OR (status = 'laeuft' AND "
+                "(besitzer = ? OR herzschlag IS NULL OR herzschlag < ?)))",
+                (besitzer, jetzt, jetzt, job_id, besitzer, jetzt - VERWAIST_NACH_S),
+            ).rowcount == 1
+
+    def verwaiste(self) -> list:
+        """Jobs, die nach einem Neustart fortgesetzt werden müssen."""
+        with self._connect() as con:
+            rows = con.execute(
+                "SELECT id FROM job WHERE status = 'wartend' OR (status = 'laeuft' AND "
+                "(herzschlag IS NULL OR herzschlag < ?)) ORDER BY id",
+                (time.time() - VERWAIST_NACH_S,),
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    # ---------- Checkpoints ----------
+    def offene(self, job_id: int) -> list:
+        with self._connect() as con:
+            rows = con.execute(
+                "SELECT zweck FROM job_eintrag WHERE job_id = ? AND status = 'offen' ORDER BY rowid", (job_id,)
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def erledige(self, job_id: int, ergebnisse: dict, fehler: dict = None):
+        """ergebnisse {Zweck: (Kategorie, Quelle)}, fehler {Zweck: Text} – eine Transaktion, mit Herzschlag."""
+        jetzt = time.time()
+        with self._connect() as con:
+            con.executemany(
+                "UPDATE job_eintrag SET status = 'fertig', kategorie = ?, quelle = ?, fehler = NULL, erledigt = ? "
+                "WHERE job_id = ? AND zweck = ?",
+                [(kat, quelle, jetzt, job_id, z) for z, (kat, quelle) in ergebnisse.items()],
+            )
+            con.executemany(
+                "UPDATE job_eintrag SET status = 'fehler', fehler = ?, erledigt = ? WHERE job_id = ? AND zweck = ?",
+                [(text, jetzt, job_id, z) for z, text in (fehler or {}).items()],
+            )
+            con.execute("UPDATE job SET herzschlag = ? WHERE id = ?", (jetzt, job_id))
+
+    def beende(self, job_id: int, fehler: str = None):
+        with self._connect() as con:
+            offen = con.execute(
+                "SELECT COUNT(*) FROM job_eintrag WHERE job_id = ? AND status = 'fehler'", (job_id,)
+            ).fetchone()[0]
+            status = "abgebrochen" if fehler else ("fertig_mit_fehlern" if offen else "fertig")
+            con.execute(
+                "UPDATE job SET status = ?, beendet = ?, fehler = ?, besitzer = NULL WHERE id = ?",
+                (status, datetime.now().isoformat(timespec="seconds"), fehler, job_id),
+            )
+
+    # ---------- Abfragen ----------
+    def job(self, job_id: int = None):
+        """Job als dict (ohne job_id: der zuletzt angelegte) oder None."""
+        sql = "SELECT id, status, ki, erstellt, gestartet, beendet, fehler FROM job"
+        with self._connect() as con:
+            if job_id is None:
+                row = con.execute(sql + " ORDER BY id DESC LIMIT 1").fetchone()
+            else:
+                row = con.execute(sql + " WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("id", "status", "ki", "erstellt", "gestartet", "beendet", "fehler"), row))
+
+    def fortschritt(self, job_id: int) -> dict:
+        """Zähler je Status und Quelle, Durchsatz seit (Wieder-)Start und geschätzte Restzeit."""
+        with self._connect() as con:
+            status = dict(con.execute(
+                "SELECT status, COUNT(*) FROM job_eintrag WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall())
+            quellen = dict(con.execute(
+                "SELECT quelle, COUNT(*) FROM job_eintrag WHERE job_id = ? AND status = 'fertig' GROUP BY quelle",
+                (job_id,),
+            ).fetchall())
+            gestartet = con.execute("SELECT gestartet FROM job WHERE id = ?", (job_id,)).fetchone()[0]
+            seit_start = 0
+            if gestartet:
+                seit_start = con.execute(
+                    "SELECT COUNT(*) FROM job_eintrag WHERE job_id = ? AND status <> 'offen' AND erledigt >= ?",
+                    (job_id, gestartet),
+                ).fetchone()[0]
+
+        gesamt = sum(status.values())
+        offen = status.get("offen", 0)
+        laufzeit = time.time() - gestartet if gestartet else 0.0
+        rate = seit_start / laufzeit if laufzeit > 0 and seit_start else None
+        return {
+            "gesamt": gesamt,
+            "fertig": status.get("fertig", 0),
+            "fehler": status.get("fehler", 0),
+            "offen": offen,
+            "quellen": quellen,
+            "pro_sekunde": rate,
+            "rest_s": offen / rate if rate else None,
+        }
+
+    def fehlerliste(self, job_id: int) -> pd.DataFrame:
+        with self._connect() as con:
+            rows = con.execute(
+                "SELECT zweck, fehler FROM job_eintrag WHERE job_id = ? AND status = 'fehler' ORDER BY zweck",
+                (job_id,),
+            ).fetchall()
+        return pd.DataFrame(rows, columns=["Zweck", "Fehler"])
+
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def job_store() -> JobStore:
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = JobStore()
+        return _STORE
+
+
+# ──────────────────────────────
+# Ausführung im Hintergrund
+# ──────────────────────────────
+_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="klassifikation")
+_GEPLANT = set()
+_GEPLANT_LOCK = threading.Lock()
+
+
+def starte_klassifikation(zwecke, ki: bool = True, store: JobStore = None, engine=None) -> int:
+    """Legt einen Job an und startet ihn im Hintergrund. Rückgabe: Job-ID."""
+    store = store or job_store()
+    job_id = store.lege_an(zwecke, ki)
+    plane(job_id, store, engine)
+    return job_id
+
+
+def setze_fort(store: JobStore = None) -> list:
+    """Nimmt wartende/verwaiste Jobs (z.B. nach einem Neustart) wieder auf. Rückgabe: Job-IDs."""
+    store = store or job_store()
+    ids = store.verwaiste()
+    for job_id in ids:
+        plane(job_id, store)
+    return ids
+
+
+def plane(job_id: int, store: JobStore, engine=None):
+    with _GEPLANT_LOCK:
+        if job_id in _GEPLANT:
+            return None
+        _GEPLANT.add(job_id)
+    return _POOL.submit(_ausfuehren, job_id, store, engine)
+
+
+def _ausfuehren(job_id: int, store: JobStore, engine=None, batch_groesse: int = BATCH_GROESSE):
+    try:
+        if not store.beanspruche(job_id):
+            return
+        with telemetrie.lauf("klassifikation_job"):
+            try:
+                _klassifiziere(job_id, store, engine, batch_groesse)
+            except Exception as e:
+                log.exception("Klassifikations-Job %s abgebrochen", job_id)
+                store.beende(job_id, fehler=f"{type(e).__name__}: {e}")
+            else:
+                store.beende(job_id)
+    finally:
+        with _GEPLANT_LOCK:
+            _GEPLANT.discard(job_id)
+
+
+def _checkpoint(job_id: int, store: JobStore, ergebnisse: dict, fehler: dict = None):
+    """Erst ins Mapping (Stammdaten-DB), dann den Job-Eintrag abhaken."""
+    from utils.stammdaten import aendere_mapping
+
+    if ergebnisse:
+        aendere_mapping({z: kat for z, (kat, _) in ergebnisse.items()}, quelle=f"job {job_id}",
+                        herkunft={z: quelle for z, (_, quelle) in ergebnisse.items()})
+    store.erledige(job_id, ergebnisse, fehler)
+
+
+def _klassifiziere(job_id: int, store: JobStore, engine, batch_groesse: int):
+    """Index → lokales Modell → KI in parallelen Batches; jede Stufe/jeder Batch wird sofort gesichert."""
+    from utils.gpt import LOKAL_SCHWELLE, KlassifikationsEngine, _standard_client, lokales_modell
+    from utils.stammdaten import lade_mapping
+    from utils.zweck import KATEGORIEN, ZweckIndex
+
+    offen = store.offene(job_id)
+    if not offen:
+        return
+    mapping_df = lade_mapping(herkunft=True)
+
+    # Inzwischen (z.B. von einer anderen Session) zugeordnete Zwecke nicht noch einmal klassifizieren
+    bekannt = dict(zip(mapping_df["Zweck"], mapping_df["Verrechenbarkeit"]))
+    schon = {z: (bekannt[z], "bekannt") for z in offen if z in bekannt}
+    if schon:
+        store.erledige(job_id, schon)
+    offen = [z for z in offen if z not in schon]
+
+    # 1) Schreibvarianten bekannter Zwecke
+    index = {z: (kat, "index") for z, (kat, _, _) in ZweckIndex(mapping_df).loese_auf(offen).items()}
+    _checkpoint(job_id, store, index)
+    offen = [z for z in offen if z not in index]
+
+    # 2) Lokales Modell (nur sichere Vorhersagen)
+    modell = lokales_modell(mapping_df)
+    lokal = {
+        z: (kat, "lokal") for z, (kat, konf) in modell.vorhersage_viele(offen).items()
+        if kat is not None and konf >= LOKAL_SCHWELLE
+    }
+    _checkpoint(job_id, store, lokal)
+    offen = [z for z in offen if z not in lokal]
+    if not offen:
+        return
+
+    # 3) KI – ohne KI (oder ohne Key) bleiben unsichere Zwecke als Fehler im Job stehen; ein leerer
+    # Mapping-Eintrag würde sie als bekannt markieren und die spätere KI-Eskalation verhindern
+    job = store.job(job_id)
+    if not job["ki"] or (engine is None and _standard_client() is None):
+        store.erledige(job_id, {}, {z: OHNE_KI for z in offen})
+        return
+
+    engine = engine or KlassifikationsEngine()
+    batches = [offen[i:i + batch_groesse] for i in range(0, len(offen), batch_groesse)]
+    # Parallel nur hier über die Batches – innerhalb eines Batches arbeitet die Engine seriell,
+    # damit höchstens engine.max_parallel Requests gleichzeitig laufen
+    def klassifiziere(teil):
+        return engine.klassifiziere(teil, batch_size=batch_groesse, parallel=False)
+
+    with ThreadPoolExecutor(max_workers=min(engine.max_parallel, len(batches))) as pool:
+        futures = {pool.submit(telemetrie.im_kontext(klassifiziere), teil): teil for teil in batches}
+        for future in as_completed(futures):
+            teil = futures[future]
+            try:
+                antworten, ki_fehler = future.result()
+            except Exception as e:
+                # Fehler betrifft nur diesen Batch; er bleibt zum erneuten Versuch markiert
+                store.erledige(job_id, {}, {z: f"{type(e).__name__}: {e}" for z in teil})
+                continue
+            gpt = {z: (antworten[z], "gpt") for z in teil if antworten.get(z) in KATEGORIEN}
+            fehler = {
+                z: ki_fehler.get(z) or f"keine eindeutige KI-Antwort ({antworten.get(z, 'keine')})"
+                for z in teil if z not in gpt
+            }
+            _checkpoint(job_id, store, gpt, fehler)
@@ -0,0 +1,130 @@
+# utils/lokal_modell.py
+import math
+import threading
+from collections import Counter
+
+import pandas as pd
+
+from utils.zweck import KATEGORIEN, kanonisiere_zweck
+
+# Herkunft geratener Mapping-Zeilen (eigene Vorhersage, ähnlicher Zweck) – sie sind keine
+# bestätigten Labels; würde das Modell darauf lernen, verstärkte es seine eigenen Fehler
+UNBESTAETIGT = ("lokal", "index")
+
+
+def merkmale(zweck) -> list:
+    """Zeichen-n-Gramme (2–4) und Wörter des kanonischen Zwecks."""
+    k = kanonisiere_zweck(zweck)
+    if not k:
+        return []
+    p = f" {k} "
+    grams = [p[i:i + n] for n in (2, 3, 4) for i in range(len(p) - n + 1)]
+    return grams + ["w:" + w for w in k.split()]
+
+
+class LokalesModell:
+    """
+    Naive-Bayes-Klassifikator über Zeichen-n-Gramme – läuft offline in Mikrosekunden.
+    Das Modell besteht nur aus Zählern und lernt dadurch inkrementell: geänderte
+    Mapping-Zeilen werden ent- bzw. neu gelernt, der Rest bleibt unangetastet.
+
+    Konfidenz = Posterior × Anteil der bekannten Merkmale, damit völlig neue Zwecke
+    nicht mit scheinbarer Sicherheit geraten werden.
+    """
+
+    def __init__(self, alpha: float = 0.5):
+        self.alpha = alpha
+        self.labels = {}                      # Zweck → Kategorie (Trainingsstand)
+        self.docs = Counter()                 # Kategorie → Anzahl Zwecke
+        self.zaehler = {k: Counter() for k in KATEGORIEN}
+        self.summe = Counter()                # Kategorie → Summe aller Merkmale
+        self.vokabular = Counter()            # Merkmal → Vorkommen über alle Kategorien
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _lerne(self, zweck, kategorie, gewicht: int):
+        self.docs[kategorie] += gewicht
+        for m in merkmale(zweck):
+            self.zaehler[kategorie][m] += gewicht
+            self.summe[kategorie] += gewicht
+            self.vokabular[m] += gewicht
+            if self.vokabular[m] <= 0:
+                del self.vokabular[m]
+
+    def synchronisiere(self, mapping_df: pd.DataFrame) -> int:
+        """
+        Gleicht das Modell mit dem Mapping ab; nur neue, geänderte oder gelöschte
+        Zeilen werden (ent-)gelernt. Hat das Mapping eine Spalte "Herkunft", zählen
+        Zeilen aus UNBESTAETIGT nicht als Label. Rückgabe: Anzahl geänderter Zwecke.
+        """
+        gueltig = mapping_df["Verrechenbarkeit"].isin(KATEGORIEN)
+        if "Herkunft" in mapping_df.columns:
+            gueltig &= ~mapping_df["Herkunft"].isin(UNBESTAETIGT)
+        gueltig = mapping_df[gueltig]
+        neu = dict(zip(gueltig["Zweck"].astype(str), gueltig["Verrechenbarkeit"]))
+
+        with self._lock:
+            aenderungen = 0
+            for zweck, alt in list(self.labels.items()):
+                if neu.get(zweck) != alt:
+                    self._lerne(zweck, alt, -1)
+                    del self.labels[zweck]
+                    aenderungen += 1
+            for zweck, kat in neu.items():
+                if zweck not in self.labels:
+                    self._lerne(zweck, kat, +1)
+                    self.labels[zweck] = kat
+                    aenderungen += 1
+        return aenderungen
+
+    def vorhersage(self, zweck):
+        """Rückgabe: (Kategorie, Konfidenz 0..1). Ohne Trainingsdaten: (None, 0.0)."""
+        feats = merkmale(zweck)
+        n_docs = sum(self.docs.values())
+        if not feats or n_docs == 0:
+            return None, 0.0
+
+        v = len(self.vokabular) + 1
+        # Likelihood durch √(Anzahl Merkmale) dämpfen – n-Gramme sind stark korreliert
+        daempfung = math.sqrt(len(feats))
+        scores = {}
+        for kat in KATEGORIEN:
+            zaehler, summe = self.zaehler[kat], self.summe[kat]
+            loglik = sum(math.log((zaehler[m] + self.alpha) / (summe + self.alpha * v)) for m in feats)
+            scores[kat] = math.log((self.docs[kat] + 1) / (n_docs + len(KATEGORIEN))) + loglik / daempfung
+
+        top = max(scores.values())
+        exp = {k: math.exp(s - top) for k, s in scores.items()}
+        bester = max(exp, key=exp.get)
+        posterior = exp[bester] / sum(exp.values())
+        abdeckung = sum(1 for m in feats if m in self.vokabular) / len(feats)
+        return bester, posterior * abdeckung
+
+    def vorhersage_viele(self, zwecke) -> dict:
+        """{Zweck: (Kategorie, Konfidenz)}"""
+        return {z: self.vorhersage(z) for z in zwecke}
+
+
+# ──────────────────────────────
+# Manuell testen (Leave-one-out auf mapping.csv)
+# ──────────────────────────────
+if __name__ == "__main__":
+    import sys
+    mapping = pd.read_csv(sys.argv[1] if len(sys.argv) > 1 else "mapping.csv")
+    mapping = mapping[mapping["Verrechenbarkeit"].isin(KATEGORIEN)].drop_duplicates(subset=["Zweck"])
+
+    modell = LokalesModell()
+    modell.synchronisiere(mapping)
+    treffer, sicher, sicher_richtig = 0, 0, 0
+    for zweck, kat in zip(mapping["Zweck"], mapping["Verrechenbarkeit"]):
+        modell.synchronisiere(mapping[mapping["Zweck"] != zweck])
+        pred, konf = modell.vorhersage(zweck)
+        treffer += pred == kat
+        if konf >= 0.8:
+            sicher += 1
+            sicher_richtig += pred == kat
+        modell.synchronisiere(mapping)
+    print(f"{len(mapping)} Zwecke, Genauigkeit {treffer / len(mapping):.2f}, "
+          f"sicher (≥0.8): {sicher} mit Genauigkeit {sicher_richtig / max(1, sicher):.2f}")
@@ -0,0 +1,127 @@
+# utils/pipeline.py
+import os
+from datetime import datetime
+
+import pandas as pd
+
+from utils import telemetrie
+from utils.aggregation import aggregat_fuer, zusammenfassung
+from utils.datenspeicher import _verbinde
+from utils.historie import HistorienIndex
+from utils.processing import kompaktiere_zeitdaten, lade_zeitdaten_datei, leite_spalten_ab, wende_mapping_an
+from utils.rechnung import haenge_umsatz_an
+from utils.zweck import KATEGORIEN, ZweckIndex, kanonisiere_zweck
+
+EXPORT_DIR = os.path.join("history", "exports")
+
+
+# ──────────────────────────────
+# Klassifikation neuer Zwecke
+# ──────────────────────────────
+def neue_zwecke(zwecke, mapping_df: pd.DataFrame) -> list:
+    """Zwecke, deren kanonische Form noch nicht im Mapping steht (Schreibvarianten zählen als bekannt)."""
+    aktuelle = set(pd.Series(list(zwecke), dtype="object").dropna().astype(str).str.strip())
+    bekannte_schluessel = {kanonisiere_zweck(z) for z in mapping_df["Zweck"].dropna().astype(str)}
+    return sorted(z for z in aktuelle if kanonisiere_zweck(z) not in bekannte_schluessel)
+
+
+@telemetrie.gemessen("klassifikation")
+def ordne_zwecke_zu(zwecke, mapping_df: pd.DataFrame, ki: bool = True) -> tuple:
+    """
+    Ähnliche bekannte Zwecke lokal zuordnen, den Rest über lokales Modell und – wenn ki –
+    die KI. Rückgabe: (neue Mapping-Zeilen, Statistik {index, lokal, gpt, offen, fehler}).
+    Jede Zeile trägt ihre Herkunft (index/lokal/gpt/offen); unsichere Zwecke bekommen
+    eine leere Verrechenbarkeit.
+    """
+    lokal = ZweckIndex(mapping_df).loese_auf(zwecke)
+    zeilen = [{"Zweck": z, "Verrechenbarkeit": kat, "Herkunft": "index"} for z, (kat, _, _) in lokal.items()]
+    rest = [z for z in zwecke if z not in lokal]
+    statistik = {"index": len(lokal), "lokal": 0, "gpt": 0, "offen": 0, "fehler": None}
+    if not rest:
+        return zeilen, statistik
+
+    from utils.gpt import klassifiziere_gestuft
+    ergebnisse, fehler = klassifiziere_gestuft(rest, mapping_df, ki=ki)
+    if fehler:
+        beispiel = next(iter(fehler.values()))
+        statistik["fehler"] = f"{len(fehler)} Zweck(e) ohne KI-Antwort, z.B. {beispiel}"
+
+    for zweck in rest:
+        kat, quelle, _ = ergebnisse.get(zweck, ("", "offen", 0.0))
+        if kat not in KATEGORIEN:
+            kat, quelle = "", "offen"  # leer lassen statt None
+        statistik[quelle] += 1
+        zeilen.append({"Zweck": zweck, "Verrechenbarkeit": kat, "Herkunft": quelle})
+    return zeilen, statistik
+
+
+def fuege_mapping_an(mapping_df: pd.DataFrame, zeilen: list) -> pd.DataFrame:
+    """Neue Zeilen anhängen; erkannte zuerst, unklare ("") ganz unten."""
+    if not zeilen:
+        return mapping_df
+    mapping_df = pd.concat([mapping_df, pd.DataFrame(zeilen)], ignore_index=True)
+    mapping_df = mapping_df.drop_duplicates(subset=["Zweck"], keep="last")
+    return mapping_df.sort_values(by=["Verrechenbarkeit", "Zweck"], key=lambda col: col.fillna("zzz"))
+
+
+# ──────────────────────────────
+# Ingest → Klassifizieren → Aggregieren → Export
+# ──────────────────────────────
+def lade_dateien(pfade) -> pd.DataFrame:
+    """Zeitdaten-Workbooks (über den Arrow-Cache) ins kompakte Session-Schema."""
+    frames = [kompaktiere_zeitdaten(leite_spalten_ab(lade_zeitdaten_datei(p))) for p in pfade]
+    if len(frames) == 1:
+        return frames[0]
+    df = kompaktiere_zeitdaten(_verbinde(frames))
+    df.attrs["datensatz"] = "|".join(f.attrs.get("datensatz", "") for f in frames)
+    return df
+
+
+def bericht(df: pd.DataFrame, mapping_df: pd.DataFrame, kuerzel_df=None, rechnung_df=None) -> pd.DataFrame:
+    """Zusammenfassung pro Mitarbeiter (Stunden, Anteile, optional Umsatz)."""
+    pivot_df = aggregat_fuer(df).pivot_fuer(mapping_df)
+    if pivot_df.empty:
+        return pd.DataFrame(columns=["Mitarbeiter", "Intern", "Extern", "Gesamtstunden", "% Intern", "% Extern"])
+    export_summary = zusammenfassung(pivot_df)
+    if kuerzel_df is not None and rechnung_df is not None:
+        export_summary = haenge_umsatz_an(export_summary, kuerzel_df, rechnung_df)
+    return export_summary
+
+
+@telemetrie.gemessen("export")
+def exportiere(export_summary: pd.DataFrame, ausgabe_dir: str = EXPORT_DIR, formate=("csv",), name: str = None,
+               details: pd.DataFrame = None) -> list:
+    """
+    Schreibt die Zusammenfassung als CSV und/oder PDF (mit `details` inkl. Seite je
+    Mitarbeiter, siehe bericht.detail_tabelle). Rückgabe: geschriebene Pfade.
+    """
+    os.makedirs(ausgabe_dir, exist_ok=True)
+    name = name or f"bericht_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}"
+    pfade = []
+    if "csv" in formate:
+        pfad = os.path.join(ausgabe_dir, f"{name}.csv")
+        export_summary.to_csv(pfad, index=False)
+        pfade.append(pfad)
+    if "pdf" in formate:
+        from utils.bericht import erstelle_pdf
+        pfad = os.path.join(ausgabe_dir, f"{name}.pdf")
+        erstelle_pdf(export_summary, pfad, details=details)
+        pfade.append(pfad)
+
+    index = HistorienIndex(ausgabe_dir)
+    for pfad in pfade:
+        index.registriere(os.path.basename(pfad), zeilen=len(export_summary))
+    return pfade
+
+
+def lauf(pfade, mapping_df: pd.DataFrame, ki: bool = True, kuerzel_df=None, rechnung_df=None) -> tuple:
+    """
+    Ganze Pipeline ohne UI. Rückgabe: (df mit Verrechenbarkeit, ergänztes Mapping,
+    Zusammenfassung, Klassifikations-Statistik). Gespeichert wird hier nichts.
+    """
+    df = lade_dateien(pfade)
+    neu = neue_zwecke(df["Zweck"].cat.categories, mapping_df)
+    zeilen, statistik = ordne_zwecke_zu(neu, mapping_df, ki=ki) if neu else ([], {})
+    mapping_df = fuege_mapping_an(mapping_df, zeilen)
+    df = wende_mapping_an(df, mapping_df)
+    return df, mapping_df, bericht(df, mapping_df, kuerzel_df, rechnung_df), statistik
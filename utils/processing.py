@@ -1 +1,319 @@
+# utils/processing.py
+import io
+import os
+import re
+import hashlib
 
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pandas.api.types import union_categoricals
+from pyarrow import feather
+
+from utils import telemetrie
+from utils.ablage import tmp_pfad
+from utils.zweck import verrechenbarkeit_fuer
+
+CACHE_DIR = os.path.join("history", "cache")
+# Erhöhen, wenn sich die Spaltenauswahl/Typen der Ingestion ändern (alte Cache-Dateien greifen dann nicht mehr)
+CACHE_SCHEMA = "v3"
+
+TEXT_SPALTEN = ("Unterprojekt", "Mitarbeiter")
+DAUER_SPALTEN = ("stunden", "dauer")
+DATUM_SPALTEN = ("datum", "date", "buchungsdatum")
+CHUNK_ZEILEN = 50_000
+# Textdaten: ISO zuerst, dann deutsch (exact=False: Uhrzeit dahinter wird ignoriert)
+DATUM_FORMATE = ("%Y-%m-%d", "%d.%m.%Y")
+
+
+# ──────────────────────────────
+# Spaltencache für hochgeladene Workbooks
+# ──────────────────────────────
+def datei_hash(daten: bytes) -> str:
+    """SHA-256 über den Dateiinhalt – identische Uploads ergeben denselben Schlüssel."""
+    return hashlib.sha256(daten).hexdigest()
+
+
+def cache_pfad(h: str, cache_dir: str = CACHE_DIR) -> str:
+    return os.path.join(cache_dir, f"{h}_{CACHE_SCHEMA}.arrow")
+
+
+def _arrow_tauglich(df: pd.DataFrame) -> pd.DataFrame:
+    """Excel-Spalten mit gemischten Typen (Zahl + Text) als Text ablegen, sonst scheitert Arrow."""
+    out = df.copy()
+    out.columns = [str(c) for c in out.columns]
+    for spalte in out.columns:
+        if out[spalte].dtype != object:
+            continue
+        try:
+            pa.array(out[spalte], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            out[spalte] = out[spalte].map(lambda v: v if pd.isna(v) else str(v))
+    return out
+
+
+def schreibe_cache(df: pd.DataFrame, h: str, cache_dir: str = CACHE_DIR) -> str:
+    """Legt das DataFrame unkomprimiert als Arrow-IPC ab (direkt memory-mappable)."""
+    os.makedirs(cache_dir, exist_ok=True)
+    pfad = cache_pfad(h, cache_dir)
+    tmp = tmp_pfad(pfad)
+    feather.write_feather(_arrow_tauglich(df), tmp, compression="uncompressed")
+    os.replace(tmp, pfad)
+    return pfad
+
+
+def lese_cache(h: str, columns=None, cache_dir: str = CACHE_DIR):
+    """Cache-Treffer per Memory-Map lesen (optional nur einzelne Spalten); sonst None."""
+    pfad = cache_pfad(h, cache_dir)
+    if not os.path.exists(pfad):
+        return None
+    return feather.read_table(pfad, columns=columns, memory_map=True).to_pandas()
+
+
+# ──────────────────────────────
+# Streaming-Ingestion (openpyxl read_only, nur benötigte Spalten)
+# ──────────────────────────────
+def _spalten_auswahl(header) -> dict:
+    """
+    {Spaltenname: Index} für Unterprojekt, Mitarbeiter, die erste Stunden/Dauer-Spalte
+    und – falls vorhanden – die Datumsspalte (immer als "Datum").
+    """
+    namen = ["" if h is None else str(h).strip() for h in header]
+    auswahl = {}
+    for name in TEXT_SPALTEN:
+        if name in namen:
+            auswahl[name] = namen.index(name)
+    dauer = next((i for i, n in enumerate(namen) if n.lower() in DAUER_SPALTEN), None)
+    if dauer is not None:
+        auswahl[namen[dauer]] = dauer
+    datum = next((i for i, n in enumerate(namen) if n.lower() in DATUM_SPALTEN), None)
+    if datum is not None:
+        auswahl["Datum"] = datum
+    return auswahl
+
+
+def datum_spalte(werte) -> pd.Series:
+    """
+    Datumszellen → datetime64. Echte Datumszellen werden übernommen, Text nur nach festen
+    Formaten (DATUM_FORMATE der Reihe nach, erster Treffer gilt) – kein Raten je Chunk,
+    "2025-01-05" bleibt der 5. Januar, auch neben "05.01.2025" im selben Chunk.
+    """
+    serie = pd.Series(werte, dtype="object")
+    ist_text = serie.map(lambda v: isinstance(v, str)).astype(bool)
+    ergebnis = pd.to_datetime(serie.where(~ist_text), errors="coerce").astype("datetime64[ns]")
+    if ist_text.any():
+        text = serie[ist_text].str.strip()
+        geparst = pd.Series(pd.NaT, index=text.index, dtype="datetime64[ns]")
+        for fmt in DATUM_FORMATE:
+            offen = geparst.isna()
+            if not offen.any():
+                break
+            geparst[offen] = pd.to_datetime(text[offen], format=fmt, exact=False, errors="coerce")
+        ergebnis[ist_text] = geparst
+    return ergebnis
+
+
+def _chunk_frame(zeilen: list, auswahl: dict) -> pd.DataFrame:
+    """Typkonvertierung pro Chunk: Text → category, Datum → datetime, Dauer → float."""
+    spalten = {}
+    for name, idx in auswahl.items():
+        werte = [z[idx] if idx < len(z) else None for z in zeilen]
+        if name in TEXT_SPALTEN:
+            serie = pd.Series(werte, dtype="object")
+            serie = serie.where(serie.isna(), serie.astype(str))
+            spalten[name] = serie.astype("category")
+        elif name == "Datum":
+            spalten[name] = datum_spalte(werte)
+        else:
+            spalten[name] = pd.to_numeric(pd.Series(werte, dtype="object"), errors="coerce").astype("float64")
+    return pd.DataFrame(spalten)
+
+
+def _verbinde_chunks(chunks: list, auswahl: dict) -> pd.DataFrame:
+    """Chunks zusammenführen; Kategorien werden vereinigt statt zu object expandiert."""
+    if not chunks:
+        leer = {n: "category" if n in TEXT_SPALTEN else "float64" for n in auswahl}
+        if "Datum" in leer:
+            leer["Datum"] = "datetime64[ns]"
+        return pd.DataFrame({n: pd.Series(dtype=t) for n, t in leer.items()})
+    spalten = {}
+    for name in auswahl:
+        teile = [c[name] for c in chunks]
+        if name in TEXT_SPALTEN:
+            spalten[name] = pd.Series(union_categoricals([t.array for t in teile]))
+        else:
+            spalten[name] = pd.concat(teile, ignore_index=True)
+    return pd.DataFrame(spalten)
+
+
+def lese_zeitdaten_stream(quelle, chunk_zeilen: int = CHUNK_ZEILEN, fortschritt=None) -> pd.DataFrame:
+    """
+    Liest ein Zeitdaten-Workbook zeilenweise (openpyxl read_only) in Chunks und behält
+    nur Unterprojekt, Mitarbeiter, Stunden/Dauer und Datum. Der Speicherbedarf wächst damit nur
+    mit den benötigten Spalten, nicht mit der Breite des Exports.
+
+    fortschritt(gelesen, gesamt) wird nach jedem Chunk aufgerufen (gesamt kann None sein).
+    """
+    import openpyxl
+
+    if isinstance(quelle, (bytes, bytearray)):
+        quelle = io.BytesIO(quelle)
+    wb = openpyxl.load_workbook(quelle, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        gesamt = (ws.max_row - 1) if ws.max_row else None
+        zeilen = ws.iter_rows(values_only=True)
+
+        header = next(zeilen, None)
+        auswahl = _spalten_auswahl(header or [])
+        fehlend = [n for n in TEXT_SPALTEN if n not in auswahl]
+        if fehlend:
+            raise ValueError(f"Spalten fehlen: {', '.join(fehlend)}")
+
+        chunks, puffer, gelesen = [], [], 0
+        for zeile in zeilen:
+            if not any(v is not None for v in zeile):
+                continue
+            puffer.append(zeile)
+            if len(puffer) >= chunk_zeilen:
+                chunks.append(_chunk_frame(puffer, auswahl))
+                gelesen += len(puffer)
+                puffer = []
+                if fortschritt:
+                    fortschritt(gelesen, gesamt)
+        if puffer:
+            chunks.append(_chunk_frame(puffer, auswahl))
+            gelesen += len(puffer)
+        if fortschritt:
+            fortschritt(gelesen, gelesen)
+    finally:
+        wb.close()
+
+    return _verbinde_chunks(chunks, auswahl)
+
+
+def lade_zeitdaten(daten: bytes, cache_dir: str = CACHE_DIR, fortschritt=None) -> pd.DataFrame:
+    """
+    Liest ein Zeitdaten-Workbook. Jede Datei wird nur einmal (per Streaming) geparst,
+    danach kommt sie als Arrow-Datei (Schlüssel: SHA-256 der Bytes) aus dem Cache.
+    """
+    with telemetrie.messe("ingestion", bytes=len(daten)) as messung:
+        h = datei_hash(daten)
+        df = lese_cache(h, cache_dir=cache_dir)
+        messung["cache"] = df is not None
+        if df is None:
+            df = lese_zeitdaten_stream(daten, fortschritt=fortschritt)
+            schreibe_cache(df, h, cache_dir)
+        messung["zeilen"] = len(df)
+
+    # Schlüssel für nachgelagerte Caches (Aggregation), wandert über attrs mit
+    df.attrs["datensatz"] = h
+    return df
+
+
+def lade_zeitdaten_datei(pfad: str, cache_dir: str = CACHE_DIR, fortschritt=None) -> pd.DataFrame:
+    """lade_zeitdaten für eine Datei auf der Platte (z.B. aus history/uploads)."""
+    with open(pfad, "rb") as f:
+        return lade_zeitdaten(f.read(), cache_dir, fortschritt)
+
+
+# ──────────────────────────────
+# Abgeleitete Spalten (Zweck, Dauer) – vektorisiert
+# ──────────────────────────────
+def extrahiere_zweck(text: str):
+    if isinstance(text, str) and "-" in text:
+        zweck_raw = text.split("-")[-1].strip()
+        return re.sub(r"^\d+_?", "", zweck_raw)
+    return None
+
+
+def zweck_spalte(unterprojekt: pd.Series) -> pd.Series:
+    """
+    Wie unterprojekt.apply(extrahiere_zweck), aber die String-Operationen laufen nur
+    einmal pro eindeutigem Unterprojekt; das Ergebnis wird über die Kategorie-Codes
+    auf alle Zeilen verteilt. Rückgabe: kategoriale Serie (fehlend = NaN).
+    """
+    cat = unterprojekt if isinstance(unterprojekt.dtype, pd.CategoricalDtype) else unterprojekt.astype("category")
+    werte = pd.Series(cat.cat.categories, dtype="object")
+
+    ist_text = werte.map(lambda v: isinstance(v, str))
+    text = werte[ist_text].astype(str)
+    zweck = pd.Series(None, index=werte.index, dtype="object")
+    mit_strich = text[text.str.contains("-", regex=False)]
+    zweck[mit_strich.index] = (
+        mit_strich.str.rsplit("-", n=1).str[-1]
+        .str.strip()
+        .str.replace(r"^\d+_?", "", regex=True)
+    )
+
+    # Zweck-Codes je Unterprojekt-Kategorie → per Take auf die Zeilen-Codes; das angehängte -1
+    # fängt fehlende Unterprojekte (Code -1) ab, auch wenn es gar keine Kategorien gibt
+    zweck_codes, zweck_kategorien = pd.factorize(zweck, use_na_sentinel=True)
+    codes = np.append(zweck_codes, -1)[cat.cat.codes.to_numpy()]
+    return pd.Series(
+        pd.Categorical.from_codes(codes, categories=pd.Index(zweck_kategorien, dtype="object")),
+        index=unterprojekt.index,
+        name="Zweck",
+    )
+
+
+def dauer_spalte(df: pd.DataFrame) -> pd.Series:
+    """Stunden/Dauer als float; ohne passende Spalte zählt jede Buchung als 1.0."""
+    spalte = next((c for c in df.columns if str(c).lower() in DAUER_SPALTEN), None)
+    if spalte is None:
+        return pd.Series(1.0, index=df.index, name="Dauer")
+    return pd.to_numeric(df[spalte], errors="coerce").fillna(0).rename("Dauer")
+
+
+@telemetrie.gemessen("zweck_extraktion")
+def leite_spalten_ab(df: pd.DataFrame) -> pd.DataFrame:
+    """Ergänzt Zweck (aus Unterprojekt) und Dauer (aus Stunden/Dauer) in einem Schritt."""
+    df["Zweck"] = zweck_spalte(df["Unterprojekt"])
+    df["Dauer"] = dauer_spalte(df)
+    return df
+
+
+# ──────────────────────────────
+# Kompaktes Session-Schema
+# ──────────────────────────────
+SESSION_SPALTEN = ["Datum", "Mitarbeiter", "Zweck", "Dauer", "Verrechenbarkeit"]
+
+
+def kompaktiere_zeitdaten(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Reduziert die Zeitdaten auf das, was Kategorisierung und Analyse brauchen:
+    Mitarbeiter/Zweck/Verrechenbarkeit als category, Dauer als float32, Datum (falls
+    vorhanden) bleibt; der Rest fällt weg.
+    """
+    out = df[[c for c in SESSION_SPALTEN if c in df.columns]].copy()
+    for spalte in ("Mitarbeiter", "Zweck", "Verrechenbarkeit"):
+        if spalte in out.columns and not isinstance(out[spalte].dtype, pd.CategoricalDtype):
+            out[spalte] = out[spalte].astype("category")
+    if "Dauer" in out.columns:
+        out["Dauer"] = out["Dauer"].astype("float32")
+    return out
+
+
+def verrechenbarkeit_spalte(zweck: pd.Series, mapping_df: pd.DataFrame) -> pd.Series:
+    """
+    Mapping als Lookup Kategorie → Label: die Zuordnung wird nur für die eindeutigen
+    Zwecke berechnet und über die Codes verteilt – kein merge, keine Kopie des Frames.
+    """
+    cat = zweck if isinstance(zweck.dtype, pd.CategoricalDtype) else zweck.astype("category")
+    labels = verrechenbarkeit_fuer(pd.Series(cat.cat.categories, dtype="object"), mapping_df)
+
+    label_codes, label_kategorien = pd.factorize(labels, use_na_sentinel=True)
+    zeilen_codes = cat.cat.codes.to_numpy()
+    codes = label_codes[zeilen_codes] if len(label_codes) else zeilen_codes.copy()
+    codes[zeilen_codes == -1] = -1
+    return pd.Series(
+        pd.Categorical.from_codes(codes, categories=pd.Index(label_kategorien, dtype="object")),
+        index=zweck.index,
+        name="Verrechenbarkeit",
+    )
+
+
+@telemetrie.gemessen("mapping_merge")
+def wende_mapping_an(df: pd.DataFrame, mapping_df: pd.DataFrame) -> pd.DataFrame:
+    """Setzt/ersetzt die Spalte Verrechenbarkeit; übrige Spalten werden nicht kopiert."""
+    return df.assign(Verrechenbarkeit=verrechenbarkeit_spalte(df["Zweck"], mapping_df))
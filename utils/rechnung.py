@@ -0,0 +1,371 @@
+# utils/rechnung.py
+import io
+import os
+import re
+import threading
+
+import pandas as pd
+
+from utils.ablage import ordner_sperre, schreibe_atomar
+
+RECHNUNG_DIR = os.path.join("history", "rechnung")
+
+
+# ──────────────────────────────
+# Umsatzdaten (Rechnung_<JJJJ-MM>.xlsx: A = Kürzel, B = Umsatz)
+# ──────────────────────────────
+UMSATZ = "Umsatz (€)"
+UMSATZ_JE_STUNDE = "Umsatz je ext. Std. (€)"
+OHNE_PERIODE = "gesamt"  # altes, überschriebenes Rechnung.xlsx
+_PERIODE_RE = re.compile(r"(\d{4}-\d{2})")
+
+_DATEI_CACHE = {}
+_DATEI_CACHE_LOCK = threading.Lock()
+
+
+def periode_von(name: str) -> str:
+    """Periode (JJJJ-MM) aus dem Dateinamen, sonst OHNE_PERIODE."""
+    treffer = _PERIODE_RE.search(os.path.basename(name))
+    return treffer.group(1) if treffer else OHNE_PERIODE
+
+
+def dateiname_fuer(periode: str = None) -> str:
+    return f"Rechnung_{periode}.xlsx" if periode and periode != OHNE_PERIODE else "Rechnung.xlsx"
+
+
+def _lese_umsatzdatei(pfad: str) -> pd.DataFrame:
+    """Erste zwei Spalten des ersten Blatts; Zeilen ohne Zahl in B (Kopfzeilen, Summen-Text) fallen weg."""
+    import openpyxl
+
+    wb = openpyxl.load_workbook(pfad, read_only=True, data_only=True)
+    try:
+        zeilen = [z[:2] for z in wb.worksheets[0].iter_rows(max_col=2, values_only=True) if len(z) >= 2]
+    finally:
+        wb.close()
+    out = pd.DataFrame(zeilen, columns=["Kürzel", UMSATZ], dtype="object")
+    out[UMSATZ] = pd.to_numeric(out[UMSATZ], errors="coerce")
+    out = out.dropna(subset=["Kürzel", UMSATZ])
+    out["Kürzel"] = out["Kürzel"].astype(str).str.strip()
+    out = out[out["Kürzel"] != ""]
+    return out.groupby("Kürzel", as_index=False)[UMSATZ].sum().astype({UMSATZ: "float64"})
+
+
+def lade_umsatzdatei(pfad: str) -> pd.DataFrame:
+    """Eine Umsatzdatei, prozessweit gecacht – neu gelesen nur, wenn sich mtime oder Größe ändern."""
+    stat = os.stat(pfad)
+    schluessel = os.path.abspath(pfad)
+    stempel = (stat.st_mtime_ns, stat.st_size)
+    with _DATEI_CACHE_LOCK:
+        eintrag = _DATEI_CACHE.get(schluessel)
+    if eintrag is None or eintrag[0] != stempel:
+        eintrag = (stempel, _lese_umsatzdatei(pfad))
+        with _DATEI_CACHE_LOCK:
+            _DATEI_CACHE[schluessel] = eintrag
+    return eintrag[1].copy()
+
+
+def umsatzdateien(ordner: str = RECHNUNG_DIR) -> dict:
+    """{Periode: Dateiname} aller Umsatzdateien im Ordner (nur Verzeichniseintrag, kein Lesen)."""
+    if not os.path.isdir(ordner):
+        return {}
+    namen = sorted(
+        e.name for e in os.scandir(ordner)
+        if e.is_file() and e.name.lower().endswith(".xlsx") and not e.name.startswith(("~$", "_"))
+    )
+    return {periode_von(n): n for n in namen}
+
+
+def perioden(ordner: str = RECHNUNG_DIR) -> list:
+    """Verfügbare Umsatz-Perioden, neueste zuerst (Datei ohne Periode zuletzt)."""
+    return sorted(umsatzdateien(ordner), key=lambda p: (p != OHNE_PERIODE, p), reverse=True)
+
+
+def lade_umsaetze(quelle: str = RECHNUNG_DIR, perioden_auswahl=None) -> pd.DataFrame:
+    """
+    Umsätze im Langformat [Periode, Kürzel, Umsatz (€)] – aus einer Datei oder allen
+    (bzw. den gewählten) Perioden eines Ordners. Jede Datei kommt aus dem mtime-Cache.
+    """
+    if os.path.isfile(quelle):
+        dateien = {periode_von(quelle): quelle}
+    else:
+        dateien = {p: os.path.join(quelle, n) for p, n in umsatzdateien(quelle).items()}
+    if perioden_auswahl is not None:
+        dateien = {p: pfad for p, pfad in dateien.items() if p in set(perioden_auswahl)}
+
+    teile = [lade_umsatzdatei(pfad).assign(Periode=p) for p, pfad in sorted(dateien.items())]
+    if not teile:
+        return pd.DataFrame({"Periode": pd.Series(dtype="object"), "Kürzel": pd.Series(dtype="object"),
+                             UMSATZ: pd.Series(dtype="float64")})
+    return pd.concat(teile, ignore_index=True)[["Periode", "Kürzel", UMSATZ]]
+
+
+def lade_rechnung(quelle: str = RECHNUNG_DIR, perioden_auswahl=None) -> pd.DataFrame:
+    """Umsatz je Kürzel (numerisch, float) über die gewählten Perioden summiert."""
+    umsaetze = lade_umsaetze(quelle, perioden_auswahl)
+    return umsaetze.groupby("Kürzel", as_index=False)[UMSATZ].sum()
+
+
+def speichere_umsatzdatei(daten: bytes, periode: str = None, ordner: str = RECHNUNG_DIR) -> str:
+    """Legt eine Umsatzdatei je Periode ab (gleiche Periode → ersetzt). Rückgabe: Dateiname."""
+    from utils.historie import HistorienIndex
+
+    os.makedirs(ordner, exist_ok=True)
+    name = dateiname_fuer(periode)
+    with ordner_sperre(ordner):
+        schreibe_atomar(os.path.join(ordner, name), daten)
+        HistorienIndex(ordner).registriere(name)
+    return name
+
+
+def formatiere_euro(v) -> str:
+    """Nur für die Anzeige: 1234567.8 → "1.234.568"."""
+    if v is None or pd.isna(v):
+        return ""
+    return f"{v:,.0f}".replace(",", ".")
+
+
+def haenge_umsatz_an(export_summary: pd.DataFrame, kuerzel_map: pd.DataFrame, rechnung_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Mitarbeiter → Kürzel → Umsatz (numerisch) plus Umsatz je externer Stunde;
+    ohne Umsatz- oder Kürzeldaten bleibt die Tabelle unverändert.
+    """
+    if rechnung_df.empty or kuerzel_map.empty:
+        return export_summary
+
+    # 1) Mitarbeiter -> Kürzel mappen
+    out = export_summary.merge(
+        kuerzel_map[["Name", "Kürzel"]].drop_duplicates(subset=["Name"]),
+        left_on="Mitarbeiter", right_on="Name", how="left"
+    ).drop(columns=["Name"])
+
+    # 2) Kürzel -> Umsatz joinen
+    out = out.merge(rechnung_df[["Kürzel", UMSATZ]], on="Kürzel", how="left")
+
+    # 3) Kennzahl: Umsatz je externer Stunde
+    if "Extern" in out.columns:
+        extern = out["Extern"].where(out["Extern"] > 0)
+        out[UMSATZ_JE_STUNDE] = (out[UMSATZ] / extern).round(2)
+
+    # 4) Kürzel-Spalte wieder entfernen
+    return out.drop(columns=["Kürzel"], errors="ignore")
+
+
+# ──────────────────────────────
+# Abrechnungsdatei (Kürzel & Einsatztage_SOLL)
+# ──────────────────────────────
+KUERZEL_KOEPFE = ("pl", "kürzel", "kuerzel", "code")
+TAGE_KOPF = "einsatztage"
+SCAN_ZEILEN = 60          # so weit unten wird nach der Kopfzeile gesucht
+MAX_ZEILEN = 5_000        # pro Blatt höchstens so viele Zeilen lesen
+_KUERZEL_RE = re.compile(r"^[A-ZÄÖÜ]{1,3}$")
+_TAUSENDER_RE = re.compile(r"^-?\d{1,3}(\.\d{3})+$")
+
+
+def _norm(s: str) -> str:
+    """klein, Leerzeichen raus, nur Buchstaben."""
+    return re.sub(r"[^a-zäöü]", "", str(s).lower())
+
+
+def _zahl(v):
+    """
+    Zahl aus Excel-Wert oder deutschem Text ("1.234,5 Tage"); sonst None.
+    Ein Punkt ohne Komma ist Tausendertrenner, wenn alle Gruppen dreistellig sind
+    ("1.234" → 1234), sonst Dezimalpunkt ("12.5" → 12.5).
+    """
+    if v is None or isinstance(v, bool):
+        return None
+    if isinstance(v, (int, float)):
+        return None if pd.isna(v) else float(v)
+    text = re.sub(r"[^0-9,.\-]", "", str(v))
+    if "," in text or _TAUSENDER_RE.match(text):
+        text = text.replace(".", "").replace(",", ".")
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def _ist_kuerzel(v) -> bool:
+    return isinstance(v, str) and bool(_KUERZEL_RE.match(v.strip()))
+
+
+def _blaetter(upload, ext: str):
+    """(Blattname, Zeilen als Listen) je Blatt – XLSX per openpyxl read_only, CSV per C-Engine."""
+    if ext == ".csv":
+        import csv
+        if hasattr(upload, "read"):
+            roh = upload.read()
+        else:
+            with open(upload, "rb") as f:
+                roh = f.read()
+        text = roh.decode("utf-8-sig", errors="replace")
+        try:
+            sep = csv.Sniffer().sniff(text[:8192], delimiters=";,\t").delimiter
+        except csv.Error:
+            sep = ";"
+        # Vorspann hat oft weniger Felder als die Tabelle – Spaltenzahl von der breitesten Zeile
+        breite = max((z.count(sep) for z in text.splitlines()[:MAX_ZEILEN]), default=0) + 1
+        df = pd.read_csv(io.StringIO(text), sep=sep, header=None, names=range(breite), dtype=str, engine="c",
+                         keep_default_na=False, nrows=MAX_ZEILEN, skip_blank_lines=False)
+        yield "csv", [[None if v == "" else v for v in z] for z in df.itertuples(index=False, name=None)]
+        return
+
+    import openpyxl
+    wb = openpyxl.load_workbook(upload, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            zeilen = []
+            for z in ws.iter_rows(values_only=True, max_row=MAX_ZEILEN):
+                zeilen.append([v.strip() if isinstance(v, str) else v for v in z])
+            yield ws.title, zeilen
+    finally:
+        wb.close()
+
+
+def finde_kopfzeile(zeilen: list):
+    """
+    Sucht in den ersten SCAN_ZEILEN Zeilen eine Kopfzeile mit Kürzel- und Einsatztage-Spalte.
+    Rückgabe: (Zeilenindex, Kürzel-Spalte, Tage-Spalte) oder None.
+    """
+    for i, zeile in enumerate(zeilen[:SCAN_ZEILEN]):
+        koepfe = [_norm(v) if v is not None else "" for v in zeile]
+        k = next((j for j, h in enumerate(koepfe) if h in KUERZEL_KOEPFE), None)
+        t = next((j for j, h in enumerate(koepfe) if TAGE_KOPF in h), None)
+        if k is not None and t is not None:
+            return i, k, t
+    return None
+
+
+def finde_block(zeilen: list, min_zeilen: int = 2):
+    """
+    Heuristik für Zusammenfassungen ohne Kopfzeile: längste Folge von Zeilen mit einem
+    Kürzel (1–3 Großbuchstaben) und einer Zahl in einer der nächsten beiden Spalten.
+    Rückgabe: [(Kürzel, Tage)] oder None.
+    """
+    breite = max((len(z) for z in zeilen), default=0)
+    bester = []
+    for k in range(breite):
+        for t in (k + 1, k + 2):
+            if t >= breite:
+                continue
+            lauf = []
+            for zeile in zeilen:
+                kuerzel = zeile[k] if k < len(zeile) else None
+                tage = _zahl(zeile[t]) if t < len(zeile) else None
+                if _ist_kuerzel(kuerzel) and tage is not None:
+                    lauf.append((kuerzel.strip(), tage))
+                    continue
+                if len(lauf) > len(bester):
+                    bester = lauf
+                lauf = []
+            if len(lauf) > len(bester):
+                bester = lauf
+    return bester if len(bester) >= min_zeilen else None
+
+
+def _als_frame(paare) -> pd.DataFrame:
+    out = pd.DataFrame(paare, columns=["Kürzel", "Einsatztage_SOLL"])
+    out["Kürzel"] = out["Kürzel"].astype(str).str.strip()
+    out["Einsatztage_SOLL"] = pd.to_numeric(out["Einsatztage_SOLL"], errors="coerce").fillna(0.0).astype("float64")
+    out = out[(out["Kürzel"] != "") & (out["Kürzel"].str.lower() != "nan")]
+    return out.groupby("Kürzel", as_index=False)["Einsatztage_SOLL"].sum()
+
+
+def lese_abrechnung_lokal(upload, ext: str = None):
+    """
+    Lokaler Parser: alle Blätter, zuerst Kopfzeile (Kürzel/PL + Einsatztage), sonst
+    Kürzel/Zahl-Block. Rückgabe: (DataFrame oder None, Zeilen des ersten Blatts für den GPT-Fallback).
+    """
+    if ext is None:
+        name = upload if isinstance(upload, (str, os.PathLike)) else upload.name
+        ext = os.path.splitext(str(name))[-1].lower()
+
+    blaetter = list(_blaetter(upload, ext))
+    for _, zeilen in blaetter:
+        kopf = finde_kopfzeile(zeilen)
+        if kopf is None:
+            continue
+        i, k, t = kopf
+        paare = [
+            (z[k], (_zahl(z[t]) if t < len(z) else None) or 0.0)
+            for z in zeilen[i + 1:]
+            if k < len(z) and z[k] is not None and str(z[k]).strip()
+        ]
+        if paare:
+            return _als_frame(paare), None
+    for _, zeilen in blaetter:
+        block = finde_block(zeilen)
+        if block:
+            return _als_frame(block), None
+    return None, (blaetter[0][1] if blaetter else [])
+
+
+def read_abrechnung(upload, ki: bool = False, client=None, limiter=None) -> pd.DataFrame:
+    """
+    Liest Abrechnungsdatei (CSV oder XLSX), sucht Kürzel & Einsatztage_SOLL.
+    Die Kopfzeile wird automatisch erkannt; findet der lokale Parser nichts und ist ki=True,
+    extrahiert GPT den Block aus dem ersten Blatt. upload: Datei-Objekt mit .name oder Pfad.
+    """
+    try:
+        df, rest = lese_abrechnung_lokal(upload)
+    except Exception as e:
+        raise ValueError(f"Datei konnte nicht eingelesen werden: {e}")
+    if df is not None:
+        return df
+    if ki and rest:
+        from utils.gpt import extrahiere_abrechnungsblock
+        df = extrahiere_abrechnungsblock(pd.DataFrame(rest), client=client, limiter=limiter)
+        if not df.empty:
+            return _als_frame(df[["Kürzel", "Einsatztage_SOLL"]].itertuples(index=False, name=None))
+    raise ValueError("Keine Kürzel/Einsatztage-Spalten oder -Blöcke gefunden.")
+
+
+def lese_abrechnungen(pfade, ki: bool = False, engine=None) -> tuple:
+    """
+    Ganzer Ordner/Stapel: lokal parsen, nur Dateien ohne erkannten Block gehen (parallel) an GPT.
+    Rückgabe: ({Dateiname: DataFrame}, {Dateiname: Fehlertext}).
+    """
+    ergebnisse, fehler, fuer_gpt = {}, {}, {}
+    for pfad in pfade:
+        name = os.path.basename(pfad)
+        try:
+            df, rest = lese_abrechnung_lokal(pfad)
+        except Exception as e:
+            fehler[name] = f"Datei konnte nicht eingelesen werden: {e}"
+            continue
+        if df is not None:
+            ergebnisse[name] = df
+        elif ki and rest:
+            fuer_gpt[name] = pd.DataFrame(rest)
+        else:
+            fehler[name] = "Keine Kürzel/Einsatztage-Spalten oder -Blöcke gefunden."
+
+    if fuer_gpt:
+        from utils.gpt import KlassifikationsEngine
+        for name, df in (engine or KlassifikationsEngine()).extrahiere(fuer_gpt).items():
+            if df.empty:
+                fehler[name] = "Auch die KI hat keinen Abrechnungsblock gefunden."
+            else:
+                ergebnisse[name] = _als_frame(df[["Kürzel", "Einsatztage_SOLL"]].itertuples(index=False, name=None))
+    return ergebnisse, fehler
+
+
+# ──────────────────────────────
+# Manuell testen: Ordner mit Abrechnungen lokal einlesen
+# ──────────────────────────────
+if __name__ == "__main__":
+    import sys
+    import time
+
+    ordner = sys.argv[1] if len(sys.argv) > 1 else "."
+    pfade = sorted(
+        os.path.join(ordner, n) for n in os.listdir(ordner)
+        if n.lower().endswith((".xlsx", ".csv")) and not n.startswith("~$")
+    )
+    t = time.perf_counter()
+    ergebnisse, fehler = lese_abrechnungen(pfade, ki="--ki" in sys.argv)
+    for name, df in ergebnisse.items():
+        print(f"{name}: {len(df)} Kürzel, {df['Einsatztage_SOLL'].sum():.2f} Tage")
+    for name, text in fehler.items():
+        print(f"{name}: ❌ {text}")
+    print(f"{len(pfade)} Dateien in {time.perf_counter() - t:.2f}s")
@@ -0,0 +1,356 @@
+# utils/stammdaten.py
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+from utils.ablage import schreibe_atomar
+
+MAPPING_CSV = "mapping.csv"
+KUERZEL_CSV = "kuerzel.csv"
+DB_PFAD = os.path.join("history", "stammdaten.sqlite")
+
+# Tabelle → (Schlüsselspalte, Wertspalte, Standardwert) im DataFrame
+TABELLEN = {
+    "mapping": ("Zweck", "Verrechenbarkeit", "Unbekannt"),
+    "kuerzel": ("Name", "Kürzel", ""),
+}
+_CSV = {"mapping": MAPPING_CSV, "kuerzel": KUERZEL_CSV}
+
+
+# ──────────────────────────────
+# CSV (Import/Export, Kompatibilität)
+# ──────────────────────────────
+def _bereinige(tabelle: str, df: pd.DataFrame) -> pd.DataFrame:
+    """Nur Schlüssel/Wert, getrimmt, ohne leere Schlüssel; doppelte Schlüssel: letzter gewinnt."""
+    schluessel, wert, standard = TABELLEN[tabelle]
+    out = pd.DataFrame({
+        schluessel: df[schluessel] if schluessel in df.columns else pd.Series("", index=df.index),
+        wert: df[wert] if wert in df.columns else pd.Series(standard, index=df.index),
+    })
+    out = out.dropna(subset=[schluessel])
+    out[schluessel] = out[schluessel].astype(str).str.strip()
+    out[wert] = out[wert].fillna(standard).astype(str).str.strip()
+    out = out[out[schluessel] != ""]
+    return out.drop_duplicates(subset=[schluessel], keep="last").reset_index(drop=True)
+
+
+def lade_csv(tabelle: str, pfad) -> pd.DataFrame:
+    """CSV (Pfad oder Dateiobjekt) einlesen und bereinigen; fehlende Datei → leere Tabelle."""
+    schluessel, wert, _ = TABELLEN[tabelle]
+    if isinstance(pfad, str) and not os.path.exists(pfad):
+        return pd.DataFrame(columns=[schluessel, wert])
+    return _bereinige(tabelle, pd.read_csv(pfad, encoding="utf-8-sig"))
+
+
+def lade_mapping_csv(pfad: str = MAPPING_CSV) -> pd.DataFrame:
+    return lade_csv("mapping", pfad)
+
+
+def lade_kuerzel_csv(pfad: str = KUERZEL_CSV) -> pd.DataFrame:
+    return lade_csv("kuerzel", pfad)
+
+
+# ──────────────────────────────
+# SQLite-Store (WAL, Upserts, Änderungshistorie)
+# ──────────────────────────────
+class StammdatenStore:
+    """
+    Mapping und Kürzel in SQLite (WAL-Modus). Schlüssel (Zweck/Name) sind Primärschlüssel,
+    Speichern schreibt nur geänderte Zeilen – als Upsert in einer Transaktion – und
+    protokolliert jede Änderung (alt → neu) in `aenderungen`. Gleichzeitige Sessions
+    überschreiben sich damit nur noch bei derselben Zeile.
+
+    Jede Zeile merkt sich ihre Herkunft (z.B. "app", "csv", "gpt", "lokal", "index"),
+    damit geratene Einträge von bestätigten unterscheidbar bleiben.
+
+    Eine leere Tabelle wird beim ersten Öffnen aus mapping.csv/kuerzel.csv befüllt.
+    """
+
+    def __init__(self, path: str = DB_PFAD, csv_quellen: dict = None):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            for tabelle in TABELLEN:
+                con.execute(
+                    f"""
+                    CREATE TABLE IF NOT EXISTS {tabelle} (
+                        schluessel TEXT PRIMARY KEY,
+                        wert       TEXT NOT NULL,
+                        geaendert  TEXT,
+                        herkunft   TEXT
+                    )
+                    """
+                )
+            con.execute(
+                """
+                CREATE TABLE IF NOT EXISTS aenderungen (
+                    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+                    tabelle    TEXT NOT NULL,
+                    schluessel TEXT NOT NULL,
+                    alt        TEXT,
+                    neu        TEXT,
+                    quelle     TEXT,
+                    zeit       TEXT,
+                    herkunft   TEXT
+                )
+                """
+            )
+            # Datenbanken von vor der Herkunfts-Spalte: Altbestand bleibt ohne Herkunft (gilt als bestätigt)
+            for tabelle in (*TABELLEN, "aenderungen"):
+                spalten = {r[1] for r in con.execute(f"PRAGMA table_info({tabelle})")}
+                if "herkunft" not in spalten:
+                    con.execute(f"ALTER TABLE {tabelle} ADD COLUMN herkunft TEXT")
+            con.execute("CREATE INDEX IF NOT EXISTS aenderungen_schluessel ON aenderungen (tabelle, schluessel)")
+
+        for tabelle, pfad in {**_CSV, **(csv_quellen or {})}.items():
+            if pfad and self.anzahl(tabelle) == 0 and os.path.exists(pfad):
+                self.importiere_csv(tabelle, pfad)
+
+    @contextmanager
+    def _connect(self):
+        con = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        try:
+            con.execute("PRAGMA synchronous=NORMAL")
+            yield con
+        finally:
+            con.close()
+
+    @contextmanager
+    def _transaktion(self):
+        """BEGIN IMMEDIATE: Schreibsperre vor dem Lesen der alten Werte, kein Lost Update."""
+        with self._connect() as con:
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                yield con
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+            con.execute("COMMIT")
+
+    @staticmethod
+    def _aktuelle_werte(con, tabelle: str, schluessel: list) -> dict:
+        werte = {}
+        for start in range(0, len(schluessel), 500):
+            teil = schluessel[start:start + 500]
+            werte.update(con.execute(
+                f"SELECT schluessel, wert FROM {tabelle} WHERE schluessel IN ({','.join('?' * len(teil))})",
+                teil,
+            ).fetchall())
+        return werte
+
+    # ---------- Lesen ----------
+    def tabelle(self, tabelle: str, herkunft: bool = False) -> pd.DataFrame:
+        """Schlüssel/Wert je Zeile; mit herkunft=True zusätzlich die Spalte "Herkunft"."""
+        schluessel, wert, _ = TABELLEN[tabelle]
+        with self._connect() as con:
+            rows = con.execute(f"SELECT schluessel, wert, herkunft FROM {tabelle} ORDER BY rowid").fetchall()
+        df = pd.DataFrame(rows, columns=[schluessel, wert, "Herkunft"], dtype="object")
+        return df if herkunft else df.drop(columns="Herkunft")
+
+    def anzahl(self, tabelle: str) -> int:
+        with self._connect() as con:
+            return con.execute(f"SELECT COUNT(*) FROM {tabelle}").fetchone()[0]
+
+    def stand(self) -> int:
+        """Laufende Nummer der letzten Änderung – ändert sich bei jedem Speichern (auch aus anderen Prozessen)."""
+        with self._connect() as con:
+            return con.execute("SELECT COALESCE(MAX(id), 0) FROM aenderungen").fetchone()[0]
+
+    def historie(self, tabelle: str = None, schluessel: str = None, limit: int = 200) -> pd.DataFrame:
+        """Letzte Änderungen (neueste zuerst), optional für eine Tabelle bzw. einen Schlüssel."""
+        bedingungen, params = [], []
+        if tabelle is not None:
+            bedingungen.append("tabelle = ?")
+            params.append(tabelle)
+        if schluessel is not None:
+            bedingungen.append("schluessel = ?")
+            params.append(schluessel)
+        sql = "SELECT zeit, tabelle, schluessel, alt, neu, quelle, herkunft FROM aenderungen"
+        if bedingungen:
+            sql += " WHERE " + " AND ".join(bedingungen)
+        sql += " ORDER BY id DESC LIMIT ?"
+        with self._connect() as con:
+            rows = con.execute(sql, [*params, limit]).fetchall()
+        return pd.DataFrame(rows, columns=["Zeit", "Tabelle", "Schlüssel", "Alt", "Neu", "Quelle", "Herkunft"])
+
+    # ---------- Schreiben ----------
+    def aendere(self, tabelle: str, upserts: dict = None, loeschungen=(), quelle: str = "app",
+                ueberschreiben: bool = True, herkunft: dict = None) -> int:
+        """
+        Zeilenweise Änderungen: upserts {Schlüssel: Wert}, loeschungen [Schlüssel].
+        Nur Zeilen, deren Wert sich wirklich ändert, werden geschrieben und protokolliert.
+        ueberschreiben=False legt nur fehlende Schlüssel an (bestehende Werte bleiben).
+        herkunft {Schlüssel: Herkunft} je Zeile, sonst gilt `quelle` als Herkunft.
+        Rückgabe: Anzahl geänderter Zeilen.
+        """
+        _, _, standard = TABELLEN[tabelle]
+        upserts = {
+            str(k).strip(): standard if v is None or pd.isna(v) else str(v).strip()
+            for k, v in (upserts or {}).items()
+            if k is not None and not pd.isna(k) and str(k).strip()
+        }
+        loeschungen = [str(k).strip() for k in loeschungen if str(k).strip() not in upserts]
+        if not upserts and not loeschungen:
+            return 0
+
+        herkunft = {str(k).strip(): h for k, h in (herkunft or {}).items()}
+        jetzt = datetime.now().isoformat(timespec="seconds")
+        with self._transaktion() as con:
+            alt = self._aktuelle_werte(con, tabelle, [*upserts, *loeschungen])
+            schreiben = {
+                k: v for k, v in upserts.items()
+                if alt.get(k) != v and (ueberschreiben or k not in alt)
+            }
+            loeschen = [k for k in loeschungen if k in alt]
+            con.executemany(
+                f"INSERT INTO {tabelle} (schluessel, wert, geaendert, herkunft) VALUES (?, ?, ?, ?) "
+                f"ON CONFLICT(schluessel) DO UPDATE SET wert = excluded.wert, geaendert = excluded.geaendert, "
+                f"herkunft = excluded.herkunft",
+                [(k, v, jetzt, herkunft.get(k, quelle)) for k, v in schreiben.items()],
+            )
+            con.executemany(f"DELETE FROM {tabelle} WHERE schluessel = ?", [(k,) for k in loeschen])
+            con.executemany(
+                "INSERT INTO aenderungen (tabelle, schluessel, alt, neu, quelle, zeit, herkunft) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(tabelle, k, alt.get(k), v, quelle, jetzt, herkunft.get(k, quelle)) for k, v in schreiben.items()]
+                + [(tabelle, k, alt[k], None, quelle, jetzt, None) for k in loeschen],
+            )
+        return len(schreiben) + len(loeschen)
+
+    def speichere(self, tabelle: str, df: pd.DataFrame, quelle: str = "app") -> int:
+        """Ganze Tabelle abgleichen – schreibt nur abweichende Zeilen; fehlende Schlüssel bleiben bestehen."""
+        schluessel, wert, _ = TABELLEN[tabelle]
+        out = _bereinige(tabelle, df)
+        return self.aendere(tabelle, dict(zip(out[schluessel], out[wert])), quelle=quelle)
+
+    def importiere_csv(self, tabelle: str, pfad: str) -> int:
+        return self.speichere(tabelle, lade_csv(tabelle, pfad), quelle="csv")
+
+    def exportiere_csv(self, tabelle: str, pfad: str = None):
+        """Tabelle als CSV (UTF-8 mit BOM wie kuerzel.csv); ohne pfad als Bytes."""
+        daten = self.tabelle(tabelle).to_csv(index=False).encode("utf-8-sig")
+        if pfad is None:
+            return daten
+        return schreibe_atomar(pfad, daten)
+
+
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+
+def store(path: str = DB_PFAD) -> StammdatenStore:
+    """Prozessweiter Store je Datenbankdatei (Schema/CSV-Import nur beim ersten Zugriff)."""
+    with _STORES_LOCK:
+        if path not in _STORES:
+            _STORES[path] = StammdatenStore(path)
+        return _STORES[path]
+
+
+# Spaltenname, unter dem st.data_editor den Index neu hinzugefügter Zeilen meldet
+EDITOR_INDEX = "_index"
+
+
+def editor_daten(df: pd.DataFrame, tabelle: str) -> pd.DataFrame:
+    """Tabelle mit dem Schlüssel als Index – so bearbeitet, lassen sich Editor-Zeilen eindeutig zuordnen."""
+    schluessel, _, _ = TABELLEN[tabelle]
+    return df.set_index(schluessel)
+
+
+def editor_aenderungen(tabelle: str, df: pd.DataFrame, editor_state: dict) -> tuple:
+    """
+    Übersetzt den Zustand eines st.data_editor (edited_rows/added_rows/deleted_rows)
+    in (upserts {Schlüssel: Wert}, loeschungen [Schlüssel]).
+    df ist der Stand, den der Editor angezeigt hat (aus editor_daten): Zeilenpositionen
+    werden über dessen Index auf Schlüssel abgebildet. Neue Zeilen bringen ihren
+    Schlüssel im Index mit; ein Schlüssel wird umbenannt, indem man die Zeile löscht
+    und neu anlegt.
+    """
+    _, wert, standard = TABELLEN[tabelle]
+    editor_state = editor_state or {}
+    geloescht = {int(pos) for pos in editor_state.get("deleted_rows", [])}
+    loeschungen = [df.index[pos] for pos in sorted(geloescht)]
+
+    upserts = {}
+    for pos, felder in editor_state.get("edited_rows", {}).items():
+        pos = int(pos)
+        if pos in geloescht or wert not in felder:
+            continue
+        upserts[df.index[pos]] = felder[wert]
+
+    for zeile in editor_state.get("added_rows", []):
+        k = zeile.get(EDITOR_INDEX)
+        if k is not None and str(k).strip():
+            upserts[str(k).strip()] = zeile.get(wert, standard)
+
+    return upserts, [k for k in loeschungen if k is not None and not pd.isna(k)]
+
+
+# ──────────────────────────────
+# Mapping Zweck → Verrechenbarkeit
+# ──────────────────────────────
+def lade_mapping(path: str = DB_PFAD, herkunft: bool = False) -> pd.DataFrame:
+    return store(path).tabelle("mapping", herkunft=herkunft)
+
+
+def _lerne_nach(path: str):
+    # Lokales Modell lernt nur die geänderten Zeilen nach (geratene Zeilen überspringt es anhand der Herkunft)
+    from utils.gpt import lokales_modell
+    lokales_modell(lade_mapping(path, herkunft=True))
+
+
+def aendere_mapping(upserts: dict = None, loeschungen=(), path: str = DB_PFAD, quelle: str = "app",
+                    herkunft: dict = None) -> int:
+    n = store(path).aendere("mapping", upserts, loeschungen, quelle=quelle, herkunft=herkunft)
+    if n:
+        _lerne_nach(path)
+    return n
+
+
+def speichere_mapping(df: pd.DataFrame, path: str = DB_PFAD, quelle: str = "app") -> int:
+    n = store(path).speichere("mapping", df, quelle=quelle)
+    if n:
+        _lerne_nach(path)
+    return n
+
+
+# ──────────────────────────────
+# Mitarbeiter-Kürzel
+# ──────────────────────────────
+def lade_kuerzel(path: str = DB_PFAD) -> pd.DataFrame:
+    return store(path).tabelle("kuerzel")
+
+
+def aendere_kuerzel(upserts: dict = None, loeschungen=(), path: str = DB_PFAD, quelle: str = "app") -> int:
+    return store(path).aendere("kuerzel", upserts, loeschungen, quelle=quelle)
+
+
+def speichere_kuerzel(df: pd.DataFrame, path: str = DB_PFAD, quelle: str = "app") -> int:
+    return store(path).speichere("kuerzel", df, quelle=quelle)
+
+
+def ergaenze_kuerzel(kuerzel_df: pd.DataFrame, namen) -> tuple:
+    """Neue Mitarbeitende mit leerem Kürzel anhängen. Rückgabe: (Tabelle, Liste der neuen Namen)."""
+    aktuelle_namen = set(pd.Series(list(namen), dtype="object").dropna().astype(str).str.strip())
+    bekannte_namen = set(kuerzel_df["Name"].astype(str).str.strip())
+    neu = sorted(aktuelle_namen - bekannte_namen)
+    if not neu:
+        return kuerzel_df, []
+    addon = pd.DataFrame({"Name": neu, "Kürzel": ""})
+    return pd.concat([kuerzel_df, addon], ignore_index=True).drop_duplicates(subset=["Name"]), neu
+
+
+def registriere_mitarbeitende(namen, path: str = DB_PFAD, quelle: str = "upload") -> list:
+    """Neue Namen mit leerem Kürzel anlegen, ohne bestehende Kürzel anzufassen. Rückgabe: neu angelegte Namen."""
+    s = store(path)
+    namen = sorted(set(pd.Series(list(namen), dtype="object").dropna().astype(str).str.strip()) - {""})
+    with s._connect() as con:
+        bekannt = s._aktuelle_werte(con, "kuerzel", namen)
+    neu = [n for n in namen if n not in bekannt]
+    if neu:
+        s.aendere("kuerzel", {n: "" for n in neu}, quelle=quelle, ueberschreiben=False)
+    return neu
@@ -0,0 +1,163 @@
+# utils/telemetrie.py
+import os
+import json
+import time
+import uuid
+import functools
+import statistics
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+
+# Ein Ereignis pro Zeile (JSONL); TELEMETRIE=0 schaltet nur das Schreiben ab, nicht das Messen
+TELEMETRIE_PFAD = os.getenv("TELEMETRIE_PFAD", os.path.join("history", "telemetrie.jsonl"))
+AKTIV = os.getenv("TELEMETRIE", "1") != "0"
+# Ab dieser Größe wird die Datei rotiert (telemetrie.jsonl.1 … .N, älteste fällt weg)
+MAX_BYTES = int(float(os.getenv("TELEMETRIE_MAX_MB", "10")) * 1024 * 1024)
+ANZAHL_ALT = int(os.getenv("TELEMETRIE_ANZAHL_ALT", "3"))
+
+_AKTUELL = contextvars.ContextVar("telemetrie_lauf", default=None)
+_SCHREIB_LOCK = threading.Lock()
+
+
+def _rotiere():
+    """telemetrie.jsonl → .1 → .2 …, sobald MAX_BYTES erreicht sind (0 = nie rotieren)."""
+    if not MAX_BYTES or os.path.getsize(TELEMETRIE_PFAD) < MAX_BYTES:
+        return
+    for i in range(ANZAHL_ALT, 0, -1):
+        quelle = f"{TELEMETRIE_PFAD}.{i - 1}" if i > 1 else TELEMETRIE_PFAD
+        if os.path.exists(quelle):
+            os.replace(quelle, f"{TELEMETRIE_PFAD}.{i}")
+    if os.path.exists(TELEMETRIE_PFAD):
+        os.remove(TELEMETRIE_PFAD)
+
+
+def _schreibe(ereignis: dict):
+    if not AKTIV:
+        return
+    zeile = json.dumps(ereignis, ensure_ascii=False, default=str)
+    try:
+        with _SCHREIB_LOCK:
+            os.makedirs(os.path.dirname(TELEMETRIE_PFAD) or ".", exist_ok=True)
+            if os.path.exists(TELEMETRIE_PFAD):
+                _rotiere()
+            with open(TELEMETRIE_PFAD, "a", encoding="utf-8") as f:
+                f.write(zeile + "\n")
+    except OSError:
+        pass  # Telemetrie darf die eigentliche Arbeit nie abbrechen
+
+
+class Lauf:
+    """Sammelt die Ereignisse eines Durchlaufs (App-Rerun, CLI-Aufruf) für Auswertung und Anzeige."""
+
+    def __init__(self, name: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.start = time.perf_counter()
+        self.dauer_ms = None
+        self.ereignisse = []
+        self._lock = threading.Lock()
+
+    def erfasse(self, ereignis: dict):
+        ereignis = {"zeit": datetime.now().isoformat(timespec="milliseconds"), "lauf": self.id, **ereignis}
+        with self._lock:
+            self.ereignisse.append(ereignis)
+        _schreibe(ereignis)
+
+    def zusammenfassung(self) -> dict:
+        """Stufen (Summe/Anzahl) und GPT-Kennzahlen des Laufs."""
+        with self._lock:
+            ereignisse = list(self.ereignisse)
+        stufen = {}
+        for e in ereignisse:
+            if e["typ"] == "stufe":
+                s = stufen.setdefault(e["name"], {"ms": 0.0, "anzahl": 0})
+                s["ms"] += e["dauer_ms"]
+                s["anzahl"] += 1
+        aufrufe = [e for e in ereignisse if e["typ"] == "gpt"]
+        latenzen = [e["latenz_ms"] for e in aufrufe if e.get("ok")]
+        gpt = {
+            "aufrufe": len(aufrufe),
+            "fehlgeschlagen": sum(1 for e in aufrufe if not e.get("ok")),
+            "retries": sum(e.get("versuche", 1) - 1 for e in aufrufe),
+            "prompt_tokens": sum(e.get("prompt_tokens") or 0 for e in aufrufe),
+            "completion_tokens": sum(e.get("completion_tokens") or 0 for e in aufrufe),
+            "latenz_ms_median": round(statistics.median(latenzen), 1) if latenzen else None,
+        }
+        return {"lauf": self.id, "name": self.name, "gesamt_ms": self.dauer_ms, "stufen": stufen, "gpt": gpt}
+
+
+def aktueller_lauf():
+    return _AKTUELL.get()
+
+
+def beginne_lauf(name: str) -> Lauf:
+    """Startet einen Lauf für den aktuellen Kontext (Thread/Task); Gegenstück: beende_lauf."""
+    lauf = Lauf(name)
+    _AKTUELL.set(lauf)
+    return lauf
+
+
+def beende_lauf(lauf: Lauf) -> dict:
+    """Schließt den Lauf ab; die Zusammenfassung wird nur geschrieben, wenn etwas gemessen wurde."""
+    lauf.dauer_ms = round((time.perf_counter() - lauf.start) * 1000, 2)
+    zusammenfassung = lauf.zusammenfassung()
+    # App-Reruns ohne gemessene Stufe (Klicks, Fortschritts-Fragmente) würden die Datei nur füllen
+    if lauf.ereignisse:
+        _schreibe({"zeit": datetime.now().isoformat(timespec="milliseconds"), "typ": "lauf", **zusammenfassung})
+    if _AKTUELL.get() is lauf:
+        _AKTUELL.set(None)
+    return zusammenfassung
+
+
+@contextmanager
+def lauf(name: str):
+    """with lauf("cli") as l: … – beginne_lauf/beende_lauf als Kontextmanager."""
+    l = beginne_lauf(name)
+    try:
+        yield l
+    finally:
+        beende_lauf(l)
+
+
+def erfasse(ereignis: dict):
+    """Ereignis dem aktuellen Lauf zuordnen. Ohne Lauf (Bibliotheksnutzung, Benchmarks) wird nichts erfasst."""
+    l = _AKTUELL.get()
+    if l is not None:
+        l.erfasse(ereignis)
+
+
+@contextmanager
+def messe(stufe: str, **attribute):
+    """Zeitmessung einer Stufe; `attribute` (z.B. zeilen=…) landen mit im Ereignis."""
+    t = time.perf_counter()
+    fehler = None
+    try:
+        yield attribute
+    except BaseException as e:
+        fehler = type(e).__name__
+        raise
+    finally:
+        ereignis = {"typ": "stufe", "name": stufe, "dauer_ms": round((time.perf_counter() - t) * 1000, 3)}
+        ereignis.update(attribute)
+        if fehler:
+            ereignis["fehler"] = fehler
+        erfasse(ereignis)
+
+
+def gemessen(stufe: str):
+    """Dekorator: jeder Aufruf der Funktion wird als Stufe `stufe` gemessen."""
+    def dekorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with messe(stufe):
+                return fn(*args, **kwargs)
+        return wrapper
+    return dekorator
+
+
+def im_kontext(fn):
+    """fn so verpacken, dass sie in einem Worker-Thread im aktuellen Lauf erfasst wird."""
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.copy().run(fn, *args, **kwargs)
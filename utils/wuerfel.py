@@ -0,0 +1,208 @@
+# utils/wuerfel.py
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+from pyarrow import feather
+
+from utils import telemetrie
+from utils.ablage import tmp_pfad
+from utils.processing import CACHE_DIR, _arrow_tauglich, verrechenbarkeit_spalte
+
+# Erhöhen, wenn sich Dimensionen/Kennzahlen des Würfels ändern
+WUERFEL_SCHEMA = "v1"
+DIMENSIONEN = ["Tag", "Mitarbeiter", "Unterprojekt", "Zweck"]
+KENNZAHLEN = ["Stunden", "Buchungen"]
+ZEITRAEUME = ("Tag", "Woche", "Monat", "Jahr")
+OHNE_DATUM = "ohne Datum"
+OHNE_ZUORDNUNG = "ohne Zuordnung"
+MAX_WUERFEL = 16
+
+
+# ──────────────────────────────
+# Aufbau & Ablage (einmal pro Upload bzw. Partition)
+# ──────────────────────────────
+def _kategorie(serie: pd.Series) -> pd.Series:
+    return serie if isinstance(serie.dtype, pd.CategoricalDtype) else serie.astype("category")
+
+
+@telemetrie.gemessen("wuerfel_aufbau")
+def baue_wuerfel(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Stunden und Anzahl Buchungen je Tag × Mitarbeiter × Unterprojekt × Zweck.
+    Woche/Monat/Jahr werden bei der Abfrage aus dem Tag gebildet, Verrechenbarkeit aus
+    dem aktuellen Mapping – Mapping-Änderungen machen den Würfel also nicht ungültig.
+    """
+    if "Datum" in df.columns:
+        tag = pd.to_datetime(df["Datum"], errors="coerce").dt.normalize()
+    else:
+        tag = pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns]")
+    unterprojekt = df["Unterprojekt"] if "Unterprojekt" in df.columns else pd.Series(None, index=df.index, dtype="object")
+    basis = pd.DataFrame({
+        "Tag": tag,
+        "Mitarbeiter": _kategorie(df["Mitarbeiter"]),
+        "Unterprojekt": _kategorie(unterprojekt),
+        "Zweck": _kategorie(df["Zweck"]),
+        "Stunden": df["Dauer"].astype("float64"),
+    })
+    wuerfel = (
+        basis.groupby(DIMENSIONEN, observed=True, dropna=False, sort=False)["Stunden"]
+        .agg(Stunden="sum", Buchungen="size")
+        .reset_index()
+    )
+    wuerfel["Buchungen"] = wuerfel["Buchungen"].astype("int32")
+    return wuerfel
+
+
+def wuerfel_pfad(h: str, cache_dir: str = CACHE_DIR) -> str:
+    return os.path.join(cache_dir, f"{h}_wuerfel_{WUERFEL_SCHEMA}.arrow")
+
+
+def schreibe_wuerfel(wuerfel: pd.DataFrame, pfad: str) -> str:
+    os.makedirs(os.path.dirname(pfad) or ".", exist_ok=True)
+    tmp = tmp_pfad(pfad)
+    feather.write_feather(_arrow_tauglich(wuerfel), tmp, compression="uncompressed")
+    os.replace(tmp, pfad)
+    return pfad
+
+
+def lese_wuerfel(pfad: str):
+    """Würfel per Memory-Map lesen; fehlt die Datei: None."""
+    if not os.path.exists(pfad):
+        return None
+    return feather.read_table(pfad, memory_map=True).to_pandas()
+
+
+def speichere_upload_wuerfel(df: pd.DataFrame, cache_dir: str = CACHE_DIR):
+    """
+    Legt den Würfel eines Uploads neben dessen Arrow-Cache ab (Schlüssel: Inhalts-Hash aus
+    df.attrs). Erwartet die Rohspalten inkl. Unterprojekt, also vor kompaktiere_zeitdaten.
+    """
+    h = df.attrs.get("datensatz")
+    if not h:
+        return None
+    pfad = wuerfel_pfad(h, cache_dir)
+    if not os.path.exists(pfad):
+        schreibe_wuerfel(baue_wuerfel(df), pfad)
+    return pfad
+
+
+# ──────────────────────────────
+# Abfragen (Filter, Zeitraum, Drill-down)
+# ──────────────────────────────
+def _perioden_label(tage: pd.DatetimeIndex, zeitraum: str) -> pd.Index:
+    if zeitraum == "Tag":
+        return tage.strftime("%Y-%m-%d")
+    if zeitraum == "Woche":
+        iso = tage.isocalendar()
+        return pd.Index([f"{j}-KW{w:02d}" for j, w in zip(iso["year"], iso["week"])])
+    if zeitraum == "Monat":
+        return tage.strftime("%Y-%m")
+    if zeitraum == "Jahr":
+        return tage.strftime("%Y")
+    raise ValueError(f"Unbekannter Zeitraum: {zeitraum} (erlaubt: {', '.join(ZEITRAEUME)})")
+
+
+class ZeitWuerfel:
+    """
+    Abfragen auf dem vorberechneten Würfel statt auf den Rohbuchungen: Filter nach Zeitraum,
+    Mitarbeiter, Zweck, Unterprojekt und Verrechenbarkeit, Gruppierung nach beliebigen
+    Dimensionen inkl. "Periode" (Tag/Woche/Monat/Jahr).
+    """
+
+    def __init__(self, daten: pd.DataFrame):
+        self.daten = daten.reset_index(drop=True)
+        # Tage einmal faktorisieren – Periodenlabels entstehen nur pro eindeutigem Tag
+        self._tag_codes, tage = pd.factorize(self.daten["Tag"])
+        self._tage = pd.DatetimeIndex(tage)
+        self._perioden = {}
+
+    @property
+    def zeitspanne(self) -> tuple:
+        """(erster Tag, letzter Tag) oder (None, None) ohne Datumsangaben."""
+        if not len(self._tage):
+            return None, None
+        return self._tage.min(), self._tage.max()
+
+    def werte(self, dimension: str) -> list:
+        """Vorkommende Werte einer Dimension (für Filter-Auswahlen)."""
+        return sorted(self.daten[dimension].dropna().astype(str).unique())
+
+    def _periode(self, zeitraum: str) -> pd.Categorical:
+        if zeitraum not in self._perioden:
+            labels = pd.Index(list(_perioden_label(self._tage, zeitraum)) + [OHNE_DATUM], dtype="object")
+            codes = self._tag_codes.copy()
+            codes[codes == -1] = len(labels) - 1
+            kategorien = pd.Index(sorted(set(labels) - {OHNE_DATUM}) + [OHNE_DATUM], dtype="object")
+            self._perioden[zeitraum] = pd.Categorical.from_codes(kategorien.get_indexer(labels)[codes], kategorien)
+        return self._perioden[zeitraum]
+
+    @telemetrie.gemessen("wuerfel_abfrage")
+    def abfrage(self, mapping_df: pd.DataFrame = None, zeitraum: str = "Monat", nach=("Periode",), von=None,
+                bis=None, mitarbeiter=None, zwecke=None, unterprojekte=None, verrechenbarkeit=None) -> pd.DataFrame:
+        """
+        Summiert Stunden/Buchungen nach den Dimensionen in `nach` ("Periode", "Mitarbeiter",
+        "Zweck", "Unterprojekt", "Verrechenbarkeit"). Filterlisten = None bedeutet "alle".
+        Rückgabe: DataFrame [*nach, Stunden, Buchungen], nach `nach` sortiert.
+        """
+        nach = list(nach)
+        maske = pd.Series(True, index=self.daten.index)
+        if von is not None:
+            maske &= self.daten["Tag"] >= pd.Timestamp(von)
+        if bis is not None:
+            maske &= self.daten["Tag"] <= pd.Timestamp(bis)
+        for spalte, auswahl in (("Mitarbeiter", mitarbeiter), ("Zweck", zwecke), ("Unterprojekt", unterprojekte)):
+            if auswahl is not None:
+                maske &= self.daten[spalte].astype("object").isin(list(auswahl))
+
+        teil = self.daten.loc[maske, [d for d in nach if d in DIMENSIONEN] + KENNZAHLEN]
+        if "Periode" in nach:
+            teil = teil.assign(Periode=self._periode(zeitraum)[maske.to_numpy()])
+        if "Verrechenbarkeit" in nach or verrechenbarkeit is not None:
+            zweck = self.daten.loc[maske, "Zweck"]
+            label = verrechenbarkeit_spalte(zweck, mapping_df if mapping_df is not None else pd.DataFrame(
+                columns=["Zweck", "Verrechenbarkeit"]))
+            label = label.cat.add_categories([OHNE_ZUORDNUNG]).fillna(OHNE_ZUORDNUNG)
+            teil = teil.assign(Verrechenbarkeit=label)
+            if verrechenbarkeit is not None:
+                teil = teil[teil["Verrechenbarkeit"].astype("object").isin(list(verrechenbarkeit))]
+
+        if not nach:
+            return pd.DataFrame({k: [teil[k].sum()] for k in KENNZAHLEN})
+        return teil.groupby(nach, observed=True, dropna=False)[KENNZAHLEN].sum().reset_index()
+
+
+_WUERFEL = OrderedDict()
+_WUERFEL_LOCK = threading.Lock()
+
+
+def wuerfel_fuer(schluessel: str, laden) -> ZeitWuerfel:
+    """Prozessweiter LRU-Cache: ein ZeitWuerfel pro Schlüssel; laden() liefert die Würfeldaten."""
+    with _WUERFEL_LOCK:
+        if schluessel in _WUERFEL:
+            _WUERFEL.move_to_end(schluessel)
+            return _WUERFEL[schluessel]
+
+    wuerfel = ZeitWuerfel(laden())
+    with _WUERFEL_LOCK:
+        _WUERFEL[schluessel] = wuerfel
+        while len(_WUERFEL) > MAX_WUERFEL:
+            _WUERFEL.popitem(last=False)
+    return wuerfel
+
+
+def upload_wuerfel(df: pd.DataFrame, cache_dir: str = CACHE_DIR) -> ZeitWuerfel:
+    """
+    Würfel zum Session-DataFrame eines Uploads: aus history/cache, sonst (ältere Uploads)
+    aus den vorhandenen Spalten gebaut – dann ohne Unterprojekt.
+    """
+    from utils.aggregation import datensatz_schluessel
+
+    h = datensatz_schluessel(df)
+
+    def laden():
+        wuerfel = lese_wuerfel(wuerfel_pfad(h, cache_dir))
+        return wuerfel if wuerfel is not None else baue_wuerfel(df)
+
+    return wuerfel_fuer(h, laden)
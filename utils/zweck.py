@@ -0,0 +1,178 @@
+# utils/zweck.py
+import re
+import difflib
+import unicodedata
+from collections import defaultdict
+
+import pandas as pd
+
+KATEGORIEN = ("Intern", "Extern")
+
+_UMLAUTE = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue", "ß": "ss"})
+_KLAMMER_TAG = re.compile(r"\[[^\]\}]*[\]\}]|\[\W*$")   # "[+]", "[+}", offenes "[+"
+_NUMMERIERUNG = re.compile(r"^[\W\d_]+")                  # ".0 ", "+02_", "& "
+_NICHT_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+# ──────────────────────────────
+# Kanonisierung
+# ──────────────────────────────
+def kanonisiere_zweck(text) -> str:
+    """
+    Bringt Zweck-Varianten auf einen gemeinsamen Schlüssel:
+    ". Akquise", ".0 Akquise" → "akquise", "+02_AUFTAKTPHASE [+]" → "auftaktphase".
+    Entfernt Klammer-Tags, führende Nummerierung, Satzzeichen; Umlaute werden transliteriert.
+    """
+    if text is None or (isinstance(text, float) and pd.isna(text)):
+        return ""
+    s = unicodedata.normalize("NFKC", str(text)).casefold().translate(_UMLAUTE)
+    s = _KLAMMER_TAG.sub(" ", s)
+    s = _NUMMERIERUNG.sub("", s)
+    s = _NICHT_ALNUM.sub(" ", s)
+    return s.strip()
+
+
+def _kanonisch_je_wert(zwecke: pd.Series) -> pd.Series:
+    """kanonisiere_zweck nur einmal pro eindeutigem Wert."""
+    eindeutig = pd.unique(zwecke.dropna())
+    lookup = {z: kanonisiere_zweck(z) for z in eindeutig}
+    return zwecke.map(lookup)
+
+
+def kanonische_zuordnung(mapping_df: pd.DataFrame) -> dict:
+    """
+    {kanonischer Zweck: Kategorie} aus dem Mapping. Widersprechen sich Varianten
+    (eine Intern, eine Extern), bekommt der Schlüssel keine Kategorie.
+    """
+    if mapping_df is None or mapping_df.empty:
+        return {}
+    gueltig = mapping_df[mapping_df["Verrechenbarkeit"].isin(KATEGORIEN)]
+    schluessel = _kanonisch_je_wert(gueltig["Zweck"].astype(str))
+    kategorien = gueltig["Verrechenbarkeit"].groupby(schluessel.values).unique()
+    return {k: v[0] for k, v in kategorien.items() if k and len(v) == 1}
+
+
+def verrechenbarkeit_fuer(zwecke: pd.Series, mapping_df: pd.DataFrame) -> pd.Series:
+    """
+    Ordnet jedem Zweck die Verrechenbarkeit zu: zuerst exakter Treffer im Mapping,
+    sonst über den kanonischen Schlüssel (z.B. ".1 Akquise" → Eintrag "Akquise").
+    """
+    if mapping_df is None or mapping_df.empty:
+        return pd.Series(pd.NA, index=zwecke.index, dtype="object")
+    exakt = mapping_df.drop_duplicates(subset=["Zweck"]).set_index("Zweck")["Verrechenbarkeit"]
+    kanonisch = kanonische_zuordnung(mapping_df)
+
+    lookup = {}
+    for z in pd.unique(zwecke.dropna()):
+        if z in exakt.index:
+            lookup[z] = exakt[z]
+        else:
+            lookup[z] = kanonisch.get(kanonisiere_zweck(z), pd.NA)
+    return zwecke.map(lookup).astype("object")
+
+
+def verdichte_mapping(mapping_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Fasst Schreibvarianten zusammen, wenn alle Varianten eines kanonischen Schlüssels
+    dieselbe Kategorie haben. Gruppen mit widersprüchlichen Kategorien bleiben vollständig
+    erhalten – dort kennt kanonische_zuordnung keine Kategorie, nur die exakten Einträge.
+    """
+    if mapping_df.empty:
+        return mapping_df.copy()
+    out = mapping_df.copy()
+    out["_key"] = _kanonisch_je_wert(out["Zweck"].astype(str))
+    einheitlich = out["Verrechenbarkeit"].fillna("").groupby(out["_key"]).transform("nunique") == 1
+    # Kürzeste Schreibweise als Repräsentant behalten
+    out["_len"] = out["Zweck"].astype(str).str.len()
+    zusammengefasst = out[einheitlich].sort_values("_len", kind="stable").drop_duplicates(subset=["_key"], keep="first")
+    out = pd.concat([zusammengefasst, out[~einheitlich]])
+    return out.drop(columns=["_key", "_len"]).sort_index()
+
+
+# ──────────────────────────────
+# Unscharfe Suche (Trigramm-Index)
+# ──────────────────────────────
+def _ngramme(s: str, n: int = 3) -> set:
+    s = f"  {s} "
+    return {s[i:i + n] for i in range(len(s) - n + 1)}
+
+
+class ZweckIndex:
+    """
+    In-Memory-Index über die bekannten Zwecke. Findet zu neuen Schreibvarianten den
+    ähnlichsten klassifizierten Eintrag – ohne GPT. Kandidaten kommen über ein
+    Trigramm-Inverted-Index, bewertet wird mit Dice-Koeffizient und difflib.
+    """
+
+    def __init__(self, mapping_df: pd.DataFrame, schwelle: float = 0.85, n: int = 3):
+        self.schwelle = schwelle
+        self.n = n
+        self.kategorie = kanonische_zuordnung(mapping_df)
+        self.schluessel = list(self.kategorie)
+        self.grams = [_ngramme(k, n) for k in self.schluessel]
+        self.invertiert = defaultdict(list)
+        for i, grams in enumerate(self.grams):
+            for g in grams:
+                self.invertiert[g].append(i)
+
+    def __len__(self):
+        return len(self.schluessel)
+
+    def nachschlagen(self, zweck):
+        """
+        Rückgabe: (Kategorie, bekannter kanonischer Zweck, Score) oder None.
+        Widersprechen sich die besten Treffer in der Kategorie, wird nichts aufgelöst.
+        """
+        key = kanonisiere_zweck(zweck)
+        if not key:
+            return None
+        if key in self.kategorie:
+            return self.kategorie[key], key, 1.0
+
+        grams = _ngramme(key, self.n)
+        gemeinsam = defaultdict(int)
+        for g in grams:
+            for i in self.invertiert.get(g, ()):
+                gemeinsam[i] += 1
+
+        treffer = []
+        for i, anzahl in gemeinsam.items():
+            dice = 2 * anzahl / (len(grams) + len(self.grams[i]))
+            if dice < self.schwelle - 0.15:
+                continue
+            ratio = difflib.SequenceMatcher(None, key, self.schluessel[i]).ratio()
+            score = (dice + ratio) / 2
+            if score >= self.schwelle:
+                treffer.append((score, self.schluessel[i]))
+        if not treffer:
+            return None
+
+        treffer.sort(reverse=True)
+        kategorien = {self.kategorie[k] for _, k in treffer}
+        if len(kategorien) > 1:
+            return None
+        score, bester = treffer[0]
+        return self.kategorie[bester], bester, round(score, 3)
+
+    def loese_auf(self, zwecke) -> dict:
+        """{Zweck: (Kategorie, bekannter Zweck, Score)} für alle lokal auflösbaren Zwecke."""
+        ergebnis = {}
+        for z in zwecke:
+            t = self.nachschlagen(z)
+            if t is not None:
+                ergebnis[z] = t
+        return ergebnis
+
+
+# ──────────────────────────────
+# Manuell testen
+# ──────────────────────────────
+if __name__ == "__main__":
+    import sys
+    mapping = pd.read_csv(sys.argv[1] if len(sys.argv) > 1 else "mapping.csv")
+    verdichtet = verdichte_mapping(mapping)
+    print(f"Mapping: {len(mapping)} Zeilen, verdichtet {len(verdichtet)}, "
+          f"kanonische Schlüssel {len(kanonische_zuordnung(mapping))}")
+    index = ZweckIndex(mapping)
+    for probe in ["..2 Akquise", "+03_AUDITPHASE [+]", "Mieterausbauverpflichtung", "Neuer Zweck XYZ"]:
+        print(probe, "→", index.nachschlagen(probe))